@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+asof_join.py
+
+As-of join of underlying OHLCV bars (fetch_nse_data / bar_cache) onto option
+snapshot timestamps.
+
+Every snapshot gets the latest bar that had *closed* by the snapshot time
+(bar start + interval <= snapshot time), so a backtest never sees a bar's
+close before it happened. Bars from Yahoo are naive UTC while snapshot names
+carry local (IST) time; both are aligned before the join. The join is one
+np.searchsorted over the sorted bar close times, so millions of snapshots cost
+a single vectorised pass with no per-row Python lookups.
+
+Columns added: Spot (bar close), Ret (bar-to-bar close return), Volume, BarTime.
+
+Usage:
+    python asof_join.py --snapshots ./snapshots --bars bar_cache/BANKNIFTY_15m.parquet
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+
+UNDERLYING_COLUMNS = ("Spot", "Ret", "Volume")
+
+
+def read_bars(path):
+    """Bar file written by bar_cache / fetch_nse_data (Parquet or CSV)"""
+    if str(path).endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=["Datetime"])
+
+
+def bar_close_times(bars, interval, bars_tz, local_tz):
+    start = pd.to_datetime(bars["Datetime"])
+    if start.dt.tz is None:
+        start = start.dt.tz_localize(bars_tz)
+    start = start.dt.tz_convert(local_tz).dt.tz_localize(None)
+    if interval is None:
+        steps = start.diff().dropna()
+        interval = steps[steps > pd.Timedelta(0)].median() if len(steps) else pd.Timedelta(0)
+    return (start + pd.Timedelta(interval)).to_numpy(dtype="datetime64[ns]")
+
+
+def join_underlying(times, bars, interval=None, bars_tz="UTC", local_tz="Asia/Kolkata", tolerance=None):
+    """
+    Underlying fields for each snapshot time.
+    - times: sorted snapshot times (naive local time, datetime64 array)
+    - bars: DataFrame [Datetime, Open, High, Low, Close, Volume] (Datetime = bar start)
+    - interval: bar length (e.g. "15min"); inferred from the bars when None
+    - tolerance: drop matches whose bar closed more than this long before the snapshot
+    Returns DataFrame aligned with `times`: Spot, Ret, Volume, BarTime (NaN/NaT if no bar yet).
+    """
+    times = np.asarray(times, dtype="datetime64[ns]")
+    bars = bars.dropna(subset=["Close"]).sort_values("Datetime").reset_index(drop=True)
+    close_t = bar_close_times(bars, interval, bars_tz, local_tz)
+    close = bars["Close"].to_numpy(dtype=float)
+    ret = np.concatenate([[np.nan], close[1:] / close[:-1] - 1.0]) if len(close) else close
+    volume = bars["Volume"].to_numpy(dtype=float)
+
+    idx = np.searchsorted(close_t, times, side="right") - 1
+    ok = idx >= 0
+    if tolerance is not None and len(close_t):
+        ok &= (times - close_t[np.maximum(idx, 0)]) <= np.timedelta64(pd.Timedelta(tolerance))
+    take = np.maximum(idx, 0)
+
+    def pick(arr):
+        return np.where(ok, arr[take], np.nan) if len(arr) else np.full(len(times), np.nan)
+
+    return pd.DataFrame({
+        "Spot": pick(close),
+        "Ret": pick(ret),
+        "Volume": pick(volume),
+        "BarTime": np.where(ok, close_t[take] if len(close_t) else times, np.datetime64("NaT")),
+    })
+
+
+def attach_underlying(df, bars, time_col="Time", **kwargs):
+    """Return `df` (sorted by time_col) with Spot/Ret/Volume/BarTime columns joined as of each row's time"""
+    df = df.sort_values(time_col, kind="stable").reset_index(drop=True)
+    joined = join_underlying(df[time_col].to_numpy(), bars, **kwargs)
+    for col in joined.columns:
+        df[col] = joined[col].to_numpy()
+    return df
+
+
+if __name__ == "__main__":
+    from chain_frame import ChainHistory
+
+    ap = argparse.ArgumentParser(description="Join underlying bars onto snapshot times")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--bars", required=True, help="bar file (bar_cache Parquet or CSV)")
+    ap.add_argument("--interval", default=None, help='bar length, e.g. "15min" (default: inferred)')
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    hist = ChainHistory.from_folder(args.snapshots)
+    joined = join_underlying(hist.times, read_bars(args.bars), interval=args.interval)
+    joined.insert(0, "Time", hist.times)
+    joined.insert(1, "file", hist.names)
+    print(joined.tail())
+    if args.out:
+        joined.to_csv(args.out, index=False)
+        print("Saved:", args.out)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+backtest_checkpoint.py
+
+Checkpoint / resume support for engine3.backtest on a growing snapshot history.
+
+A trade entered at snapshot i looks ahead up to `maxtrades` snapshots, so the
+engine's state is final only up to index n-1-maxtrades of the history it saw.
+Each run therefore commits the state *after that index* (balance,
+trades_today, day_start_balance, day_stopped, the day, the last trade id, the
+committed trades) and the trades entered later stay provisional: the next run
+re-simulates them with the new snapshots, starting from the committed state. Only snapshots from
+`context` entries before the commit point onwards are loaded, so signal
+lookbacks have history and the cost of a daily run tracks the new data. The
+committing run widens `context` to the signal's lookback (signals.history;
+the whole history when it is unknown) and records that lookback; a resume
+under a different lookback, or with fewer snapshots before the commit point
+than recorded, falls back to a full run.
+
+The checkpoint is valid only while everything it consumed is unchanged:
+- params hash: backtest parameters, engine sources (run_registry.engine_fingerprint)
+  and the underlying bars that had closed by the boundary snapshot,
+- manifest hash: name/size/mtime of every loose snapshot up to the boundary
+  (last snapshot of the committing run), of the archive indexes and journals
+  of earlier days, and the name/CRC of the boundary day's journal records up
+  to the boundary.
+Any mismatch (edited/added/compacted earlier data, other parameters) falls
+back to a full run, which writes a fresh checkpoint.
+
+Layout: <dir>/state.json (the commit point, replaced atomically) and
+<dir>/trades.<gen>.parquet|csv.gz referenced from it.
+
+Usage:
+    python engine3.py --mode backtest --snapshots ./snapshots --checkpoint ./bt_ckpt
+    python backtest_checkpoint.py --checkpoint ./bt_ckpt        # show state
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import datetime
+import pandas as pd
+
+from chain_frame import time_key
+from chain_greeks import list_snapshots
+from chain_export import HAVE_PARQUET
+from snapshot_retention import ARCHIVE_DIR
+from snapshot_journal import journal_manifest
+from run_registry import engine_fingerprint
+
+CHECKPOINT_VERSION = 2
+STATE_FIELDS = ("balance", "trades_today", "last_date", "day_start_balance", "day_stopped", "tid")
+
+
+# ---------- Fingerprints ----------
+def manifest_hash(folder, upto, symbol=None):
+    """
+    Hash of name/size/mtime of loose snapshots, archive indexes and earlier
+    days' journals, plus the name/CRC of the boundary day's journal records,
+    up to snapshot name `upto` (records appended after the boundary do not
+    change it)
+    """
+    key = time_key(upto)
+    items = []
+    for p in list_snapshots(folder, symbol):
+        if time_key(p) <= key:
+            st = os.stat(p)
+            items.append([os.path.basename(p), st.st_size, st.st_mtime_ns])
+    arch = os.path.join(folder, ARCHIVE_DIR)
+    if os.path.isdir(arch):
+        for n in sorted(os.listdir(arch)):
+            if n.endswith(".idx.json") and n[:-len(".idx.json")].rsplit("_", 1)[1] <= key[:8]:
+                if symbol and not n.startswith(symbol + "_"):
+                    continue
+                st = os.stat(os.path.join(arch, n))
+                items.append([n, st.st_size, st.st_mtime_ns])
+    items += journal_manifest(folder, key, symbol)
+    return hashlib.sha1(json.dumps(sorted(items)).encode()).hexdigest()
+
+
+def params_hash(params, bars=None, upto_time=None):
+    """Hash of backtest parameters, engine code and the bars closed by `upto_time` (naive local)"""
+    h = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(engine_fingerprint().encode())
+    if bars is not None:
+        from asof_join import bar_close_times
+        bars = bars.dropna(subset=["Close"]).sort_values("Datetime").reset_index(drop=True)
+        closed = bar_close_times(bars, None, "UTC", "Asia/Kolkata") <= pd.Timestamp(upto_time).to_datetime64()
+        h.update(pd.util.hash_pandas_object(bars[closed], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _snapshot_time(name):
+    return datetime.datetime.strptime(time_key(name)[:15], "%Y%m%d_%H%M%S")
+
+
+# ---------- Store ----------
+def load(ckpt_dir):
+    """(state dict, committed trades DataFrame) or (None, None)"""
+    path = os.path.join(ckpt_dir, "state.json")
+    if not os.path.exists(path):
+        return None, None
+    with open(path) as fh:
+        state = json.load(fh)
+    if state.get("version") != CHECKPOINT_VERSION:
+        return None, None
+    tpath = os.path.join(ckpt_dir, state["trades"]) if state.get("trades") else None
+    if tpath is None:
+        trades = pd.DataFrame()
+    elif tpath.endswith(".parquet"):
+        trades = pd.read_parquet(tpath)
+    else:
+        trades = pd.read_csv(tpath, float_precision="round_trip")
+        trades["stop_flag"] = trades["stop_flag"].fillna("")
+    return state, trades
+
+
+def save(ckpt_dir, state, trades):
+    """Write trades under a new generation, then commit by replacing state.json"""
+    os.makedirs(ckpt_dir, exist_ok=True)
+    old, _ = load(ckpt_dir)
+    gen = (old or {}).get("generation", 0) + 1
+    state = dict(state, version=CHECKPOINT_VERSION, generation=gen, trades=None)
+    if len(trades):
+        name = f"trades.{gen}.parquet" if HAVE_PARQUET else f"trades.{gen}.csv.gz"
+        if HAVE_PARQUET:
+            trades.to_parquet(os.path.join(ckpt_dir, name), index=False)
+        else:
+            trades.to_csv(os.path.join(ckpt_dir, name), index=False)
+        state["trades"] = name
+    tmp = os.path.join(ckpt_dir, ".state.tmp.json")
+    with open(tmp, "w") as fh:
+        json.dump(state, fh, indent=1)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, os.path.join(ckpt_dir, "state.json"))
+    for n in os.listdir(ckpt_dir):
+        if n.startswith("trades.") and n != state["trades"]:
+            os.remove(os.path.join(ckpt_dir, n))
+
+
+# ---------- Resume ----------
+def resume_state(ckpt_dir, folder, params, bars=None, lookback=None):
+    """
+    Validated checkpoint (state, trades) for this folder/params, or (None, None)
+    if absent/stale
+    - lookback: the signal's required history (signals.history); must match
+      the one the checkpoint was committed with
+    """
+    state, trades = load(ckpt_dir)
+    if state is None:
+        return None, None
+    if state.get("lookback", -1) != lookback:
+        print("Checkpoint context was sized for another signal lookback; running full backtest")
+        return None, None
+    if state["params_hash"] != params_hash(params, bars, _snapshot_time(state["boundary"])):
+        print("Checkpoint parameters/inputs changed; running full backtest")
+        return None, None
+    if state["manifest_hash"] != manifest_hash(folder, state["boundary"]):
+        print("Snapshots up to the checkpoint changed; running full backtest")
+        return None, None
+    return state, trades
+
+
+def make_state(files, commit_idx, context, vars_, params, folder, bars=None, lookback=None):
+    """
+    State dict for committing after files[commit_idx]; vars_ holds STATE_FIELDS
+    - context: snapshots up to and including the commit point to reload on
+      resume (already widened to cover `lookback`)
+    """
+    boundary = files[-1]
+    state = {k: vars_[k] for k in STATE_FIELDS}
+    state["last_date"] = state["last_date"].isoformat() if state["last_date"] else None
+    state.update({
+        "committed": files[commit_idx],
+        "boundary": boundary,
+        "context_from": files[max(0, commit_idx + 1 - context)],
+        "context": min(context, commit_idx + 1),
+        "lookback": lookback,
+        "params_hash": params_hash(params, bars, _snapshot_time(boundary)),
+        "manifest_hash": manifest_hash(folder, boundary),
+    })
+    return state
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Inspect a backtest checkpoint")
+    ap.add_argument("--checkpoint", required=True)
+    args = ap.parse_args()
+    state, trades = load(args.checkpoint)
+    if state is None:
+        print("No checkpoint in", args.checkpoint)
+    else:
+        print(json.dumps({k: v for k, v in state.items() if not k.endswith("hash")}, indent=1))
+        print(f"{len(trades)} committed trades")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+bar_cache.py
+
+Incremental local cache for fetch_nse_data.get_index_data history.
+
+Bars are stored per (symbol, interval) as one columnar file under CACHE_DIR
+(Parquet when pyarrow/fastparquet is installed, gzip CSV otherwise). A refresh
+asks Yahoo only for bars from the last cached timestamp onwards (the last bar
+is re-fetched because it may have been partial), merges, de-duplicates on
+Datetime and rewrites the file atomically. Range queries are served from disk,
+so warm runs need no network.
+
+Usage:
+    python bar_cache.py --symbol BANKNIFTY --interval 15m --period 6mo
+    python bar_cache.py --symbol BANKNIFTY --interval 15m --start 2025-09-01 --offline
+"""
+
+import os
+import argparse
+import pandas as pd
+
+from fetch_nse_data import get_index_data
+
+CACHE_DIR = "./bar_cache"
+BAR_COLUMNS = ["Datetime", "Open", "High", "Low", "Close", "Volume"]
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PARQUET = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        HAVE_PARQUET = True
+    except ImportError:
+        HAVE_PARQUET = False
+
+
+def cache_path(symbol, interval, cache_dir=CACHE_DIR):
+    ext = "parquet" if HAVE_PARQUET else "csv.gz"
+    return os.path.join(cache_dir, f"{symbol}_{interval}.{ext}")
+
+
+def load_cached(symbol, interval, cache_dir=CACHE_DIR, start=None, end=None):
+    """Cached bars for [start, end] (inclusive, naive UTC); empty frame if nothing cached"""
+    path = cache_path(symbol, interval, cache_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    if HAVE_PARQUET:
+        filters = []
+        if start is not None:
+            filters.append(("Datetime", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("Datetime", "<=", pd.Timestamp(end)))
+        return pd.read_parquet(path, filters=filters or None).reset_index(drop=True)
+    df = pd.read_csv(path, parse_dates=["Datetime"])
+    if start is not None:
+        df = df[df["Datetime"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["Datetime"] <= pd.Timestamp(end)]
+    return df.reset_index(drop=True)
+
+
+def _write(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    if HAVE_PARQUET:
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False, compression="gzip")
+    os.replace(tmp, path)
+
+
+def refresh(symbol="NIFTY", interval="15m", period="6mo", cache_dir=CACHE_DIR):
+    """
+    Bring the cache up to date and return the number of new/updated bars.
+    An empty cache is seeded with a full `period` download.
+    """
+    path = cache_path(symbol, interval, cache_dir)
+    cached = load_cached(symbol, interval, cache_dir)
+    if cached.empty:
+        fresh = get_index_data(symbol=symbol, period=period, interval=interval)
+    else:
+        fresh = get_index_data(symbol=symbol, interval=interval, start=cached["Datetime"].max())
+    if fresh.empty:
+        return 0
+    fresh = fresh.dropna(subset=["Close"])
+    merged = (pd.concat([cached, fresh], ignore_index=True)
+              .drop_duplicates(subset="Datetime", keep="last")
+              .sort_values("Datetime")
+              .reset_index(drop=True))
+    merged["Datetime"] = pd.to_datetime(merged["Datetime"])
+    _write(merged[BAR_COLUMNS], path)
+    return len(fresh)
+
+
+def get_bars(symbol="NIFTY", interval="15m", period="6mo", start=None, end=None,
+             cache_dir=CACHE_DIR, offline=False):
+    """
+    Bars for symbol/interval from the local cache, refreshing it first unless
+    `offline`. Without start/end the whole cached history is returned.
+    """
+    if not offline:
+        refresh(symbol, interval, period, cache_dir)
+    return load_cached(symbol, interval, cache_dir, start, end)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Incremental local cache of index OHLCV bars")
+    ap.add_argument("--symbol", default="BANKNIFTY")
+    ap.add_argument("--interval", default="15m")
+    ap.add_argument("--period", default="6mo", help="history to seed an empty cache with")
+    ap.add_argument("--start", default=None)
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--cache", default=CACHE_DIR)
+    ap.add_argument("--offline", action="store_true", help="serve from disk only")
+    args = ap.parse_args()
+
+    if not args.offline:
+        n = refresh(args.symbol, args.interval, args.period, args.cache)
+        print(f"{n} bar(s) fetched into {cache_path(args.symbol, args.interval, args.cache)}")
+    bars = load_cached(args.symbol, args.interval, args.cache, args.start, args.end)
+    print(bars.tail())
+    print(f"{len(bars)} bar(s) in range")
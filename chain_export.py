@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+chain_export.py
+
+Fast export path for option-chain tables.
+
+Features:
+- `export_tables()` stores each table ("sheet") as CSV and/or Parquet under a
+  stable name and rewrites a sheet only when its content hash changed.
+- `write_workbook()` streams sheets into an .xlsx row by row with a
+  constant-memory writer (xlsxwriter, else openpyxl write-only), atomically.
+- `build_excel()` generates the workbook on demand from the stored tables, so
+  refresh loops do not have to produce Excel every cycle.
+
+Parquet needs pyarrow (or fastparquet); without it only CSV is available.
+
+Usage (Excel on demand from stored tables):
+    python chain_export.py --folder ./ --stem nifty_option_chain --out nifty_option_chain.xlsx
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:   # fall back to openpyxl's write-only workbook
+    xlsxwriter = None
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PARQUET = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        HAVE_PARQUET = True
+    except ImportError:
+        HAVE_PARQUET = False
+
+FORMATS = ("csv", "parquet")
+
+
+def _tmp_path(path):
+    folder, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(folder, f".{stem}.tmp{ext}")
+
+
+def frame_hash(df):
+    """Content hash of a DataFrame (values, index and column names)"""
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(json.dumps([str(c) for c in df.columns]).encode())
+    return h.hexdigest()
+
+
+def _hash_file(folder, stem):
+    return os.path.join(folder, f"{stem}.hashes.json")
+
+
+def _sheet_path(folder, stem, sheet, fmt):
+    return os.path.join(folder, f"{stem}_{sheet}.{fmt}")
+
+
+def export_tables(tables, folder="./", stem="nifty_option_chain", formats=("csv",)):
+    """
+    Store `tables` ({sheet_name: DataFrame}) as `{stem}_{sheet}.{fmt}` files.
+    A sheet is rewritten only if its content hash differs from the last export
+    (or a file is missing). Index is stored as a regular column.
+    Returns the list of sheet names that were written.
+    """
+    formats = [f for f in formats if f in FORMATS]
+    if "parquet" in formats and not HAVE_PARQUET:
+        raise ImportError("Parquet export needs pyarrow or fastparquet installed")
+    os.makedirs(folder, exist_ok=True)
+    hash_path = _hash_file(folder, stem)
+    try:
+        with open(hash_path) as fh:
+            hashes = json.load(fh)
+    except (OSError, ValueError):
+        hashes = {}
+
+    written = []
+    for sheet, df in tables.items():
+        df = _flat(df)
+        digest = frame_hash(df)
+        paths = [_sheet_path(folder, stem, sheet, fmt) for fmt in formats]
+        if hashes.get(sheet) == digest and all(os.path.exists(p) for p in paths):
+            continue
+        for fmt, path in zip(formats, paths):
+            tmp = _tmp_path(path)
+            if fmt == "csv":
+                df.to_csv(tmp, index=False)
+            else:
+                df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        hashes[sheet] = digest
+        written.append(sheet)
+
+    if written:
+        tmp = _tmp_path(hash_path)
+        with open(tmp, "w") as fh:
+            json.dump(hashes, fh, indent=1)
+        os.replace(tmp, hash_path)
+    return written
+
+
+def _flat(df):
+    """Named/non-default index -> column, so every format round-trips the same table"""
+    if isinstance(df.index, pd.RangeIndex) and df.index.name is None:
+        return df
+    return df.rename_axis(df.index.name or "Category").reset_index()
+
+
+def load_tables(folder="./", stem="nifty_option_chain"):
+    """Read back the tables stored by export_tables (Parquet preferred over CSV)"""
+    try:
+        with open(_hash_file(folder, stem)) as fh:
+            sheets = list(json.load(fh))
+    except (OSError, ValueError):
+        sheets = []
+    tables = {}
+    for sheet in sheets:
+        pq = _sheet_path(folder, stem, sheet, "parquet")
+        if HAVE_PARQUET and os.path.exists(pq):
+            tables[sheet] = pd.read_parquet(pq)
+        else:
+            tables[sheet] = pd.read_csv(_sheet_path(folder, stem, sheet, "csv"))
+    return tables
+
+
+# ---------- Streaming Excel ----------
+def _cell(v):
+    if v is None:
+        return None
+    if isinstance(v, (float, np.floating)):
+        return None if not np.isfinite(v) else float(v)
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, np.bool_):
+        return bool(v)
+    return v
+
+
+def _rows(df):
+    yield [str(c) for c in df.columns]
+    for row in df.itertuples(index=False, name=None):
+        yield [_cell(v) for v in row]
+
+
+def write_workbook(path, tables):
+    """
+    Write {sheet_name: DataFrame} to `path` one row at a time so memory stays
+    flat regardless of chain size. The file appears atomically.
+    """
+    tmp = _tmp_path(path)
+    if xlsxwriter is not None:
+        wb = xlsxwriter.Workbook(tmp, {"constant_memory": True})
+        for sheet, df in tables.items():
+            ws = wb.add_worksheet(sheet[:31])
+            for r, values in enumerate(_rows(_flat(df))):
+                ws.write_row(r, 0, values)
+        wb.close()
+    else:
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        for sheet, df in tables.items():
+            ws = wb.create_sheet(sheet[:31])
+            for values in _rows(_flat(df)):
+                ws.append(values)
+        wb.save(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def build_excel(folder="./", stem="nifty_option_chain", out=None):
+    """Generate the workbook on demand from the tables stored by export_tables"""
+    tables = load_tables(folder, stem)
+    if not tables:
+        raise FileNotFoundError(f"No stored tables for '{stem}' in {folder}")
+    out = out or os.path.join(folder, f"{stem}.xlsx")
+    return write_workbook(out, tables)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build the option-chain workbook from stored tables")
+    ap.add_argument("--folder", default="./")
+    ap.add_argument("--stem", default="nifty_option_chain")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    print("Excel written:", build_excel(args.folder, args.stem, args.out))
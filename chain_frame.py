@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+chain_frame.py
+
+Compact, typed in-memory option-chain representation shared by the engines,
+the strategy builder and the research tools.
+
+- `normalise_chain(df)`: one snapshot as a typed DataFrame: categorical Symbol,
+  Expiry as int32 day codes (days since 1970-01-01, so '30-Sep-2025' and
+  '30-Sep-25' become the same value), int32 strikes, float32 LTP/OI/Greeks.
+- `ChainHistory`: many snapshots held as contiguous column arrays plus row
+  offsets per snapshot (no per-snapshot DataFrames, no repeated strings).
+  About 24 bytes per chain row instead of ~200 for default pandas frames.
+- `ChainHistory.atm()`: ATM row per snapshot for the whole history in one pass.
+
+Usage:
+    python chain_frame.py --snapshots ./snapshots      # load + memory report
+"""
+
+import os
+import argparse
+import itertools
+import datetime
+import numpy as np
+import pandas as pd
+
+from chain_greeks import list_snapshots, parse_expiry, snapshot_time_from_filename
+from snapshot_retention import archived_names, iter_archived
+from snapshot_journal import iter_journaled, journaled_names
+
+EPOCH = datetime.date(1970, 1, 1)
+CORE_COLUMNS = ("CE_LTP", "PE_LTP", "CE_OI", "PE_OI")
+
+
+# ---------- Single snapshot ----------
+def expiry_codes(values):
+    """Expiry strings/dates -> int32 day codes (each distinct value parsed once)"""
+    codes, uniques = pd.factorize(pd.Series(values))
+    days = np.array([(parse_expiry(u) - EPOCH).days for u in uniques], dtype=np.int32)
+    return days[codes] if len(codes) else np.zeros(0, dtype=np.int32)
+
+
+def expiry_date(code):
+    """int day code -> datetime.date"""
+    return EPOCH + datetime.timedelta(days=int(code))
+
+
+def _strike_array(values):
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) and np.all(values == np.round(values)) and np.abs(values).max() < 2**31:
+        return values.astype(np.int32)
+    return values.astype(np.float32)
+
+
+def normalise_chain(df):
+    """
+    Canonical typed copy of one snapshot frame. Core columns keep their names;
+    any other numeric column (Spot, Greeks, IV...) is stored as float32.
+    """
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    if "Symbol" in df.columns:
+        out["Symbol"] = df["Symbol"].astype("category").to_numpy()
+    if "Expiry" in df.columns:
+        out["Expiry"] = expiry_codes(df["Expiry"])
+    out["Strike"] = _strike_array(df["Strike"])
+    for col in df.columns:
+        if col in ("Symbol", "Expiry", "Strike"):
+            continue
+        if pd.api.types.is_numeric_dtype(df[col]):
+            out[col] = df[col].to_numpy(dtype=np.float32)
+        else:
+            out[col] = df[col].to_numpy()
+    return out
+
+
+def load_chain(path):
+    """Read a snapshot CSV straight into the canonical typed form"""
+    return normalise_chain(pd.read_csv(path))
+
+
+def prices64(values):
+    """float32 prices -> float64 rounded to paise (undoes float32 noise, ticks are 0.05)"""
+    return np.round(np.asarray(values, dtype=np.float64), 2)
+
+
+def time_key(name):
+    """'BANKNIFTY_20250901_091500.csv' -> '20250901_091500.csv' (sorts snapshots by time across symbols)"""
+    name = os.path.basename(name)
+    return name[name.find("_") + 1:]
+
+
+def _typed_parts(df, columns=None):
+    """
+    One snapshot frame as typed arrays: (expiry day codes, float64 strikes,
+    {column: float32}, rows). Keeps `columns`, or every numeric column but Strike.
+    """
+    if df.empty:
+        return np.zeros(0, dtype=np.int32), np.zeros(0), {}, 0
+    if columns is None:
+        columns = [c for c in df.columns if c != "Strike" and pd.api.types.is_numeric_dtype(df[c])]
+    return (expiry_codes(df["Expiry"]), df["Strike"].to_numpy(dtype=np.float64),
+            {c: df[c].to_numpy(dtype=np.float32) for c in columns if c in df.columns}, len(df))
+
+
+# ---------- History of snapshots ----------
+class ChainHistory:
+    """
+    Column arrays for a sequence of snapshots.
+    - names: snapshot file names (SYMBOL_YYYYMMDD_HHMMSS.csv), time-ordered
+    - times: datetime64[s] per snapshot
+    - offsets: int64, rows of snapshot i are offsets[i]:offsets[i+1]
+    - symbols / symbol_code: categorical symbol per snapshot
+    - expiry (int32 day codes), strike (int32/float32), columns{name: float32}
+    """
+
+    def __init__(self, names, times, offsets, symbols, symbol_code, expiry, strike, columns):
+        self.names = list(names)
+        self.times = np.asarray(times, dtype="datetime64[s]")
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.symbols = list(symbols)
+        self.symbol_code = np.asarray(symbol_code, dtype=np.int16)
+        self.expiry = expiry
+        self.strike = strike
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        arrays = [self.times, self.offsets, self.symbol_code, self.expiry, self.strike] + list(self.columns.values())
+        return int(sum(a.nbytes for a in arrays))
+
+    # --- construction ---
+    @classmethod
+    def from_frames(cls, items, columns=None):
+        """
+        Build from an iterable of (snapshot_name, DataFrame).
+        - columns: value columns to keep (default: the four core columns plus
+          any other numeric column present in every frame)
+        Each frame is converted to typed arrays as it arrives and dropped, so
+        a lazy iterable never holds more than one pandas frame at a time.
+        """
+        names, parts = [], []
+        for name, df in items:
+            names.append(os.path.basename(name))
+            parts.append(_typed_parts(df, columns))
+            del df
+        order = sorted(range(len(names)), key=lambda i: time_key(names[i]))
+        names = [names[i] for i in order]
+        parts = [parts[i] for i in order]
+
+        if columns is None:
+            numeric = [set(p[2]) for p in parts if p[3]]
+            shared = set.intersection(*numeric) if numeric else set(CORE_COLUMNS)
+            columns = list(CORE_COLUMNS) + sorted(shared - set(CORE_COLUMNS))
+
+        counts = np.array([p[3] for p in parts], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        symbols, symbol_code = [], []
+        for name in names:
+            sym = name.split("_")[0]
+            if sym not in symbols:
+                symbols.append(sym)
+            symbol_code.append(symbols.index(sym))
+        times = [np.datetime64(snapshot_time_from_filename(n), "s") for n in names]
+
+        nonempty = [p for p in parts if p[3]]
+        if nonempty:
+            expiry = np.concatenate([p[0] for p in nonempty]).astype(np.int32)
+            strike = _strike_array(np.concatenate([p[1] for p in nonempty]))
+            cols = {}
+            for c in columns:
+                cols[c] = np.concatenate([p[2][c] if c in p[2] else np.full(p[3], np.nan, dtype=np.float32)
+                                          for p in nonempty])
+                for p in nonempty:          # free each part's column once it is merged
+                    p[2].pop(c, None)
+        else:
+            expiry = np.zeros(0, dtype=np.int32)
+            strike = np.zeros(0, dtype=np.int32)
+            cols = {c: np.zeros(0, dtype=np.float32) for c in columns}
+        return cls(names, times, offsets, symbols, symbol_code, expiry, strike, cols)
+
+    @classmethod
+    def from_files(cls, paths, columns=None):
+        return cls.from_frames(((p, pd.read_csv(p)) for p in paths), columns)
+
+    @classmethod
+    def from_folder(cls, folder, symbol=None, include_archive=True, columns=None, since=None):
+        """
+        Loose snapshot CSVs plus (optionally) compacted archives and ingestion
+        journals of `folder` (a snapshot present in several places is read once).
+        - since: snapshot name; only snapshots at or after its timestamp are loaded
+        """
+        loose = list_snapshots(folder, symbol)
+        if since:
+            loose = [p for p in loose if time_key(os.path.basename(p)) >= time_key(since)]
+        sources = [((p, pd.read_csv(p)) for p in loose)]      # read lazily, one frame at a time
+        if include_archive:
+            # the generators filter lazily, so each gets its own set (never rebound)
+            loose_names = {os.path.basename(p) for p in loose}
+            archived = archived_names(folder, symbol)
+            if since:
+                archived = [n for n in archived if time_key(n) >= time_key(since)]
+            if any(n not in loose_names for n in archived):
+                day = time_key(since)[:8] if since else None
+                sources.append((n, df) for n, df in iter_archived(folder, symbol, since_day=day)
+                               if n not in loose_names and (not since or time_key(n) >= time_key(since)))
+            held = loose_names | set(archived)
+            journaled = journaled_names(folder, symbol, since_day=time_key(since)[:8] if since else None)
+            if since:
+                journaled = [n for n in journaled if time_key(n) >= time_key(since)]
+            if any(n not in held for n in journaled):
+                day = time_key(since)[:8] if since else None
+                sources.append((n, df) for n, df in iter_journaled(folder, symbol, since_day=day)
+                               if n not in held and (not since or time_key(n) >= time_key(since)))
+        return cls.from_frames(itertools.chain(*sources), columns)
+
+    # --- access ---
+    def frame(self, i):
+        """Snapshot i as a typed DataFrame (canonical columns)"""
+        a, b = self.offsets[i], self.offsets[i + 1]
+        out = pd.DataFrame({
+            "Symbol": pd.Categorical([self.symbols[self.symbol_code[i]]] * (b - a), categories=self.symbols),
+            "Expiry": self.expiry[a:b],
+            "Strike": self.strike[a:b],
+        })
+        for c, arr in self.columns.items():
+            out[c] = arr[a:b]
+        return out
+
+    def slice(self, start, stop=None):
+        """Snapshots [start:stop] as a new ChainHistory (array views, no copy)"""
+        stop = len(self) if stop is None else stop
+        a, b = self.offsets[start], self.offsets[stop]
+        return ChainHistory(self.names[start:stop], self.times[start:stop], self.offsets[start:stop + 1] - a,
+                            self.symbols, self.symbol_code[start:stop], self.expiry[a:b], self.strike[a:b],
+                            {c: arr[a:b] for c, arr in self.columns.items()})
+
+    def atm(self, ref=None):
+        """
+        ATM row of every snapshot in one pass.
+        - ref: per-snapshot reference price (e.g. joined spot); default and
+          NaN entries use the snapshot's mean strike (the engines' historical
+          rule). Ties go to the first row.
+        Returns dict of per-snapshot arrays: row, valid, Strike and the value
+        columns (prices as float64 rounded to paise, others float64).
+        """
+        n = len(self)
+        counts = self.counts
+        valid = counts > 0
+        strike = self.strike.astype(np.float64)
+        seg = np.repeat(np.arange(n), counts)
+        sums = np.zeros(n)
+        np.add.at(sums, seg, strike)
+        mean = np.divide(sums, counts, out=np.full(n, np.nan), where=valid)
+        ref = mean if ref is None else np.where(np.isnan(ref), mean, np.asarray(ref, dtype=np.float64))
+        diff = np.abs(strike - ref[seg])
+        diff = np.where(np.isnan(diff), np.inf, diff)
+        # rows sorted by (snapshot, distance, position): each snapshot's block starts with its ATM row
+        order = np.lexsort((np.arange(len(diff)), diff, seg))
+        row = np.full(n, -1, dtype=np.int64)
+        row[valid] = order[self.offsets[:-1][valid]]
+
+        take = np.where(valid, row, 0)
+        out = {"row": row, "valid": valid, "Strike": np.where(valid, strike[take] if len(strike) else np.nan, np.nan)}
+        for c, arr in self.columns.items():
+            vals = prices64(arr[take]) if c.endswith("_LTP") else arr[take].astype(np.float64)
+            out[c] = np.where(valid, vals, np.nan) if len(arr) else np.full(n, np.nan)
+        return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Load a snapshot folder into the compact chain representation")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--symbol", default=None)
+    args = ap.parse_args()
+
+    hist = ChainHistory.from_folder(args.snapshots, args.symbol)
+    rows = int(hist.offsets[-1])
+    print(f"{len(hist)} snapshots, {rows} rows, {hist.nbytes / 1e6:.2f} MB in memory"
+          f" ({hist.nbytes / max(rows, 1):.1f} bytes/row)")
+    if len(hist):
+        print(hist.frame(len(hist) - 1).head())
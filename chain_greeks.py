@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+chain_greeks.py
+
+Chain-wide Black-Scholes Greeks for option-chain snapshots.
+
+Features:
+- Vectorised BS price/Greeks for every strike and expiry of a snapshot in one
+  numpy pass (same units as mibian: theta per calendar day, vega per 1 vol point).
+- Vectorised implied volatility (Newton with bisection fallback) from LTPs.
+- `add_greeks()` ingest stage: appends IV/Delta/Gamma/Theta/Vega columns for CE
+  and PE next to LTP/OI so downstream tools read them instead of recomputing.
+- CLI backfill for an existing snapshot folder.
+
+Usage:
+    python chain_greeks.py --snapshots ./snapshots --rate 6
+"""
+
+import os
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+GREEK_FIELDS = ("IV", "Delta", "Gamma", "Theta", "Vega")
+EXPIRY_FORMATS = ("%d-%b-%Y", "%d-%b-%y", "%Y-%m-%d")
+EXPIRY_TIME = datetime.time(15, 30)   # NSE index options settle at the close
+MIN_DAYS = 1.0 / 1440                 # floor time-to-expiry at one minute
+
+_INV_SQRT_2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+
+# ---------- Date helpers ----------
+def parse_expiry(value):
+    """
+    Parse an NSE expiry string ('30-Sep-2025' or '30-Sep-25') into a date.
+    Integers are chain_frame day codes (days since 1970-01-01).
+    """
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return datetime.date(1970, 1, 1) + datetime.timedelta(days=int(value))
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = str(value).strip()
+    for fmt in EXPIRY_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised expiry format: {value!r}")
+
+
+def snapshot_time_from_filename(fname):
+    """Timestamp of a snapshot named like BANKNIFTY_20250901_190646.csv"""
+    parts = os.path.splitext(os.path.basename(fname))[0].split("_")
+    return datetime.datetime.strptime(parts[1][:8] + parts[2][:6], "%Y%m%d%H%M%S")
+
+
+def list_snapshots(folder, symbol=None):
+    """Sorted snapshot CSV paths in `folder` (skips backtest_results.csv etc.)"""
+    paths = []
+    for name in os.listdir(folder):
+        if not name.endswith(".csv") or (symbol and not name.startswith(f"{symbol}_")):
+            continue
+        try:
+            snapshot_time_from_filename(name)
+        except (ValueError, IndexError):
+            continue
+        paths.append(os.path.join(folder, name))
+    return sorted(paths)
+
+
+def days_to_expiry(expiries, asof):
+    """
+    Fractional calendar days from `asof` to each expiry's 15:30 settlement.
+    Only the unique expiry strings are parsed, then broadcast back to rows.
+    """
+    expiries = pd.Series(expiries)
+    codes, uniques = pd.factorize(expiries)
+    days = np.array([
+        (datetime.datetime.combine(parse_expiry(u), EXPIRY_TIME) - asof).total_seconds() / 86400.0
+        for u in uniques
+    ], dtype=float)
+    return days[codes]
+
+
+def implied_spot(df):
+    """
+    Estimate the underlying from put-call parity on the nearest expiry
+    (spot ~ K + C - P at the strike where C and P are closest).
+    Used when a snapshot carries no Spot column.
+    """
+    quoted = df[(df["CE_LTP"] > 0) & (df["PE_LTP"] > 0)]
+    if quoted.empty:
+        return float(df["Strike"].median())
+    exp_dates = quoted["Expiry"].map(parse_expiry)
+    front = quoted[exp_dates == exp_dates.min()]
+    gap = (front["CE_LTP"] - front["PE_LTP"])
+    row = front.loc[gap.abs().idxmin()]
+    return float(row["Strike"] + row["CE_LTP"] - row["PE_LTP"])
+
+
+# ---------- Vectorised Black-Scholes ----------
+def bs_greeks(spot, strike, rate_pct, days, iv_pct, is_call):
+    """
+    Vectorised Black-Scholes price and Greeks (arrays broadcast together).
+    - spot, strike: prices
+    - rate_pct: annual rate in percent
+    - days: calendar days to expiry (fractional allowed)
+    - iv_pct: annual volatility in percent
+    - is_call: bool array, True for CE
+    Returns dict: price, delta, gamma, theta, vega
+    """
+    S = np.asarray(spot, dtype=float)
+    K = np.asarray(strike, dtype=float)
+    r = np.asarray(rate_pct, dtype=float) / 100.0
+    T = np.maximum(np.asarray(days, dtype=float), MIN_DAYS) / 365.0
+    sigma = np.asarray(iv_pct, dtype=float) / 100.0
+    is_call = np.asarray(is_call, dtype=bool)
+
+    sqrt_t = np.sqrt(T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * sqrt_t)
+        d2 = d1 - sigma * sqrt_t
+        disc = np.exp(-r * T)
+        pdf_d1 = _INV_SQRT_2PI * np.exp(-0.5 * d1 ** 2)
+
+        call_price = S * ndtr(d1) - K * disc * ndtr(d2)
+        put_price = K * disc * ndtr(-d2) - S * ndtr(-d1)
+        price = np.where(is_call, call_price, put_price)
+        delta = np.where(is_call, ndtr(d1), ndtr(d1) - 1.0)
+        gamma = pdf_d1 / (S * sigma * sqrt_t)
+        decay = -S * pdf_d1 * sigma / (2.0 * sqrt_t)
+        theta = np.where(is_call,
+                         decay - r * K * disc * ndtr(d2),
+                         decay + r * K * disc * ndtr(-d2)) / 365.0
+        vega = S * pdf_d1 * sqrt_t / 100.0
+    return {"price": price, "delta": delta, "gamma": gamma, "theta": theta, "vega": vega}
+
+
+def implied_vol(price, spot, strike, rate_pct, days, is_call,
+                lo_pct=0.01, hi_pct=500.0, tol=1e-6, max_iter=50):
+    """
+    Vectorised implied volatility (percent). Newton steps are taken where vega
+    is usable and otherwise fall back to bisection inside a shrinking bracket,
+    so every element converges. Returns NaN where the price is non-positive or
+    outside the no-arbitrage bounds.
+    """
+    price = np.asarray(price, dtype=float)
+    S, K, days, is_call = np.broadcast_arrays(
+        np.asarray(spot, dtype=float), np.asarray(strike, dtype=float),
+        np.asarray(days, dtype=float), np.asarray(is_call, dtype=bool))
+    r = np.asarray(rate_pct, dtype=float)
+
+    lo = bs_greeks(S, K, r, days, lo_pct, is_call)["price"]
+    hi = bs_greeks(S, K, r, days, hi_pct, is_call)["price"]
+    valid = (price > 0) & (price > lo) & (price < hi) & (days > 0)
+
+    vol_lo = np.full(price.shape, lo_pct)
+    vol_hi = np.full(price.shape, hi_pct)
+    vol = np.full(price.shape, 20.0)
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        g = bs_greeks(S[active], K[active], r, days[active], vol[active], is_call[active])
+        diff = g["price"] - price[active]
+        done = np.abs(diff) < tol
+        # tighten the bracket around the root
+        vol_hi[active] = np.where(diff > 0, vol[active], vol_hi[active])
+        vol_lo[active] = np.where(diff < 0, vol[active], vol_lo[active])
+        vega_pts = g["vega"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = vol[active] - diff / vega_pts
+        in_bracket = (newton > vol_lo[active]) & (newton < vol_hi[active]) & np.isfinite(newton)
+        step = np.where(in_bracket, newton, 0.5 * (vol_lo[active] + vol_hi[active]))
+        vol[active] = np.where(done, vol[active], step)
+        idx = np.flatnonzero(active)
+        active[idx[done]] = False
+
+    return np.where(valid, vol, np.nan)
+
+
+# ---------- Ingest stage ----------
+def add_greeks(df, spot=None, asof=None, rate_pct=6.0):
+    """
+    Ingest stage run after fetch_option_chain: compute IV and Greeks for every
+    strike/expiry of the snapshot in one batch and return a copy of `df` with
+    CE_IV, CE_Delta, CE_Gamma, CE_Theta, CE_Vega (and the PE_* set) appended.
+    - spot: underlying price; defaults to the Spot column or put-call parity
+    - asof: snapshot timestamp (datetime); defaults to now
+    - rate_pct: risk-free rate in percent
+    IV is solved from each side's LTP; Greeks are NaN where no IV exists.
+    """
+    out = df.copy()
+    if out.empty:
+        for side in ("CE", "PE"):
+            for field in GREEK_FIELDS:
+                out[f"{side}_{field}"] = np.nan
+        return out
+    if spot is None:
+        spot = float(out["Spot"].iloc[0]) if "Spot" in out.columns else implied_spot(out)
+    asof = asof or datetime.datetime.now()
+
+    n = len(out)
+    strikes = out["Strike"].to_numpy(dtype=float)
+    days = days_to_expiry(out["Expiry"], asof)
+    # stack CE rows then PE rows so the whole chain solves in one call
+    strike2 = np.concatenate([strikes, strikes])
+    days2 = np.concatenate([days, days])
+    is_call = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+    ltp = np.concatenate([out["CE_LTP"].to_numpy(dtype=float), out["PE_LTP"].to_numpy(dtype=float)])
+
+    iv = implied_vol(ltp, spot, strike2, rate_pct, days2, is_call)
+    g = bs_greeks(spot, strike2, rate_pct, days2, iv, is_call)
+    cols = {"IV": iv, "Delta": g["delta"], "Gamma": g["gamma"], "Theta": g["theta"], "Vega": g["vega"]}
+    for field in GREEK_FIELDS:
+        values = np.where(np.isfinite(iv), cols[field], np.nan)
+        out[f"CE_{field}"] = values[:n]
+        out[f"PE_{field}"] = values[n:]
+    return out
+
+
+def backfill_folder(folder, rate_pct=6.0, overwrite=False):
+    """Add Greeks to every snapshot CSV in `folder` that does not have them yet."""
+    done = 0
+    for path in list_snapshots(folder):
+        asof = snapshot_time_from_filename(path)
+        df = pd.read_csv(path)
+        if "CE_Delta" in df.columns and not overwrite:
+            continue
+        add_greeks(df, asof=asof, rate_pct=rate_pct).to_csv(path, index=False)
+        done += 1
+    print(f"Greeks added to {done} snapshot(s) in {folder}")
+    return done
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Backfill chain-wide Greeks into snapshot CSVs")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--rate", type=float, default=6.0, help="risk-free rate %%")
+    ap.add_argument("--overwrite", action="store_true", help="recompute snapshots that already have Greeks")
+    args = ap.parse_args()
+    backfill_folder(args.snapshots, rate_pct=args.rate, overwrite=args.overwrite)
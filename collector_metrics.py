@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+collector_metrics.py
+
+Latency / throughput telemetry for the snapshot collectors (engine3 paper mode,
+option-chain-pcr.py), exposed in the Prometheus text format.
+
+Features:
+- Per-stage latency histograms (collector_stage_seconds{source, stage}):
+    request   DNS + connect + time to response headers (requests' resp.elapsed)
+    transfer  body download after the headers
+    parse     JSON decode
+    build     DataFrame / table construction
+    greeks    IV/Greeks ingest stage (engine3 --greeks)
+    write     snapshot CSV / workbook write
+- Fetch results, retries by reason (HTTP status or exception type), payload
+  bytes, poll-tick slippage (how late each poll started against its schedule)
+  and the time of the last good fetch. Responses served by http_cache count
+  as result="cache_hit" only: they add no latency/payload samples and do not
+  move the last-success time, which tracks upstream fetches.
+- Exposition as a text file rewritten atomically after every poll (for a
+  node_exporter textfile collector or any local scraper) and/or a local HTTP
+  endpoint (GET /metrics, bound to 127.0.0.1 by default).
+
+Recording is always on and costs a few perf_counter calls per poll; nothing
+is exposed unless a file or port is given.
+
+Usage:
+    python engine3.py --mode paper --metrics-file collector.prom --metrics-port 9108
+    python option-chain-pcr.py --daemon --no-show --metrics-file pcr.prom
+    python collector_metrics.py --file collector.prom        # pretty-print a metrics file
+"""
+
+import os
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SLIPPAGE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BYTES_BUCKETS = tuple(float(16384 * 4 ** i) for i in range(7))     # 16 KB .. 64 MB
+
+
+# ---------- Registry ----------
+class Registry:
+    """
+    Thread-safe counters, gauges and histograms keyed by name + label set.
+    Metrics must be declared (counter / gauge / histogram) before use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}    # name -> {"kind", "help", "buckets", "series": {labels: value}}
+
+    def _declare(self, kind, name, help_text, buckets=None):
+        self.metrics[name] = {"kind": kind, "help": help_text, "buckets": buckets, "series": {}}
+
+    def counter(self, name, help_text):
+        self._declare("counter", name, help_text)
+
+    def gauge(self, name, help_text):
+        self._declare("gauge", name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._declare("histogram", name, help_text, tuple(buckets))
+
+    def inc(self, name, value=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.metrics[name]["series"]
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.metrics[name]["series"][key] = float(value)
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        metric = self.metrics[name]
+        with self.lock:
+            h = metric["series"].get(key)
+            if h is None:
+                h = metric["series"][key] = [[0] * len(metric["buckets"]), 0.0, 0]
+            for i, edge in enumerate(metric["buckets"]):
+                if value <= edge:
+                    h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the wall time of the block (also when it raises)"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    # --- exposition ---
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self.lock:
+            for name, m in self.metrics.items():
+                lines.append(f"# HELP {name} {m['help']}")
+                lines.append(f"# TYPE {name} {m['kind']}")
+                for key, value in sorted(m["series"].items()):
+                    if m["kind"] != "histogram":
+                        lines.append(f"{name}{_labels(key)} {_num(value)}")
+                        continue
+                    counts, total, n = value
+                    for edge, c in zip(m["buckets"], counts):
+                        lines.append(f"{name}_bucket{_labels(key, le=_num(edge))} {c}")
+                    lines.append(f"{name}_bucket{_labels(key, le='+Inf')} {n}")
+                    lines.append(f"{name}_sum{_labels(key)} {_num(total)}")
+                    lines.append(f"{name}_count{_labels(key)} {n}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Rewrite `path` atomically (readers never see a partial file)"""
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as fh:
+            fh.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve GET /metrics from a daemon thread; returns the server (call .shutdown() to stop)"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):     # keep the collector console quiet
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key, **extra):
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _num(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# ---------- Collector metrics ----------
+METRICS = Registry()
+METRICS.histogram("collector_stage_seconds", "Collector stage latency (request, transfer, parse, build, greeks, write)")
+METRICS.histogram("collector_payload_bytes", "Option-chain response body size", BYTES_BUCKETS)
+METRICS.counter("collector_fetch_total", "Option-chain fetches by result")
+METRICS.counter("collector_retries_total", "Fetch retries by reason")
+METRICS.histogram("collector_poll_slippage_seconds", "Delay between a poll's scheduled and actual start",
+                  SLIPPAGE_BUCKETS)
+METRICS.gauge("collector_last_success_timestamp_seconds", "Unix time of the last successful fetch")
+
+
+def stage(name, source):
+    """Context manager timing one collector stage"""
+    return METRICS.time("collector_stage_seconds", source=source, stage=name)
+
+
+def timed_get(session, url, source, **kwargs):
+    """
+    session.get(url, **kwargs) with request / transfer latency, payload size
+    and fetch result recorded. The body is read before returning.
+    A response from the HTTP cache (from_cache) is counted as a cache hit only.
+    """
+    t0 = time.perf_counter()
+    try:
+        resp = session.get(url, **kwargs)
+    except Exception:
+        METRICS.inc("collector_fetch_total", source=source, result="error")
+        raise
+    if getattr(resp, "from_cache", False):
+        METRICS.inc("collector_fetch_total", source=source, result="cache_hit")
+        return resp
+    total = time.perf_counter() - t0
+    headers = resp.elapsed.total_seconds()
+    METRICS.observe("collector_stage_seconds", headers, source=source, stage="request")
+    METRICS.observe("collector_stage_seconds", max(0.0, total - headers), source=source, stage="transfer")
+    METRICS.observe("collector_payload_bytes", len(resp.content), source=source)
+    ok = resp.status_code == 200
+    METRICS.inc("collector_fetch_total", source=source, result="ok" if ok else f"http_{resp.status_code}")
+    if ok:
+        METRICS.set("collector_last_success_timestamp_seconds", time.time(), source=source)
+    return resp
+
+
+def retry(source, reason):
+    METRICS.inc("collector_retries_total", source=source, reason=reason)
+
+
+def slippage(source, seconds):
+    METRICS.observe("collector_poll_slippage_seconds", max(0.0, seconds), source=source)
+
+
+class Exporter:
+    """
+    Opt-in exposition for a collector loop.
+    - path: metrics text file rewritten after every poll (None = off)
+    - port: local HTTP port serving /metrics (None = off)
+    """
+
+    def __init__(self, path=None, port=None, host="127.0.0.1"):
+        self.path = path
+        self.server = METRICS.serve(port, host) if port else None
+        if self.server:
+            print(f"Metrics at http://{host}:{port}/metrics")
+
+    def publish(self):
+        if self.path:
+            try:
+                METRICS.write(self.path)
+            except OSError as e:
+                print("Metrics file write failed:", e)
+
+    def close(self):
+        self.publish()
+        if self.server:
+            self.server.shutdown()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Summarise a collector metrics file")
+    ap.add_argument("--file", required=True)
+    args = ap.parse_args()
+
+    # mean latency per histogram series, plus counters/gauges as-is
+    sums, counts = {}, {}
+    with open(args.file) as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            series, value = line.rstrip().rsplit(" ", 1)
+            if "_bucket" in series:
+                continue
+            if series.split("{")[0].endswith("_sum"):
+                sums[series.replace("_sum", "", 1)] = float(value)
+            elif series.split("{")[0].endswith("_count"):
+                counts[series.replace("_count", "", 1)] = float(value)
+            else:
+                print(f"{series} {value}")
+    for series, n in counts.items():
+        mean = sums.get(series, 0.0) / n if n else float("nan")
+        print(f"{series} n={n:g} mean={mean:.4f}")
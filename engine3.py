@@ -5,7 +5,20 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import requests
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np  # <— needed for Sharpe calc
+from chain_greeks import add_greeks, parse_expiry
+from chain_export import frame_hash
+from poll_scheduler import PollScheduler, load_holidays
+import trade_trace as tt
+import backtest_checkpoint as ckpt
+import collector_metrics as cm
+import http_cache
+from snapshot_journal import SnapshotJournal
+from snapshot_retention import compact
+from chain_frame import ChainHistory
+from asof_join import join_underlying, read_bars
+import signals
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0",
@@ -20,44 +33,244 @@ NSE_URLS = {
 def fetch_option_chain(symbol="BANKNIFTY"):
     """Fetch current option chain snapshot from NSE"""
     url = NSE_URLS[symbol]
-    session = requests.Session()
-    resp = session.get(url, headers=HEADERS).json()
-    recs = []
-    for row in resp['records']['data']:
-        strike = row.get('strikePrice')
-        expiry = row.get('expiryDate')
-        ce, pe = row.get('CE', {}), row.get('PE', {})
-        recs.append({
-            "Symbol": symbol,
-            "Expiry": expiry,
-            "Strike": strike,
-            "CE_LTP": ce.get('lastPrice'),
-            "PE_LTP": pe.get('lastPrice'),
-            "CE_OI": ce.get('openInterest'),
-            "PE_OI": pe.get('openInterest')
-        })
-    return pd.DataFrame(recs).dropna()
-
-def save_snapshot(symbol, folder):
+    session = http_cache.wrap(requests.Session())
+    raw = cm.timed_get(session, url, "engine3", headers=HEADERS)
+    with cm.stage("parse", "engine3"):
+        resp = raw.json()
+    with cm.stage("build", "engine3"):
+        spot = resp['records'].get('underlyingValue')
+        recs = []
+        for row in resp['records']['data']:
+            strike = row.get('strikePrice')
+            expiry = row.get('expiryDate')
+            ce, pe = row.get('CE', {}), row.get('PE', {})
+            recs.append({
+                "Symbol": symbol,
+                "Expiry": expiry,
+                "Strike": strike,
+                "CE_LTP": ce.get('lastPrice'),
+                "PE_LTP": pe.get('lastPrice'),
+                "CE_OI": ce.get('openInterest'),
+                "PE_OI": pe.get('openInterest')
+            })
+        df = pd.DataFrame(recs).dropna()
+        if spot is not None:
+            df["Spot"] = float(spot)
+    return df
+
+def save_snapshot(symbol, folder, greeks=False, rate_pct=6.0, df=None, journal=None):
+    """
+    Fetch one snapshot (or take `df`) and write it; with greeks=True IV/Greeks are stored alongside LTP/OI.
+    The CSV is written to a temp name, fsynced and renamed, so a crash never
+    leaves a truncated snapshot. journal: SnapshotJournal to append to instead
+    of writing a CSV (returns the journal path).
+    """
     os.makedirs(folder, exist_ok=True)
-    df = fetch_option_chain(symbol)
-    fname = f"{symbol}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    if df is None:
+        df = fetch_option_chain(symbol)
+    now = datetime.datetime.now()
+    if greeks:
+        with cm.stage("greeks", "engine3"):
+            df = add_greeks(df, asof=now, rate_pct=rate_pct)
+    fname = f"{symbol}_{now.strftime('%Y%m%d_%H%M%S')}.csv"
     path = os.path.join(folder, fname)
-    df.to_csv(path, index=False)
-    print("Saved snapshot:", path)
-
-def run_paper(symbol, folder, pollsec, iters):
+    with cm.stage("write", "engine3"):
+        if journal is not None:
+            path = journal.append(fname, df)
+        else:
+            tmp = f"{path}.tmp{os.getpid()}"
+            with open(tmp, "w", newline="") as fh:
+                df.to_csv(fh, index=False)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, path)
+    print("Saved snapshot:", f"{path} ({fname})" if journal is not None else path)
+    return path
+
+def run_paper(symbol, folder, pollsec, iters, greeks=False, rate_pct=6.0, retain=False, schedule=None,
+              metrics_file=None, metrics_port=None, store="csv"):
+    """
+    Collect `iters` snapshots; with retain=True closed days are compacted into archives.
+    schedule: optional PollScheduler. Then polling follows the NSE session
+    (sleeps while closed, faster near open/close and expiry afternoons) and
+    unchanged payloads are not written again but back the poll rate off.
+    metrics_file / metrics_port: expose collector telemetry (collector_metrics)
+    as a text file rewritten after each poll and/or a local /metrics endpoint.
+    store: "csv" (one file per snapshot) or "journal" (append to the day's
+    crash-safe journal, see snapshot_journal).
+    """
     os.makedirs(folder, exist_ok=True)
-    for _ in range(iters):
-        save_snapshot(symbol, folder)
-        time.sleep(pollsec)
+    if retain:
+        compact(folder)
+    exporter = cm.Exporter(metrics_file, metrics_port)
+    journal = SnapshotJournal(folder, symbol) if store == "journal" else None
+    try:
+        _paper_loop(symbol, folder, pollsec, iters, greeks, rate_pct, retain, schedule, exporter, journal)
+    finally:
+        if journal is not None:
+            journal.close()
+        exporter.close()
+
+def _paper_loop(symbol, folder, pollsec, iters, greeks, rate_pct, retain, schedule, exporter, journal):
+    """Polling loop of run_paper (the caller closes the journal and exporter)"""
+    last_day = datetime.date.today()
+    polls = 0
+    due = None    # when this poll should have started (perf_counter)
+    while polls < iters:
+        if schedule is not None and not schedule.in_session():
+            delay, _ = schedule.next_delay()
+            print(f"Market closed; next poll at {schedule.next_open():%Y-%m-%d %H:%M} IST")
+            if journal is not None:
+                journal.sync()      # make the session's last records durable before idling
+            time.sleep(delay)
+            due = None
+            continue
+        started = time.perf_counter()
+        if due is not None:
+            cm.slippage("engine3", started - due)
+        if retain and datetime.date.today() != last_day:
+            last_day = datetime.date.today()
+            compact(folder)
+        if schedule is None:
+            save_snapshot(symbol, folder, greeks=greeks, rate_pct=rate_pct, journal=journal)
+            exporter.publish()
+            due = started + pollsec
+            time.sleep(pollsec)
+        else:
+            df = fetch_option_chain(symbol)
+            schedule.set_expiries(parse_expiry(e) for e in df["Expiry"].unique())
+            if schedule.observe(frame_hash(df)):
+                save_snapshot(symbol, folder, greeks=greeks, rate_pct=rate_pct, df=df, journal=journal)
+            else:
+                print(f"Unchanged payload ({schedule.unchanged}x); not saved")
+            delay, reason = schedule.next_delay()
+            print(f"Next poll in {delay:.0f}s ({reason})")
+            exporter.publish()
+            due = started + delay
+            time.sleep(delay)
+        polls += 1
 
 def _extract_date_from_filename(fname: str) -> datetime.date:
     # expects like: BANKNIFTY_20250901_190646.csv
     date_str = os.path.basename(fname).split("_")[1][:8]
     return datetime.datetime.strptime(date_str, "%Y%m%d").date()
 
-def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True):
+SIDE_SIGNALS = {"AUTO": "oi_side", "CE": "ce", "PE": "pe"}
+
+# Daily controls (fixed 1:2)
+MAX_DAILY_LOSS = 0.01     # -1%
+MAX_DAILY_PROFIT = 0.02   # +2%
+BAR_TOLERANCE = "30min"   # a bar that closed longer ago than this is stale (no spot for the snapshot)
+
+# ---------- Day-sharded backtest ----------
+def _day_candidates(job):
+    """
+    Balance-independent trades of one day: the first `maxtrades` entries that
+    would fill, each with its exit and outcome. Same lookahead rules as the
+    serial loop; prices are absolute, nothing here depends on the balance.
+    job: (lo, hi, stop, valid, direction, ce, pe, sl, rr, maxtrades) where the
+    arrays cover snapshots lo..stop-1 (day lo..hi-1 plus the lookahead tail).
+    """
+    lo, hi, stop, valid, direction, ce, pe, sl, rr, maxtrades = job
+    n = stop
+    out = []
+    for i in range(lo, hi):
+        if len(out) >= maxtrades:
+            break
+        k = i - lo
+        if not valid[k] or direction[k] == 0:
+            continue
+        contract = "CE" if direction[k] > 0 else "PE"
+        prices = ce if contract == "CE" else pe
+        buy_price = float(prices[k])
+        if buy_price is None or buy_price <= 0:
+            continue
+        sl_price = buy_price * (1 - sl)
+        target_price = buy_price * (1 + rr * sl)
+        hit, exit_price, outcome = None, None, None
+        last_seen = None
+        for j in range(i + 1, min(i + 1 + maxtrades, n)):
+            if not valid[j - lo]:
+                continue
+            future_price = float(prices[j - lo])
+            last_seen = future_price
+            if future_price <= sl_price:
+                hit, exit_price, outcome = "SL", sl_price, "LOSS"
+                break
+            elif future_price >= target_price:
+                hit, exit_price, outcome = "TARGET", target_price, "WIN"
+                break
+        if not hit:
+            if last_seen is None:
+                continue
+            exit_price, outcome = last_seen, "HOLD"
+        out.append((i, contract, buy_price, exit_price, outcome))
+    return out
+
+def sharded_trades(files, valid, direction, ltp, sl, rr, riskpct, maxtrades, workers=None, balance=1000000.0):
+    """
+    Parallel form of the backtest loop, identical results.
+    Days are independent except for the balance they start with: position size
+    is balance * riskpct / entry and the daily stops compare balance ratios, so
+    which trades fill (first `maxtrades` candidates, cut at the first daily
+    stop) and their entry/exit prices do not depend on the balance at all.
+    Workers find each day's candidates; a sequential pass then applies the
+    balance, sizing and daily stops with the serial engine's exact float
+    operations, in order.
+    - workers: pool size (None = os.cpu_count(), 1 = in-process)
+    Returns (results rows without underlying columns, final balance).
+    """
+    n = len(files)
+    days = [_extract_date_from_filename(f) for f in files]
+    starts = [0] + [k for k in range(1, n) if days[k] != days[k - 1]]
+    bounds = list(zip(starts, starts[1:] + [n]))
+    jobs = []
+    for lo, hi in bounds:
+        hi_loop = min(hi, n - 1)           # serial loop stops at the second last file
+        stop = min(hi_loop + maxtrades, n)
+        if lo >= hi_loop:
+            continue
+        jobs.append((lo, hi_loop, stop, valid[lo:stop], direction[lo:stop], ltp["CE"][lo:stop], ltp["PE"][lo:stop],
+                     sl, rr, maxtrades))
+    if workers == 1 or len(jobs) <= 1:
+        per_day = [_day_candidates(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+            per_day = list(pool.map(_day_candidates, jobs, chunksize=chunk))
+
+    results = []
+    for cands in per_day:
+        day_start_balance = balance
+        for i, contract, buy_price, exit_price, outcome in cands:
+            risk_amt = balance * riskpct
+            position_size = risk_amt / buy_price if buy_price != 0 else 0
+            pnl = (exit_price - buy_price) * position_size
+            balance += pnl
+            stop_flag = ""
+            day_pnl_pct_after = (balance - day_start_balance) / day_start_balance if day_start_balance != 0 else 0
+            if day_pnl_pct_after <= -MAX_DAILY_LOSS:
+                stop_flag = "STOPPED by Daily Loss Limit"
+            elif day_pnl_pct_after >= MAX_DAILY_PROFIT:
+                stop_flag = "STOPPED by Daily Profit Target"
+            results.append({
+                "file": os.path.basename(files[i]),
+                "date": days[i].isoformat(),
+                "side": contract,
+                "entry": buy_price,
+                "exit": exit_price,
+                "outcome": outcome,
+                "pnl": pnl,
+                "balance": balance,
+                "stop_flag": stop_flag
+            })
+            if stop_flag:
+                break
+    return results, balance
+
+def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True, bars=None,
+             signal=None, signal_mode="all", show_plots=True, hist=None, trace_path=None,
+             checkpoint=None, context=500, workers=None, bar_tolerance=BAR_TOLERANCE):
     """
     Backtest with:
       Run backtest with daily risk controls
@@ -65,132 +278,236 @@ def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True):
       - rr: risk:reward ratio
       - riskpct: % of balance risked per trade
       - maxtrades: max trades per day
-      - side: AUTO / CE / PE
+      - side: AUTO / CE / PE (shorthands for the oi_side / ce / pe signals)
+      - signal: optional signal spec (see signals.py), e.g. "pcr:low=0.8,high=1.2+oi_momentum";
+        overrides side. Evaluated once over the whole history; 0 = no entry
+      - signal_mode: how multiple signals combine (all / vote / first)
       - Look-ahead exit logic (as in your running version)
       - Fixed daily risk controls: -1% stop-loss, +2% profit target
       - Max trades per day via --maxtrades
       - Trade-level stop_flag + Daily summary with stop_reason
       - Sharpe, Max Drawdown, equity curve + histogram
+      - bars: optional underlying OHLCV bars; when given, each snapshot is
+        joined as-of to the last closed bar, ATM becomes the strike nearest
+        that spot and spot/ret/volume are recorded with each trade
+      - bar_tolerance: staleness limit of that join (e.g. "30min"); a snapshot
+        whose last closed bar is older (session open, data gaps) gets no spot
+        and falls back to the mean-strike ATM
+      - show_plots: draw the equity / PnL charts (off for sweeps)
+      - hist: preloaded ChainHistory of `folder` (lets a sweep load it once)
+      - trace_path: write an entry / lookahead / exit / daily-limit event trace
+        there (see trade_trace.py); off by default
+      - checkpoint: directory for resumable runs (see backtest_checkpoint.py);
+        a valid checkpoint skips all snapshots before its commit point except
+        the last `context` ones (signal lookback history; widened to the
+        signal's lookback, or to the whole history when that is unknown)
+      - workers: > 1 runs the day-sharded parallel loop (sharded_trades);
+        results are identical to the serial loop. Ignored with trace_path /
+        checkpoint, which need the serial loop's per-snapshot state
+    Snapshots (loose CSVs + compacted archives) are loaded once into a
+    ChainHistory and the ATM row of every snapshot is resolved up front.
+    Returns {"trades": DataFrame, "daily": DataFrame, "metrics": dict}, or
+    None when there are no snapshots / no trades.
     """
-    files = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".csv")])
+    params = {"sl": sl, "rr": rr, "riskpct": riskpct, "maxtrades": maxtrades, "side": side,
+              "signal": signal, "signal_mode": signal_mode}
+    if bars is not None:
+        params["bar_tolerance"] = bar_tolerance
+    spec = signal or SIDE_SIGNALS[side]
+    lookback = signals.history(spec)
+    state, prior = ckpt.resume_state(checkpoint, folder, params, bars, lookback) if checkpoint else (None, None)
+    if hist is None:
+        hist = ChainHistory.from_folder(folder, since=state["context_from"] if state else None)
+    files = hist.names
     if not files:
         print("No snapshot CSVs found in:", folder)
         return
+    if state is not None and (state["committed"] not in files
+                              or files.index(state["committed"]) + 1 < state["context"]):
+        state, prior = None, None
+        hist = ChainHistory.from_folder(folder)
+        files = hist.names
+    under = join_underlying(hist.times, bars, tolerance=bar_tolerance) if bars is not None else None
+    # ATM by proximity to mean strike (as in your code), or to the joined spot
+    atm = hist.atm(ref=under["Spot"].to_numpy() if under is not None else None)
+    ltp = {"CE": atm["CE_LTP"], "PE": atm["PE_LTP"]}
+    market = signals.market_frame(hist, atm, under)
+    direction = signals.evaluate(spec, market, signal_mode)
 
     balance = 1000000.0
     results = []
 
     # Daily controls (fixed 1:2)
-    max_daily_loss = 0.01     # -1%
-    max_daily_profit = 0.02   # +2%
+    max_daily_loss = MAX_DAILY_LOSS
+    max_daily_profit = MAX_DAILY_PROFIT
 
     trades_today = 0
     last_date = None
     day_start_balance = balance
     day_stopped = False  # track if day already stopped by rule
 
-    for i, f in enumerate(files[:-1]):  # stop at second last file (we look ahead)
-        trade_date = _extract_date_from_filename(f)
-
-        # Reset on new day
-        if last_date != trade_date:
-            last_date = trade_date
-            trades_today = 0
-            day_start_balance = balance
-            day_stopped = False
-
-        # Enforce daily trade limit
-        if trades_today >= maxtrades:
-            continue
-
-        # Enforce daily risk stops BEFORE new trade if already tripped
-        day_pnl_pct = (balance - day_start_balance) / day_start_balance if day_start_balance != 0 else 0
-        if day_stopped or day_pnl_pct <= -max_daily_loss or day_pnl_pct >= max_daily_profit:
-            day_stopped = True
-            continue
-
-        # Read entry snapshot
-        df = pd.read_csv(f)
-        if df.empty:
-            continue
-
-        # Choose ATM row by proximity to mean strike (as in your code)
-        atm = df.iloc[df['Strike'].sub(df['Strike'].mean()).abs().idxmin()]
-        ce_price, pe_price = float(atm['CE_LTP']), float(atm['PE_LTP'])
-
-        # Direction logic
-        if side == "AUTO":
-            contract = "CE" if atm['CE_OI'] > atm['PE_OI'] else "PE"
-            buy_price = ce_price if contract == "CE" else pe_price
-        elif side == "CE":
-            contract, buy_price = "CE", ce_price
-        else:
-            contract, buy_price = "PE", pe_price
-
-        if buy_price is None or buy_price <= 0:
-            continue
+    start = 0
+    tid = -1        # trade id of the last entry (trace ids continue across checkpointed runs)
+    if state is not None:
+        # resume right after the committed snapshot with the committed state
+        start = files.index(state["committed"]) + 1
+        balance, trades_today, day_start_balance, day_stopped, tid = (
+            state["balance"], state["trades_today"], state["day_start_balance"], state["day_stopped"], state["tid"])
+        last_date = datetime.date.fromisoformat(state["last_date"]) if state["last_date"] else None
+        print(f"Resuming after {state['committed']} ({len(prior)} committed trades)")
+    # first_row: results rows committed by earlier runs, which have no events in this trace
+    trace = tt.open_trace(trace_path, {"names": files, "params": params,
+                                       "first_row": len(prior) if prior is not None else 0})
+    tracing = trace.enabled
+    day_code = int(last_date.strftime("%Y%m%d")) if last_date else 0
+    # state after this index is final: every lookahead window up to it is complete
+    commit_idx = len(files) - 1 - maxtrades
+    committed = None
+
+    loop_end = len(files) - 1
+    if workers and workers > 1 and not tracing and not checkpoint:
+        results, balance = sharded_trades(files, atm["valid"], direction, ltp, sl, rr, riskpct, maxtrades, workers)
+        if under is not None:
+            pos = {f: k for k, f in enumerate(files)}
+            for row in results:
+                k = pos[row["file"]]
+                row.update({"spot": under["Spot"].iloc[k], "ret": under["Ret"].iloc[k],
+                            "volume": under["Volume"].iloc[k]})
+        loop_end = start        # results already complete; skip the serial loop
+
+    with trace:     # closed (buffer flushed) even if the loop raises
+        for i in range(start, loop_end):  # stop at second last file (we look ahead)
+            f = files[i]
+            if checkpoint and i == commit_idx + 1:
+                committed = (dict(balance=balance, trades_today=trades_today, last_date=last_date,
+                                  day_start_balance=day_start_balance, day_stopped=day_stopped, tid=tid),
+                             len(results))
+            trade_date = _extract_date_from_filename(f)
+
+            # Reset on new day
+            if last_date != trade_date:
+                last_date = trade_date
+                trades_today = 0
+                day_start_balance = balance
+                day_stopped = False
+                if tracing:
+                    day_code = int(trade_date.strftime("%Y%m%d"))
+                    trace.emit(tt.DAY_START, i, day=day_code, price=balance)
+
+            # Enforce daily trade limit
+            if trades_today >= maxtrades:
+                continue
 
-        # Risk per trade & levels
-        risk_amt = balance * riskpct
-        sl_price = buy_price * (1 - sl)
-        target_price = buy_price * (1 + rr * sl)
+            # Enforce daily risk stops BEFORE new trade if already tripped
+            day_pnl_pct = (balance - day_start_balance) / day_start_balance if day_start_balance != 0 else 0
+            if day_stopped or day_pnl_pct <= -max_daily_loss or day_pnl_pct >= max_daily_profit:
+                if tracing and not day_stopped:
+                    trace.emit(tt.DAY_LIMIT, i, day=day_code, price=balance, a=day_pnl_pct,
+                               code=tt.LIMITS["LOSS" if day_pnl_pct <= -max_daily_loss else "PROFIT"])
+                day_stopped = True
+                continue
 
-        # --- Look-ahead logic (unchanged intent):
-        # Iterate forward a few snapshots (up to maxtrades window) to see if SL/TP hits
-        hit, exit_price, outcome = None, None, None
-        lookahead_end = min(i + 1 + maxtrades, len(files))
-        for j in range(i + 1, lookahead_end):
-            f2 = files[j]
-            df_future = pd.read_csv(f2)
-            if df_future.empty:
+            # Entry snapshot + direction from the precomputed signal array
+            if not atm["valid"][i] or direction[i] == 0:
                 continue
-            atm_future = df_future.iloc[df_future['Strike'].sub(df_future['Strike'].mean()).abs().idxmin()]
-            future_price = float(atm_future[f"{contract}_LTP"])
+            contract = "CE" if direction[i] > 0 else "PE"
+            buy_price = float(ltp[contract][i])
 
-            if future_price <= sl_price:
-                hit, exit_price, outcome = "SL", sl_price, "LOSS"
-                break
-            elif future_price >= target_price:
-                hit, exit_price, outcome = "TARGET", target_price, "WIN"
-                break
+            if buy_price is None or buy_price <= 0:
+                continue
 
-        # If neither SL/TP hit, close at the last seen future price within window
-        if not hit:
-            df_future = pd.read_csv(files[lookahead_end - 1])
-            atm_future = df_future.iloc[df_future['Strike'].sub(df_future['Strike'].mean()).abs().idxmin()]
-            future_price = float(atm_future[f"{contract}_LTP"])
-            exit_price, outcome = future_price, "HOLD"
-
-        # PnL & balance update
-        position_size = risk_amt / buy_price if buy_price != 0 else 0
-        pnl = (exit_price - buy_price) * position_size
-        balance += pnl
-        trades_today += 1
-
-        # After the trade, check if daily stop/profit got hit
-        stop_flag = ""
-        day_pnl_pct_after = (balance - day_start_balance) / day_start_balance if day_start_balance != 0 else 0
-        if day_pnl_pct_after <= -max_daily_loss:
-            stop_flag = "STOPPED by Daily Loss Limit"
-            day_stopped = True
-        elif day_pnl_pct_after >= max_daily_profit:
-            stop_flag = "STOPPED by Daily Profit Target"
-            day_stopped = True
-
-        results.append({
-            "file": os.path.basename(f),
-            "date": trade_date.isoformat(),
-            "side": contract,
-            "entry": buy_price,
-            "exit": exit_price,
-            "outcome": outcome,
-            "pnl": pnl,
-            "balance": balance,
-            "stop_flag": stop_flag
-        })
+            # Risk per trade & levels
+            risk_amt = balance * riskpct
+            sl_price = buy_price * (1 - sl)
+            target_price = buy_price * (1 + rr * sl)
+            tid += 1
+            if tracing:
+                cside = tt.CONTRACTS[contract]
+                trace.emit(tt.ENTRY, i, tid, day_code, cside, price=buy_price, a=sl_price, b=target_price)
+
+            # --- Look-ahead logic (unchanged intent):
+            # Iterate forward a few snapshots (up to maxtrades window) to see if SL/TP hits
+            hit, exit_price, outcome = None, None, None
+            last_seen = None
+            lookahead_end = min(i + 1 + maxtrades, len(files))
+            for j in range(i + 1, lookahead_end):
+                if not atm["valid"][j]:
+                    continue
+                future_price = float(ltp[contract][j])
+                last_seen = future_price
+                if tracing:
+                    trace.emit(tt.CHECK, j, tid, day_code, cside, price=future_price, a=sl_price, b=target_price)
+
+                if future_price <= sl_price:
+                    hit, exit_price, outcome = "SL", sl_price, "LOSS"
+                    break
+                elif future_price >= target_price:
+                    hit, exit_price, outcome = "TARGET", target_price, "WIN"
+                    break
+
+            # If neither SL/TP hit, close at the last seen future price within window
+            if not hit:
+                if last_seen is None:
+                    if tracing:
+                        trace.emit(tt.EXIT, i, tid, day_code, cside, code=tt.OUTCOMES["NONE"], b=balance)
+                    continue
+                exit_price, outcome = last_seen, "HOLD"
+
+            # PnL & balance update
+            position_size = risk_amt / buy_price if buy_price != 0 else 0
+            pnl = (exit_price - buy_price) * position_size
+            balance += pnl
+            trades_today += 1
+            if tracing:
+                trace.emit(tt.EXIT, i, tid, day_code, cside, code=tt.OUTCOMES[outcome], price=exit_price,
+                           a=pnl, b=balance)
+
+            # After the trade, check if daily stop/profit got hit
+            stop_flag = ""
+            day_pnl_pct_after = (balance - day_start_balance) / day_start_balance if day_start_balance != 0 else 0
+            if day_pnl_pct_after <= -max_daily_loss:
+                stop_flag = "STOPPED by Daily Loss Limit"
+                day_stopped = True
+            elif day_pnl_pct_after >= max_daily_profit:
+                stop_flag = "STOPPED by Daily Profit Target"
+                day_stopped = True
+            if tracing and (day_stopped or trades_today >= maxtrades):
+                limit = "MAXTRADES" if not day_stopped else ("LOSS" if "Loss" in stop_flag else "PROFIT")
+                trace.emit(tt.DAY_LIMIT, i, tid, day_code, price=balance, a=day_pnl_pct_after, code=tt.LIMITS[limit])
+
+            results.append({
+                "file": os.path.basename(f),
+                "date": trade_date.isoformat(),
+                "side": contract,
+                "entry": buy_price,
+                "exit": exit_price,
+                "outcome": outcome,
+                "pnl": pnl,
+                "balance": balance,
+                "stop_flag": stop_flag
+            })
+            if under is not None:
+                results[-1].update({"spot": under["Spot"].iloc[i], "ret": under["Ret"].iloc[i],
+                                    "volume": under["Volume"].iloc[i]})
+
+    if checkpoint and committed is None and start - 1 < commit_idx <= len(files) - 2:
+        committed = (dict(balance=balance, trades_today=trades_today, last_date=last_date,
+                          day_start_balance=day_start_balance, day_stopped=day_stopped, tid=tid), len(results))
+    if committed is not None:
+        # reload at least the signal's lookback (all of it when unknown), starting
+        # at a valid snapshot so forward-filled inputs match the full run
+        first = 0 if lookback is None else max(0, commit_idx + 1 - max(context, lookback))
+        while first > 0 and not atm["valid"][first]:
+            first -= 1
+        frames = [df for df in (prior, pd.DataFrame(results[:committed[1]])) if df is not None and len(df)]
+        ckpt.save(checkpoint, ckpt.make_state(files, commit_idx, commit_idx + 1 - first, committed[0], params,
+                                              folder, bars, lookback),
+                  pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
 
     # --- Results DataFrame ---
     dfres = pd.DataFrame(results)
+    if prior is not None and len(prior):
+        dfres = pd.concat([prior, dfres], ignore_index=True) if len(dfres) else prior
     if dfres.empty:
         print("No trades executed.")
         return
@@ -227,6 +544,11 @@ def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True):
     print(f" Final Balance: {final_balance:.2f}")
     print(f" Sharpe Ratio: {sharpe:.2f}")
     print(f" Max Drawdown: {max_dd:.2f}%")
+    metrics = {
+        "total_trades": int(total_trades), "wins": int(wins), "losses": int(losses), "holds": int(holds),
+        "win_rate": float(win_rate), "avg_pnl": float(avg_pnl), "final_balance": float(final_balance),
+        "sharpe": float(sharpe), "max_dd": float(max_dd),
+    }
 
     # --- Save to CSVs ---
     if export_csv:
@@ -265,9 +587,14 @@ def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True):
             elif day_pnl_pct2 >= max_daily_profit:
                 daily.at[irow, "stop_reason"] = "STOPPED by Daily Profit Target"
 
-    daily_path = os.path.join(folder, "daily_summary.csv")
-    daily.to_csv(daily_path, index=False)
-    print(f"✅ Daily summary exported: {daily_path}")
+    if export_csv:
+        daily_path = os.path.join(folder, "daily_summary.csv")
+        daily.to_csv(daily_path, index=False)
+        print(f"✅ Daily summary exported: {daily_path}")
+
+    result = {"trades": dfres, "daily": daily, "metrics": metrics}
+    if not show_plots:
+        return result
 
     # --- Charts ---
 
@@ -301,6 +628,7 @@ def backtest(folder, sl, rr, riskpct, maxtrades, side, export_csv=True):
 
     plt.tight_layout()
     plt.show()
+    return result
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -314,9 +642,43 @@ if __name__ == "__main__":
     ap.add_argument("--riskpct", type=float, default=0.02)
     ap.add_argument("--maxtrades", type=int, default=3)  # interpreted as max trades per DAY
     ap.add_argument("--side", choices=["AUTO","CE","PE"], default="AUTO")
+    ap.add_argument("--greeks", action="store_true", help="paper mode: store IV/Greeks in each snapshot")
+    ap.add_argument("--rate", type=float, default=6.0, help="risk-free rate %% used for Greeks")
+    ap.add_argument("--retain", action="store_true", help="paper mode: compact closed days into archives")
+    ap.add_argument("--schedule", action="store_true",
+                    help="paper mode: NSE-session-aware adaptive polling (--pollsec = normal in-session rate)")
+    ap.add_argument("--fastsec", type=int, default=15, help="paper mode: poll rate near open/close and expiry afternoons")
+    ap.add_argument("--holidays", default=None, help="paper mode: file of YYYY-MM-DD exchange holidays")
+    ap.add_argument("--store", choices=["csv", "journal"], default="csv",
+                    help="paper mode: one CSV per snapshot, or a crash-safe per-day journal")
+    ap.add_argument("--http-cache", type=float, default=None, metavar="SECONDS",
+                    help="paper mode (development): reuse NSE responses within SECONDS-long buckets")
+    ap.add_argument("--metrics-file", default=None, help="paper mode: Prometheus text file of collector metrics")
+    ap.add_argument("--metrics-port", type=int, default=None, help="paper mode: serve metrics on 127.0.0.1:PORT/metrics")
+    ap.add_argument("--signal", default=None,
+                    help='backtest: signal spec overriding --side, e.g. "pcr:low=0.8,high=1.2+oi_momentum:lookback=3"')
+    ap.add_argument("--signal-mode", choices=["all", "vote", "first"], default="all")
+    ap.add_argument("--bars", default=None, help="backtest: underlying bar file (bar_cache Parquet/CSV) to join")
+    ap.add_argument("--bar-tolerance", default=BAR_TOLERANCE,
+                    help='backtest: ignore bars that closed longer ago than this before a snapshot, e.g. "30min"')
+    ap.add_argument("--trace", default=None, help="backtest: write an event trace (replay with trade_trace.py)")
+    ap.add_argument("--checkpoint", default=None, help="backtest: checkpoint dir; resume from it when still valid")
+    ap.add_argument("--context", type=int, default=500, help="backtest: snapshots reloaded before the checkpoint")
+    ap.add_argument("--workers", type=int, default=None, help="backtest: >1 = day-sharded parallel loop")
     args = ap.parse_args()
 
     if args.mode == "paper":
-        run_paper(args.symbol, args.snapshots, args.pollsec, args.iters)
+        if args.http_cache:
+            http_cache.configure(args.http_cache)
+        schedule = None
+        if args.schedule:
+            schedule = PollScheduler(base=args.pollsec, fast=args.fastsec,
+                                     holidays=load_holidays(args.holidays) if args.holidays else None)
+        run_paper(args.symbol, args.snapshots, args.pollsec, args.iters, greeks=args.greeks, rate_pct=args.rate,
+                  retain=args.retain, schedule=schedule, metrics_file=args.metrics_file,
+                  metrics_port=args.metrics_port, store=args.store)
     else:
-        backtest(args.snapshots, args.sl, args.rr, args.riskpct, args.maxtrades, args.side)
+        bars = read_bars(args.bars) if args.bars else None
+        backtest(args.snapshots, args.sl, args.rr, args.riskpct, args.maxtrades, args.side, bars=bars,
+                 bar_tolerance=args.bar_tolerance, signal=args.signal, signal_mode=args.signal_mode, trace_path=args.trace,
+                 checkpoint=args.checkpoint, context=args.context, workers=args.workers)
@@ -5,25 +5,42 @@ import datetime
 # ----------------------------
 # Function to get NSE index data
 # ----------------------------
-def get_index_data(symbol="NIFTY", period="1mo", interval="15m"):
+def get_index_data(symbol="NIFTY", period="1mo", interval="15m", start=None, end=None):
     """
     Fetch historical data for NIFTY or BANKNIFTY from NSE.
     
     symbol: "NIFTY" or "BANKNIFTY"
     period: "1d","5d","1mo","3mo","6mo","1y","2y","5y","max"
     interval: "1m","5m","15m","1d","1wk","1mo"
+    start/end: optional datetimes (naive = UTC); when start is given only bars
+               in [start, end or now] are requested instead of `period`
+    Raises ValueError when Yahoo returns an error or no result.
     """
     url = f"https://query1.finance.yahoo.com/v8/finance/chart/%5E{symbol}50"
     params = {
-        "range": period,
         "interval": interval,
         "events": "history"
     }
+    if start is not None:
+        params["period1"] = int(pd.Timestamp(start).timestamp())
+        params["period2"] = int(pd.Timestamp(end if end is not None else datetime.datetime.now(datetime.timezone.utc)).timestamp())
+    else:
+        params["range"] = period
     r = requests.get(url, params=params)
     data = r.json()
 
-    timestamps = data['chart']['result'][0]['timestamp']
-    indicators = data['chart']['result'][0]['indicators']['quote'][0]
+    # Yahoo reports bad symbols/intervals as {"chart": {"result": null, "error": {...}}}
+    chart = data.get('chart') or {}
+    if chart.get('error') or not chart.get('result'):
+        err = chart.get('error') or {}
+        raise ValueError(f"Yahoo chart request for {symbol} failed (HTTP {r.status_code}): "
+                         f"{err.get('code', 'no result')}: {err.get('description', '')}".rstrip(": "))
+    result = chart['result'][0]
+
+    timestamps = result.get('timestamp')
+    if not timestamps:   # no bars in the requested window
+        return pd.DataFrame(columns=['Datetime','Open','High','Low','Close','Volume'])
+    indicators = result['indicators']['quote'][0]
 
     df = pd.DataFrame(indicators)
     df['Datetime'] = pd.to_datetime(timestamps, unit='s')
@@ -35,11 +52,9 @@ def get_index_data(symbol="NIFTY", period="1mo", interval="15m"):
 # Example Usage
 # ----------------------------
 if __name__ == "__main__":
-    # Fetch 6 months of 15-min BankNifty data
-    df = get_index_data(symbol="BANKNIFTY", period="6mo", interval="15m")
-    print(df.head())
+    from bar_cache import get_bars
 
-    # Save to CSV
-    today = datetime.date.today().strftime("%Y-%m-%d")
-    df.to_csv(f"banknifty_{today}.csv", index=False)
-    print(f"Saved data to banknifty_{today}.csv")
+    # 6 months of 15-min BankNifty data; only bars newer than the local cache are downloaded
+    df = get_bars(symbol="BANKNIFTY", interval="15m", period="6mo")
+    print(df.head())
+    print(f"{len(df)} bars cached under ./bar_cache (see bar_cache.py for range queries)")
@@ -1,6 +1,7 @@
 import requests
 import pandas as pd
 import datetime
+import http_cache   # opt-in response cache: NSE_HTTP_CACHE=<seconds>
 
 # NSE Option Chain API URLs
 NSE_URLS = {
@@ -18,7 +19,7 @@ HEADERS = {
 
 def fetch_option_chain(symbol="NIFTY"):
     """Fetch Option Chain data from NSE (CE + PE)."""
-    session = requests.Session()
+    session = http_cache.wrap(requests.Session())
     url = NSE_URLS[symbol]
     response = session.get(url, headers=HEADERS).json()
 
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+http_cache.py
+
+Opt-in, time-bucketed on-disk cache of NSE HTTP responses for development runs.
+
+Features:
+- Entries are keyed by URL and time bucket (floor(now / bucket) seconds), so
+  every run inside the same bucket - e.g. the same minute - gets the same
+  payload and only the first one goes upstream.
+- Bodies are stored gzip-compressed, one file per entry, written to a temp
+  name and renamed.
+- Cross-process: a per-entry lock file (O_CREAT | O_EXCL, works on Windows and
+  POSIX) makes concurrent scripts wait for the one fetch in flight instead of
+  each hitting NSE; stale locks from crashed processes are broken.
+- Size-bounded: after each store the oldest entries are evicted until the
+  folder is under `max_mb`.
+- Only HTTP 200 responses are cached. Request headers/params are not part of
+  the key (the NSE endpoints are plain GETs).
+
+Off unless enabled: set NSE_HTTP_CACHE=<bucket seconds> in the environment
+(optionally NSE_HTTP_CACHE_DIR, NSE_HTTP_CACHE_MB), or pass --http-cache to
+engine3.py / option-chain-pcr.py. Callers wrap their requests.Session with
+`wrap()`, which returns the session unchanged when caching is off.
+
+Usage:
+    NSE_HTTP_CACHE=60 python fetch_nse_data_auto.py
+    python option-chain-pcr.py --http-cache 60
+    python http_cache.py --stats            # entries / size of the cache folder
+    python http_cache.py --clear
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import argparse
+import datetime
+
+CACHE_DIR = os.environ.get("NSE_HTTP_CACHE_DIR", "./.http_cache")
+MAX_MB = float(os.environ.get("NSE_HTTP_CACHE_MB", 200))
+LOCK_STALE = 60.0       # seconds after which a lock file is considered abandoned
+
+
+class CachedResponse:
+    """The parts of requests.Response the collectors use, served from the cache"""
+    status_code = 200
+    ok = True
+
+    def __init__(self, url, content, content_type="", encoding=None):
+        self.url = url
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+        self.encoding = encoding
+        self.elapsed = datetime.timedelta(0)
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class HttpCache:
+    """
+    - folder: cache directory
+    - bucket: seconds per time bucket (entries are reused within one bucket)
+    - max_mb: size cap; oldest entries are evicted beyond it
+    - lock_timeout: seconds to wait for another process's fetch of the same entry
+    """
+
+    def __init__(self, folder=CACHE_DIR, bucket=60, max_mb=MAX_MB, lock_timeout=30.0):
+        self.folder = folder
+        self.bucket = bucket
+        self.max_bytes = int(max_mb * 1e6)
+        self.lock_timeout = lock_timeout
+        os.makedirs(folder, exist_ok=True)
+
+    def entry_path(self, url, now=None):
+        now = time.time() if now is None else now
+        digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.folder, f"{digest}_{int(now // self.bucket)}.gz")
+
+    # --- entries ---
+    def load(self, path):
+        try:
+            with open(path, "rb") as fh:
+                raw = gzip.decompress(fh.read())
+        except (OSError, EOFError):
+            return None
+        head, _, body = raw.partition(b"\n")
+        meta = json.loads(head)
+        return CachedResponse(meta["url"], body, meta["content_type"], meta["encoding"])
+
+    def store(self, path, url, resp):
+        meta = {"url": url, "content_type": resp.headers.get("Content-Type", ""), "encoding": resp.encoding}
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as fh:
+            fh.write(gzip.compress(json.dumps(meta).encode() + b"\n" + resp.content, 6))
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """Delete oldest entries until the folder fits in max_bytes"""
+        entries, total = [], 0
+        with os.scandir(self.folder) as it:
+            for e in it:
+                if e.name.endswith(".gz") and e.is_file():
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # --- cross-process lock ---
+    def _acquire(self, lock):
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > LOCK_STALE:
+                        os.remove(lock)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.05)
+
+    def get(self, session, url, **kwargs):
+        """Cached response for `url` in the current bucket, else session.get(url, **kwargs)"""
+        path = self.entry_path(url)
+        hit = self.load(path) if os.path.exists(path) else None
+        if hit is not None:
+            return hit
+        lock = path + ".lock"
+        locked = self._acquire(lock)
+        try:
+            # another process may have fetched it while we waited
+            hit = self.load(path) if os.path.exists(path) else None
+            if hit is not None:
+                return hit
+            resp = session.get(url, **kwargs)
+            if resp.status_code == 200:
+                self.store(path, url, resp)
+            return resp
+        finally:
+            if locked:
+                try:
+                    os.remove(lock)
+                except OSError:
+                    pass
+
+    def stats(self):
+        files = [e for e in os.scandir(self.folder) if e.name.endswith(".gz")]
+        return {"entries": len(files), "bytes": sum(e.stat().st_size for e in files)}
+
+    def clear(self):
+        for e in os.scandir(self.folder):
+            if e.name.endswith((".gz", ".lock")) or ".tmp" in e.name:
+                os.remove(e.path)
+
+
+class CachedSession:
+    """requests.Session proxy whose get() goes through an HttpCache"""
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def get(self, url, **kwargs):
+        return self.cache.get(self.session, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+_default = None
+
+
+def configure(bucket=None, folder=None, max_mb=None):
+    """
+    Enable the process-wide cache (bucket seconds; 0/None = off) and return it.
+    Defaults come from NSE_HTTP_CACHE / NSE_HTTP_CACHE_DIR / NSE_HTTP_CACHE_MB.
+    """
+    global _default
+    if bucket is None:
+        bucket = float(os.environ.get("NSE_HTTP_CACHE") or 0)
+    _default = HttpCache(folder or CACHE_DIR, bucket, max_mb or MAX_MB) if bucket else None
+    return _default
+
+
+def wrap(session):
+    """`session` with a caching get() when the cache is enabled, else `session` itself"""
+    return CachedSession(session, _default) if _default is not None else session
+
+
+configure()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Inspect or clear the NSE HTTP response cache")
+    ap.add_argument("--folder", default=CACHE_DIR)
+    ap.add_argument("--stats", action="store_true")
+    ap.add_argument("--clear", action="store_true")
+    args = ap.parse_args()
+
+    cache = HttpCache(args.folder)
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {args.folder}")
+    st = cache.stats()
+    print(f"{args.folder}: {st['entries']} entries, {st['bytes'] / 1e6:.2f} MB")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+max_pain.py
+
+True max pain: the settlement strike that minimises the total payout of option
+writers, for every expiry of a chain and across whole snapshot histories.
+
+For strikes K_1 < ... < K_n of one expiry, settling at K_j costs writers
+    calls: sum_{i<j} CE_OI_i * (K_j - K_i) = K_j * cumCE_j - cumCEK_j
+    puts:  sum_{i>j} PE_OI_i * (K_i - K_j) = (totPEK - cumPEK_j) - K_j * (totPE - cumPE_j)
+so the whole payout curve is a handful of cumulative sums: O(n) per expiry
+instead of the naive O(n^2), and all expiries/snapshots are handled in one
+grouped pass.
+
+Usage:
+    python max_pain.py --snapshots ./snapshots --symbol BANKNIFTY --out max_pain_series.csv
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from chain_frame import ChainHistory, expiry_codes
+
+
+def payout_curve(df, keys=("Expiry",), strike_col="Strike", ce_oi_col="CE_OI", pe_oi_col="PE_OI"):
+    """
+    Writers' payout if the underlying settles at each strike.
+    - keys: grouping columns (one payout curve per group, e.g. Expiry or (Snapshot, Expiry))
+    Returns DataFrame [*keys, Strike, CE_OI, PE_OI, Payout] sorted by keys + strike.
+    """
+    keys = list(keys)
+    # duplicate strikes inside a group are merged so the cumsums see one row per strike
+    g = (df[keys + [strike_col, ce_oi_col, pe_oi_col]]
+         .groupby(keys + [strike_col], sort=True, observed=True)[[ce_oi_col, pe_oi_col]]
+         .sum()
+         .reset_index())
+    k = g[strike_col].to_numpy(dtype=float)
+    ce = g[ce_oi_col].fillna(0).to_numpy(dtype=float)
+    pe = g[pe_oi_col].fillna(0).to_numpy(dtype=float)
+
+    tmp = pd.DataFrame({"ce": ce, "cek": ce * k, "pe": pe, "pek": pe * k})
+    grp = tmp.groupby([g[c] for c in keys], sort=False, observed=True)
+    cum = grp.cumsum()
+    tot = grp.transform("sum")
+
+    calls = k * cum["ce"].to_numpy() - cum["cek"].to_numpy()
+    puts = (tot["pek"].to_numpy() - cum["pek"].to_numpy()) - k * (tot["pe"].to_numpy() - cum["pe"].to_numpy())
+    g["Payout"] = calls + puts
+    return g
+
+
+def max_pain(df, keys=("Expiry",), strike_col="Strike", ce_oi_col="CE_OI", pe_oi_col="PE_OI"):
+    """
+    Max-pain strike for every group in `df` (default: every expiry of a chain).
+    Returns DataFrame [*keys, MaxPain, Payout, TotalOI].
+    """
+    curve = payout_curve(df, keys, strike_col, ce_oi_col, pe_oi_col)
+    keys = list(keys)
+    idx = curve.groupby(keys, sort=True, observed=True)["Payout"].idxmin()
+    out = curve.loc[idx.to_numpy(), keys + [strike_col, "Payout"]].rename(columns={strike_col: "MaxPain"})
+    tot = curve.groupby(keys, sort=True, observed=True)[[ce_oi_col, pe_oi_col]].sum().sum(axis=1)
+    out["TotalOI"] = tot.to_numpy()
+    return out.reset_index(drop=True)
+
+
+def max_pain_series(folder, symbol=None, expiry="all"):
+    """
+    Max pain per snapshot and expiry for a whole snapshot folder.
+    - expiry: "all", "front" (nearest expiry of each snapshot) or an expiry date string
+    Returns DataFrame [Time, Expiry, MaxPain, Payout, TotalOI] sorted by time.
+    """
+    hist = ChainHistory.from_folder(folder, symbol, columns=["CE_OI", "PE_OI"])
+    if not len(hist):
+        return pd.DataFrame(columns=["Time", "Expiry", "MaxPain", "Payout", "TotalOI"])
+    # expiry day codes already merge '30-Sep-2025' and '30-Sep-25'
+    chain = pd.DataFrame({
+        "Time": np.repeat(hist.times, hist.counts),
+        "Expiry": hist.expiry,
+        "Strike": hist.strike,
+        "CE_OI": hist.columns["CE_OI"],
+        "PE_OI": hist.columns["PE_OI"],
+    })
+
+    if expiry == "front":
+        chain = chain[chain["Expiry"] == chain.groupby("Time")["Expiry"].transform("min")]
+    elif expiry != "all":
+        chain = chain[chain["Expiry"] == expiry_codes([expiry])[0]]
+
+    out = max_pain(chain, keys=("Time", "Expiry"))
+    out["Expiry"] = pd.to_datetime(out["Expiry"].astype("int64"), unit="D").dt.date
+    return out.sort_values(["Time", "Expiry"]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Max-pain time series over a snapshot folder")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--symbol", default=None)
+    ap.add_argument("--expiry", default="all", help='"all", "front" or a date like 30-Sep-2025')
+    ap.add_argument("--out", default=None, help="CSV path for the series (default: print only)")
+    args = ap.parse_args()
+
+    series = max_pain_series(args.snapshots, args.symbol, args.expiry)
+    print(series.tail(20))
+    if args.out:
+        series.to_csv(args.out, index=False)
+        print("Saved max-pain series:", os.path.abspath(args.out))
@@ -1,64 +1,59 @@
 import requests
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
+import argparse
 import time
 import random
 import os
-import glob
 
 from nsepython import option_chain
 from datetime import datetime
+from chain_greeks import parse_expiry
+from max_pain import max_pain
+from chain_export import export_tables, write_workbook
+from snapshot_retention import prune_run_outputs
+import collector_metrics as cm
+import http_cache
 
 # === CONFIG ===
 INDEX = "NIFTY"
-SPOT = 24750   # Current spot price
+SPOT = 24750   # Fallback spot price when NSE does not send underlyingValue
 RANGE = 500    # +/- range in points
 MAX_KEEP_FILES = 2
 
-# Timestamp for this run
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-OUTPUT_FILE = f"nifty_option_chain_{timestamp}.xlsx"
-OI_PNG = f"option_chain_OI_{timestamp}.png"
-ChgOI_PNG = f"option_chain_ChangeOI_{timestamp}.png"
-PCR_PNG = f"option_chain_PCR_{timestamp}.png"
+HOME_URL = "https://www.nseindia.com"
+headers = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept-Language": "en-US,en;q=0.9"
+}
 
-# === CLEANUP OLD FILES ===
-folder = "./"
-files = sorted(glob.glob(os.path.join(folder, "nifty_option_chain_*.xlsx")), key=os.path.getmtime)
-for f in files[:-MAX_KEEP_FILES]:
-    os.remove(f)
-    print(f"Deleted old file: {f}")
 
-png_files = sorted(glob.glob(os.path.join(folder, "option_chain_*.png")), key=os.path.getmtime)
-for f in png_files[:-MAX_KEEP_FILES*3]:  # 3 PNG per run
-    os.remove(f)
-    print(f"Deleted old plot: {f}")
+def output_paths(folder="./", timestamp=None):
+    """Excel + PNG output names for one run"""
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    return {
+        "excel": os.path.join(folder, f"nifty_option_chain_{timestamp}.xlsx"),
+        "oi_png": os.path.join(folder, f"option_chain_OI_{timestamp}.png"),
+        "chgoi_png": os.path.join(folder, f"option_chain_ChangeOI_{timestamp}.png"),
+        "pcr_png": os.path.join(folder, f"option_chain_PCR_{timestamp}.png"),
+    }
+
 
+# === CLEANUP OLD FILES ===
 def cleanup_old_files(folder="./", max_keep_files=5):
     """
     Deletes old NSE option-chain Excel and PNG files,
-    keeping only the latest `max_keep_files` runs.
+    keeping only the latest `max_keep_files` runs (newest by name timestamp).
     """
-    # Excel files
-    excel_files = sorted(
-        glob.glob(os.path.join(folder, "nifty_option_chain_*.xlsx")),
-        key=os.path.getmtime
-    )
-    for f in excel_files[:-max_keep_files]:
-        os.remove(f)
-        print(f"Deleted old Excel file: {f}")
-
-    # PNG files (assumes 3 PNGs per run)
-    png_files = sorted(
-        glob.glob(os.path.join(folder, "option_chain_*.png")),
-        key=os.path.getmtime
-    )
-    for f in png_files[:-max_keep_files*3]:
-        os.remove(f)
-        print(f"Deleted old plot: {f}")
-
-# === Example calling cleanup_old_files ===
-#cleanup_old_files(folder="./", max_keep_files=MAX_KEEP_FILES)
+    removed = prune_run_outputs(folder, [
+        ("nifty_option_chain_", ".xlsx"),
+        ("option_chain_OI_", ".png"),
+        ("option_chain_ChangeOI_", ".png"),
+        ("option_chain_PCR_", ".png"),
+    ], max_keep_files)
+    for f in removed:
+        print(f"Deleted old output: {f}")
 
 
 # === Set PANDAS ===
@@ -67,225 +62,371 @@ def cleanup_old_files(folder="./", max_keep_files=5):
 #pd.set_option('display.max_columns', None)
 #pd.set_option('display.width', 200)   # optional, adjust console width
 
-# === NSE Fetch ===
-nse_url = f"https://www.nseindia.com/api/option-chain-indices?symbol={INDEX}"
-#nse_url = f"https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
 
-headers = {
-    "User-Agent": "Mozilla/5.0",
-    "Accept-Language": "en-US,en;q=0.9"
-}
-
-session = requests.Session()
-
-# Hit homepage first
-session.get("https://www.nseindia.com", headers=headers, timeout=10)
-
-# Retry logic
-for attempt in range(5):
-    try:
-        response = session.get(nse_url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            break
-        else:
-            print(f"Attempt {attempt+1}: Failed with HTTP {response.status_code}, retrying...")
-    except Exception as e:
-        print(f"Attempt {attempt+1}: Error {e}, retrying...")
-
-    time.sleep(random.uniform(1, 3))  # wait 1-3 seconds before retry
+# === NSE Fetch ===
+def new_session():
+    """HTTP session with NSE cookies (homepage hit first); API calls go through http_cache when enabled"""
+    session = requests.Session()
+    session.get(HOME_URL, headers=headers, timeout=10)
+    return http_cache.wrap(session)
+
+
+def fetch_chain(session, index=INDEX, retries=5):
+    """Fetch the option-chain JSON with retry logic; returns the decoded payload"""
+    nse_url = f"https://www.nseindia.com/api/option-chain-indices?symbol={index}"
+    for attempt in range(retries):
+        try:
+            response = cm.timed_get(session, nse_url, "pcr", headers=headers, timeout=10)
+            if response.status_code == 200:
+                with cm.stage("parse", "pcr"):
+                    return response.json()
+            else:
+                print(f"Attempt {attempt+1}: Failed with HTTP {response.status_code}, retrying...")
+                cm.retry("pcr", f"http_{response.status_code}")
+        except Exception as e:
+            print(f"Attempt {attempt+1}: Error {e}, retrying...")
+            cm.retry("pcr", type(e).__name__)
+
+        time.sleep(random.uniform(1, 3))  # wait 1-3 seconds before retry
 
-else:
     raise Exception("Failed to fetch data after retries")
 
-records = data["records"]["data"]
-# End of fetch section
 
-
-rows = []
-for rec in records:
-    strike = rec["strikePrice"]
-    if SPOT - RANGE <= strike <= SPOT + RANGE:
+# === TABLES ===
+def build_tables(data, spot, range_pts=RANGE):
+    """
+    Option-chain rows within spot +/- range_pts -> (df sorted by strike,
+    df_full sorted by expiry/strike, chain_oi), where chain_oi holds the OI of
+    every strike of every expiry (unfiltered, for max pain).
+    """
+    rows, oi_rows = [], []
+    for rec in data["records"]["data"]:
+        strike = rec["strikePrice"]
         ce = rec.get("CE") or {}  # if CE is None, use empty dict
         pe = rec.get("PE") or {}  # if PE is None, use empty dict
-
-        rows.append({
+        oi_rows.append({
             "expiryDate": ce.get("expiryDate") or pe.get("expiryDate"),
             "strike": strike,
             "CE_OI": ce.get("openInterest", 0),
-            "CE_ChgOI": ce.get("changeinOpenInterest", 0),
-            "CE_LTP": ce.get("lastPrice", 0),
-            "CE_ChgLTP": ce.get("change", 0),           # <-- added
-            "CE_IV": ce.get("impliedVolatility", 0),
-            "CE_BidQty": ce.get("bidQty", 0),
-            "CE_AskQty": ce.get("askQty", 0),
             "PE_OI": pe.get("openInterest", 0),
-            "PE_ChgOI": pe.get("changeinOpenInterest", 0),
-            "PE_LTP": pe.get("lastPrice", 0),
-            "PE_ChgLTP": pe.get("change", 0),           # <-- added
-            "PE_IV": pe.get("impliedVolatility", 0),
-            "PE_BidQty": pe.get("bidQty", 0),
-            "PE_AskQty": pe.get("askQty", 0)
         })
+        if spot - range_pts <= strike <= spot + range_pts:
+            rows.append({
+                "expiryDate": ce.get("expiryDate") or pe.get("expiryDate"),
+                "strike": strike,
+                "CE_OI": ce.get("openInterest", 0),
+                "CE_ChgOI": ce.get("changeinOpenInterest", 0),
+                "CE_LTP": ce.get("lastPrice", 0),
+                "CE_ChgLTP": ce.get("change", 0),           # <-- added
+                "CE_IV": ce.get("impliedVolatility", 0),
+                "CE_BidQty": ce.get("bidQty", 0),
+                "CE_AskQty": ce.get("askQty", 0),
+                "PE_OI": pe.get("openInterest", 0),
+                "PE_ChgOI": pe.get("changeinOpenInterest", 0),
+                "PE_LTP": pe.get("lastPrice", 0),
+                "PE_ChgLTP": pe.get("change", 0),           # <-- added
+                "PE_IV": pe.get("impliedVolatility", 0),
+                "PE_BidQty": pe.get("bidQty", 0),
+                "PE_AskQty": pe.get("askQty", 0)
+            })
+
+    df = pd.DataFrame(rows).sort_values("strike")
+    df_full = pd.DataFrame(rows).sort_values(["expiryDate", "strike"])
+    chain_oi = pd.DataFrame(oi_rows, columns=["expiryDate", "strike", "CE_OI", "PE_OI"])
+    return df, df_full, chain_oi
+
+
+# === CLASSIFY + SUMMARY ===
+def summarise(df, spot, chain_oi=None):
+    """
+    Adds classification/total_oi columns to df and returns (final_summary, max_pain_strike, atm_strike).
+    ATM is the listed strike nearest to spot.
+    - chain_oi: whole chain (every strike, from build_tables) for max pain;
+      defaults to df, which is only the strikes within the range
+    """
+    atm_strike = df.loc[(df["strike"] - spot).abs().idxmin(), "strike"]
+    df["classification"] = np.select(
+        [df["strike"] == atm_strike, df["strike"] < atm_strike],
+        ["ATM", "ITM_Put / OTM_Call"],
+        default="OTM_Put / ITM_Call"
+    )
 
-df = pd.DataFrame(rows).sort_values("strike")
-df_full = pd.DataFrame(rows).sort_values(["expiryDate", "strike"])
-
-# === CLASSIFY ===
-def classify_option(row):
-    if row["strike"] == SPOT:
-        return "ATM"
-    elif row["strike"] < SPOT:
-        return "ITM_Put / OTM_Call"
-    else:
-        return "OTM_Put / ITM_Call"
-
-df["classification"] = df.apply(classify_option, axis=1)
-
-# === SUMMARY TABLE WITH PCR ===
-summary = {}
-for cat in ["ATM", "ITM", "OTM"]:
-    if cat == "ATM":
-        subset = df[df["classification"]=="ATM"]
-    elif cat == "ITM":
-        # ITM Calls: strike < SPOT, ITM Puts: strike > SPOT
-        subset = pd.concat([
-            df[(df["strike"] < SPOT)],  # ITM Calls
-            df[(df["strike"] > SPOT)]   # ITM Puts
-        ])
-        # But filter columns separately for totals
-        ce_subset = df[df["strike"] < SPOT]  # ITM Calls
-        pe_subset = df[df["strike"] > SPOT]  # ITM Puts
-    else:  # OTM
-        # OTM Calls: strike > SPOT, OTM Puts: strike < SPOT
-        ce_subset = df[df["strike"] > SPOT]  # OTM Calls
-        pe_subset = df[df["strike"] < SPOT]  # OTM Puts
-
-    if cat == "ATM":
-        ce_subset = subset
-        pe_subset = subset
-
-    ce_total = ce_subset["CE_OI"].sum()
-    ce_chg = ce_subset["CE_ChgOI"].sum()
-    pe_total = pe_subset["PE_OI"].sum()
-    pe_chg = pe_subset["PE_ChgOI"].sum()
-
-    summary[cat] = {
-        "CE_TotalOI": ce_total,
-        "CE_ChgOI": ce_chg,
-        "PE_TotalOI": pe_total,
-        "PE_ChgOI": pe_chg,
-        "PCR_OI": round(pe_total/ce_total, 2) if ce_total else None,
-        "PCR_ChgOI": round(pe_chg/ce_chg, 2) if ce_chg else None
+    # === SUMMARY TABLE WITH PCR ===
+    # ITM = calls below ATM + puts above it, OTM the reverse
+    below, above, atm = df["strike"] < atm_strike, df["strike"] > atm_strike, df["strike"] == atm_strike
+    side_masks = {"ATM": (atm, atm), "ITM": (below, above), "OTM": (above, below)}
+    summary = {}
+    for cat, (ce_mask, pe_mask) in side_masks.items():
+        ce_total = df.loc[ce_mask, "CE_OI"].sum()
+        ce_chg = df.loc[ce_mask, "CE_ChgOI"].sum()
+        pe_total = df.loc[pe_mask, "PE_OI"].sum()
+        pe_chg = df.loc[pe_mask, "PE_ChgOI"].sum()
+
+        summary[cat] = {
+            "CE_TotalOI": ce_total,
+            "CE_ChgOI": ce_chg,
+            "PE_TotalOI": pe_total,
+            "PE_ChgOI": pe_chg,
+            "PCR_OI": round(pe_total/ce_total, 2) if ce_total else None,
+            "PCR_ChgOI": round(pe_chg/ce_chg, 2) if ce_chg else None
+        }
+
+    # === OVERALL PCR ===
+    total_call_oi = df["CE_OI"].sum()
+    total_put_oi = df["PE_OI"].sum()
+    total_call_chg = df["CE_ChgOI"].sum()
+    total_put_chg = df["PE_ChgOI"].sum()
+
+    summary["PCR"] = {
+        "CE_TotalOI": total_call_oi,
+        "CE_ChgOI": total_call_chg,
+        "PE_TotalOI": total_put_oi,
+        "PE_ChgOI": total_put_chg,
+        "PCR_OI": round(total_put_oi / total_call_oi, 2) if total_call_oi else None,
+        "PCR_ChgOI": round(total_put_chg / total_call_chg, 2) if total_call_chg else None
     }
 
+    # === MAX PAIN ===
+    # Strike minimising writers' payout (not simply the highest-OI strike), nearest expiry,
+    # over all of its strikes as in max_pain.max_pain_series / pcr_history
+    df["total_oi"] = df["CE_OI"] + df["PE_OI"]
+    chain = df if chain_oi is None else chain_oi
+    front_expiry = min(chain["expiryDate"].dropna().unique(), key=parse_expiry)
+    mp = max_pain(chain[chain["expiryDate"] == front_expiry], keys=("expiryDate",), strike_col="strike")
+    max_pain_strike = mp["MaxPain"].iloc[0]
+
+    summary["MaxPain"] = {
+        "CE_TotalOI": None,
+        "CE_ChgOI": None,
+        "PE_TotalOI": None,
+        "PE_ChgOI": None,
+        "PCR_OI": None,
+        "PCR_ChgOI": None,
+        "Strike": max_pain_strike
+    }
 
-# === OVERALL PCR ===
-total_call_oi = df["CE_OI"].sum()
-total_put_oi = df["PE_OI"].sum()
-total_call_chg = df["CE_ChgOI"].sum()
-total_put_chg = df["PE_ChgOI"].sum()
-
-summary["PCR"] = {
-    "CE_TotalOI": total_call_oi,
-    "CE_ChgOI": total_call_chg,
-    "PE_TotalOI": total_put_oi,
-    "PE_ChgOI": total_put_chg,
-    "PCR_OI": round(total_put_oi / total_call_oi, 2) if total_call_oi else None,
-    "PCR_ChgOI": round(total_put_chg / total_call_chg, 2) if total_call_chg else None
-}
-
-# === MAX PAIN ===
-df["total_oi"] = df["CE_OI"] + df["PE_OI"]
-max_pain_strike = df.loc[df["total_oi"].idxmax(), "strike"]
-
-summary["MaxPain"] = {
-    "CE_TotalOI": None,
-    "CE_ChgOI": None,
-    "PE_TotalOI": None,
-    "PE_ChgOI": None,
-    "PCR_OI": None,
-    "PCR_ChgOI": None,
-    "Strike": max_pain_strike
-}
-
-final_summary = pd.DataFrame(summary).T
-
-# === SAVE TO EXCEL ===
-with pd.ExcelWriter(OUTPUT_FILE, engine="openpyxl") as writer:
-    # Table 1 → Full Option Chain
-    df_full.to_excel(writer, sheet_name="FullOptionChain", index=False)
-
-    # Table 2 → Option Chain OI
-    df.to_excel(writer, sheet_name="OptionChainOI", index=False)
-
-    # Table 3 → Summary (ATM/ITM/OTM PCR etc.)
-    final_summary.to_excel(writer, sheet_name="Summary", index=True)
+    final_summary = pd.DataFrame(summary).T
+    return final_summary, max_pain_strike, atm_strike
 
-    #final_summary.to_excel(writer, sheet_name="Summary")
 
-print(f"\nData saved to {OUTPUT_FILE}")
-print(f"Opening Strike: {SPOT}")
-print(f"Max Pain Strike: {max_pain_strike}")
+# === SAVE OUTPUTS ===
+def _tmp_path(path):
+    # dot-prefixed sibling: same filesystem for os.replace, invisible to the cleanup globs
+    folder, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(folder, f".{stem}.tmp{ext}")
 
 
-print("\nExcel created with:")
-print(" - Table 1: Full Option Chain (Table1_FullOptionChain sheet)")
-print(" - Table 2: Option Chain (Table2_OptionChainOI sheet)")
-print(" - Table 3: Summary (Table3_Summary sheet)")
+def output_tables(df_full, df, final_summary):
+    """The three sheets, in workbook order"""
+    return {
+        "FullOptionChain": df_full,                  # Table 1 → Full Option Chain
+        "OptionChainOI": df,                         # Table 2 → Option Chain OI
+        "Summary": final_summary.astype(float),      # Table 3 → Summary (ATM/ITM/OTM PCR etc.)
+    }
 
-# === Also display in console ===
-print("\n=== TABLE 1: Full Option Chain Data ===")
-print(df_full.head(21))
 
-print("\n=== TABLE 2: Option Chain OI Data ===")
-nearest_expiry = df["expiryDate"].unique()[0]  # first expiry
-df = df[df["expiryDate"] == nearest_expiry]
-print(df[["expiryDate", "strike", "CE_OI", "CE_ChgOI", "PE_OI", "PE_ChgOI", "classification"]].head(21)) # show first 21 rows for preview
-#print(df.head(10))  # show first 10 rows for preview
+def write_excel(path, df_full, df, final_summary):
+    """Stream the three sheets into a constant-memory workbook (atomic)"""
+    write_workbook(path, output_tables(df_full, df, final_summary))
 
-print("\n=== TABLE 3: Option Chain Summary for OI and PCR Data ===")
-print(final_summary)
 
 # === PLOTS ===
-# OI Plot
-plt.figure(figsize=(12,6))
-plt.bar(df["strike"]-10, df["CE_OI"], width=20, label="Call OI", alpha=0.6)
-plt.bar(df["strike"]+10, df["PE_OI"], width=20, label="Put OI", alpha=0.6)
-plt.axvline(SPOT, color="red", linestyle="--", label=f"Spot {SPOT}")
-plt.axvline(max_pain_strike, color="green", linestyle="--", label=f"Max Pain {max_pain_strike}")
-plt.title(f"{INDEX} Option Chain OI (±{RANGE} range)")
-plt.xlabel("Strike Price")
-plt.ylabel("Open Interest")
-plt.legend()
-plt.tight_layout()
-plt.savefig(OI_PNG)
-plt.show()
-
-# ChgOI Plot
-plt.figure(figsize=(12,6))
-plt.bar(df["strike"]-10, df["CE_ChgOI"], width=20, label="Call Chg OI", alpha=0.6)
-plt.bar(df["strike"]+10, df["PE_ChgOI"], width=20, label="Put Chg OI", alpha=0.6)
-plt.axvline(SPOT, color="red", linestyle="--", label=f"Spot {SPOT}")
-plt.axvline(max_pain_strike, color="green", linestyle="--", label=f"Max Pain {max_pain_strike}")
-plt.title(f"{INDEX} Option Chain Change in OI (±{RANGE} range)")
-plt.xlabel("Strike Price")
-plt.ylabel("Change in Open Interest")
-plt.legend()
-plt.tight_layout()
-plt.savefig(ChgOI_PNG)
-plt.show()
-
-# === PCR Visualization ===
-pcr_data = final_summary.loc[["ATM", "ITM", "OTM", "PCR"], ["PCR_OI", "PCR_ChgOI"]]
-
-pcr_data.plot(kind="bar", figsize=(10,6))
-plt.axhline(1, color="red", linestyle="--", label="Neutral PCR")
-plt.title(f"{INDEX} Put/Call Ratio (PCR) by Category")
-plt.ylabel("PCR Value")
-plt.legend()
-plt.tight_layout()
-plt.savefig(PCR_PNG)
-plt.show()
-
-print("Plots saved as:", OI_PNG, ChgOI_PNG, PCR_PNG)
+class ChartSet:
+    """
+    The three option-chain charts. Figures are created once and redrawn on
+    every refresh, so a daemon does not pay figure setup per cycle.
+    """
+
+    def __init__(self):
+        self.fig_oi, self.ax_oi = plt.subplots(figsize=(12, 6))
+        self.fig_chg, self.ax_chg = plt.subplots(figsize=(12, 6))
+        self.fig_pcr, self.ax_pcr = plt.subplots(figsize=(10, 6))
+
+    @staticmethod
+    def _save(fig, path):
+        tmp = _tmp_path(path)
+        fig.savefig(tmp, format="png")
+        os.replace(tmp, path)
+
+    def draw(self, df, spot, max_pain_strike, final_summary, paths, index=INDEX, range_pts=RANGE):
+        # OI Plot
+        ax = self.ax_oi
+        ax.clear()
+        ax.bar(df["strike"]-10, df["CE_OI"], width=20, label="Call OI", alpha=0.6)
+        ax.bar(df["strike"]+10, df["PE_OI"], width=20, label="Put OI", alpha=0.6)
+        ax.axvline(spot, color="red", linestyle="--", label=f"Spot {spot}")
+        ax.axvline(max_pain_strike, color="green", linestyle="--", label=f"Max Pain {max_pain_strike}")
+        ax.set_title(f"{index} Option Chain OI (±{range_pts} range)")
+        ax.set_xlabel("Strike Price")
+        ax.set_ylabel("Open Interest")
+        ax.legend()
+        self.fig_oi.tight_layout()
+        self._save(self.fig_oi, paths["oi_png"])
+
+        # ChgOI Plot
+        ax = self.ax_chg
+        ax.clear()
+        ax.bar(df["strike"]-10, df["CE_ChgOI"], width=20, label="Call Chg OI", alpha=0.6)
+        ax.bar(df["strike"]+10, df["PE_ChgOI"], width=20, label="Put Chg OI", alpha=0.6)
+        ax.axvline(spot, color="red", linestyle="--", label=f"Spot {spot}")
+        ax.axvline(max_pain_strike, color="green", linestyle="--", label=f"Max Pain {max_pain_strike}")
+        ax.set_title(f"{index} Option Chain Change in OI (±{range_pts} range)")
+        ax.set_xlabel("Strike Price")
+        ax.set_ylabel("Change in Open Interest")
+        ax.legend()
+        self.fig_chg.tight_layout()
+        self._save(self.fig_chg, paths["chgoi_png"])
+
+        # === PCR Visualization ===
+        ax = self.ax_pcr
+        ax.clear()
+        pcr_data = final_summary.loc[["ATM", "ITM", "OTM", "PCR"], ["PCR_OI", "PCR_ChgOI"]].astype(float)
+        pcr_data.plot(kind="bar", ax=ax)
+        ax.axhline(1, color="red", linestyle="--", label="Neutral PCR")
+        ax.set_title(f"{index} Put/Call Ratio (PCR) by Category")
+        ax.set_ylabel("PCR Value")
+        ax.legend()
+        self.fig_pcr.tight_layout()
+        self._save(self.fig_pcr, paths["pcr_png"])
+
+
+# === PIPELINE ===
+def run_once(session, charts, index=INDEX, spot=None, range_pts=RANGE, folder="./", verbose=True,
+             formats=("xlsx",)):
+    """
+    One refresh: fetch, tables, summary, outputs + charts (all written atomically).
+    - spot: fixed spot; None uses NSE's underlyingValue (falling back to SPOT)
+    - formats: any of "xlsx" (timestamped workbook), "csv", "parquet"; csv/parquet
+      go to stable `{index}_option_chain_<sheet>` files and are only rewritten
+      when a sheet changed (build Excel from them with chain_export.py)
+    Returns dict with the frames, summary and output paths.
+    """
+    data = fetch_chain(session, index)
+    if spot is None:
+        spot = data["records"].get("underlyingValue") or SPOT
+    with cm.stage("build", "pcr"):
+        df, df_full, chain_oi = build_tables(data, spot, range_pts)
+        final_summary, max_pain_strike, atm_strike = summarise(df, spot, chain_oi)
+
+    paths = output_paths(folder)
+    stored_formats = [f for f in formats if f != "xlsx"]
+    with cm.stage("write", "pcr"):
+        if "xlsx" in formats:
+            write_excel(paths["excel"], df_full, df, final_summary)
+        else:
+            paths["excel"] = None
+        if stored_formats:
+            paths["changed_sheets"] = export_tables(output_tables(df_full, df, final_summary), folder,
+                                                    f"{index.lower()}_option_chain", stored_formats)
+    charts.draw(df, spot, max_pain_strike, final_summary, paths, index=index, range_pts=range_pts)
+
+    if verbose:
+        if paths["excel"]:
+            print(f"\nData saved to {paths['excel']}")
+        if stored_formats:
+            print(f"Stored {'/'.join(stored_formats)} sheets rewritten: {paths['changed_sheets'] or 'none (unchanged)'}")
+        print(f"Opening Strike: {atm_strike} (spot {spot})")
+        print(f"Max Pain Strike: {max_pain_strike}")
+
+        print("\nExcel created with:")
+        print(" - Table 1: Full Option Chain (Table1_FullOptionChain sheet)")
+        print(" - Table 2: Option Chain (Table2_OptionChainOI sheet)")
+        print(" - Table 3: Summary (Table3_Summary sheet)")
+
+        # === Also display in console ===
+        print("\n=== TABLE 1: Full Option Chain Data ===")
+        print(df_full.head(21))
+
+        print("\n=== TABLE 2: Option Chain OI Data ===")
+        nearest_expiry = df["expiryDate"].unique()[0]  # first expiry
+        preview = df[df["expiryDate"] == nearest_expiry]
+        print(preview[["expiryDate", "strike", "CE_OI", "CE_ChgOI", "PE_OI", "PE_ChgOI", "classification"]].head(21)) # show first 21 rows for preview
+
+        print("\n=== TABLE 3: Option Chain Summary for OI and PCR Data ===")
+        print(final_summary)
+
+        print("Plots saved as:", paths["oi_png"], paths["chgoi_png"], paths["pcr_png"])
+    return {"df": df, "df_full": df_full, "summary": final_summary,
+            "max_pain": max_pain_strike, "spot": spot, "paths": paths}
+
+
+def run_daemon(interval=60, index=INDEX, spot=None, range_pts=RANGE, folder="./",
+               max_keep_files=MAX_KEEP_FILES, max_failures=3, formats=("xlsx",), metrics_file=None,
+               metrics_port=None):
+    """
+    Refresh the summary every `interval` seconds in one process: the HTTP
+    session, imports and chart figures stay warm between cycles. Ticks are
+    scheduled on a fixed grid so slow refreshes do not drift the cadence.
+    The session is rebuilt after `max_failures` consecutive failed cycles.
+    metrics_file / metrics_port: expose collector telemetry (collector_metrics).
+    """
+    plt.switch_backend("Agg")
+    exporter = cm.Exporter(metrics_file, metrics_port)
+    session = new_session()
+    charts = ChartSet()
+    failures = 0
+    next_tick = time.monotonic()
+    while True:
+        started = time.monotonic()
+        cm.slippage("pcr", started - next_tick)
+        try:
+            out = run_once(session, charts, index=index, spot=spot, range_pts=range_pts,
+                           folder=folder, verbose=False, formats=formats)
+            cleanup_old_files(folder=folder, max_keep_files=max_keep_files)
+            failures = 0
+            print(f"[{datetime.now():%H:%M:%S}] refreshed in {time.monotonic() - started:.2f}s "
+                  f"- PCR {out['summary'].loc['PCR', 'PCR_OI']} max pain {out['max_pain']}")
+        except Exception as e:
+            failures += 1
+            print(f"[{datetime.now():%H:%M:%S}] refresh failed ({failures}): {e}")
+            if failures >= max_failures:
+                try:
+                    session = new_session()
+                    failures = 0
+                except Exception as e2:
+                    print("Session re-warm failed:", e2)
+        exporter.publish()
+
+        next_tick += interval
+        now = time.monotonic()
+        if next_tick < now:   # overran one or more ticks; skip them rather than burst
+            next_tick = now + (interval - (now - next_tick) % interval)
+        time.sleep(next_tick - now)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="NSE option-chain OI / PCR / max pain summary")
+    ap.add_argument("--index", default=INDEX)
+    ap.add_argument("--spot", type=float, default=None, help="fixed spot (default: NSE underlyingValue)")
+    ap.add_argument("--range", type=float, default=RANGE, help="+/- points around spot")
+    ap.add_argument("--folder", default="./")
+    ap.add_argument("--keep", type=int, default=MAX_KEEP_FILES, help="runs of Excel/PNG output to keep")
+    ap.add_argument("--daemon", action="store_true", help="keep running and refresh every --interval seconds")
+    ap.add_argument("--interval", type=float, default=60)
+    ap.add_argument("--no-show", action="store_true", help="do not open chart windows")
+    ap.add_argument("--formats", default="xlsx",
+                    help="comma list of xlsx,csv,parquet (csv/parquet are stored once and rewritten only on change)")
+    ap.add_argument("--http-cache", type=float, default=None, metavar="SECONDS",
+                    help="development: reuse NSE responses within SECONDS-long buckets (shared across scripts)")
+    ap.add_argument("--metrics-file", default=None, help="daemon: Prometheus text file of collector metrics")
+    ap.add_argument("--metrics-port", type=int, default=None, help="daemon: serve metrics on 127.0.0.1:PORT/metrics")
+    args = ap.parse_args()
+    formats = tuple(f.strip().lower() for f in args.formats.split(",") if f.strip())
+    if args.http_cache:
+        http_cache.configure(args.http_cache)
+
+    if args.daemon:
+        try:
+            run_daemon(args.interval, args.index, args.spot, args.range, args.folder, args.keep, formats=formats,
+                       metrics_file=args.metrics_file, metrics_port=args.metrics_port)
+        except KeyboardInterrupt:
+            print("\nStopped.")
+    else:
+        cleanup_old_files(folder=args.folder, max_keep_files=args.keep)
+        if args.no_show:
+            plt.switch_backend("Agg")
+        charts = ChartSet()
+        run_once(new_session(), charts, args.index, args.spot, args.range, args.folder, formats=formats)
+        if not args.no_show:
+            plt.show()
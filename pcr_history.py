@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+pcr_history.py
+
+Batch PCR / OI summary over a snapshot archive.
+
+option-chain-pcr.py summarises one live fetch around a fixed SPOT. This module
+applies the same ATM / ITM / OTM / overall PCR breakdown (plus true max pain)
+to every snapshot of a symbol, using each snapshot's own spot (Spot column, or
+put-call parity when the snapshot has none). Classification and aggregation
+are column masks + one groupby per file, and files are spread over a process
+pool. The result is one row per snapshot and expiry.
+
+Usage:
+    python pcr_history.py --snapshots ./snapshots --symbol BANKNIFTY --expiry front --out pcr_series.csv
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from chain_greeks import implied_spot, list_snapshots, parse_expiry, snapshot_time_from_filename
+from max_pain import max_pain
+
+CATEGORIES = ("ATM", "ITM", "OTM", "ALL")
+
+
+def _pcr(put, call):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(call != 0, put / call, np.nan)
+
+
+def summarise_chain(df, spot=None, range_pts=500, expiry="front"):
+    """
+    PCR/OI summary of one snapshot, one row per expiry.
+    - spot: underlying; defaults to the Spot column or put-call parity
+    - range_pts: only strikes within spot +/- range_pts are summarised (None = whole chain)
+    - expiry: "front" (nearest expiry only), "all" or an expiry date string
+    ATM is the strike nearest to spot (the lower one on a tie); ITM/OTM follow
+    option-chain-pcr.py: classified against that ATM strike per expiry, with
+    the ATM row itself in neither (ITM = calls below ATM + puts above it, OTM
+    the reverse).
+    Change-in-OI PCRs are filled when the snapshot has CE_ChgOI/PE_ChgOI.
+    """
+    if df.empty:
+        return pd.DataFrame()
+    if spot is None:
+        spot = float(df["Spot"].iloc[0]) if "Spot" in df.columns else implied_spot(df)
+
+    codes, uniques = pd.factorize(df["Expiry"])
+    exp_date = pd.Series([parse_expiry(u) for u in uniques], dtype=object).to_numpy()[codes]
+    df = df.assign(Expiry=exp_date)
+    if expiry == "front":
+        df = df[df["Expiry"] == df["Expiry"].min()]
+    elif expiry != "all":
+        df = df[df["Expiry"] == parse_expiry(expiry)]
+    mp = max_pain(df).set_index("Expiry")["MaxPain"]
+
+    if range_pts is not None:
+        df = df[(df["Strike"] - spot).abs() <= range_pts]
+    if df.empty:
+        return pd.DataFrame()
+
+    k = df["Strike"].to_numpy(dtype=float)
+    dist = np.abs(k - spot)
+    nearest = df.assign(_d=dist).groupby("Expiry")["_d"].transform("min").to_numpy()
+    atm_strike = pd.Series(np.where(dist == nearest, k, np.nan), index=df.index).groupby(df["Expiry"]).min()
+    atm_k = df["Expiry"].map(atm_strike).to_numpy(dtype=float)
+
+    # one mask per (category, side); summing masked columns replaces the per-row apply + loop
+    ce_masks = {"ATM": k == atm_k, "ITM": k < atm_k, "OTM": k > atm_k, "ALL": np.ones(len(k), dtype=bool)}
+    pe_masks = {"ATM": ce_masks["ATM"], "ITM": k > atm_k, "OTM": k < atm_k, "ALL": ce_masks["ALL"]}
+    has_chg = "CE_ChgOI" in df.columns and "PE_ChgOI" in df.columns
+
+    cols = {}
+    for cat in CATEGORIES:
+        cols[f"{cat}_CE_OI"] = df["CE_OI"].to_numpy(dtype=float) * ce_masks[cat]
+        cols[f"{cat}_PE_OI"] = df["PE_OI"].to_numpy(dtype=float) * pe_masks[cat]
+        if has_chg:
+            cols[f"{cat}_CE_ChgOI"] = df["CE_ChgOI"].to_numpy(dtype=float) * ce_masks[cat]
+            cols[f"{cat}_PE_ChgOI"] = df["PE_ChgOI"].to_numpy(dtype=float) * pe_masks[cat]
+    sums = pd.DataFrame(cols, index=df.index).groupby(df["Expiry"]).sum()
+
+    out = pd.DataFrame(index=sums.index)
+    out["Spot"] = spot
+    out["ATM_Strike"] = atm_strike
+    out["MaxPain"] = mp.reindex(sums.index)
+    for cat in CATEGORIES:
+        out[f"{cat}_CE_OI"] = sums[f"{cat}_CE_OI"]
+        out[f"{cat}_PE_OI"] = sums[f"{cat}_PE_OI"]
+        out[f"{cat}_PCR_OI"] = _pcr(sums[f"{cat}_PE_OI"].to_numpy(), sums[f"{cat}_CE_OI"].to_numpy())
+        if has_chg:
+            out[f"{cat}_PCR_ChgOI"] = _pcr(sums[f"{cat}_PE_ChgOI"].to_numpy(), sums[f"{cat}_CE_ChgOI"].to_numpy())
+        else:
+            out[f"{cat}_PCR_ChgOI"] = np.nan
+    return out.reset_index()
+
+
+def summarise_file(path, range_pts=500, expiry="front"):
+    """Worker: summarise one snapshot CSV (rows tagged with Time and Symbol)"""
+    df = pd.read_csv(path)
+    out = summarise_chain(df, range_pts=range_pts, expiry=expiry)
+    if out.empty:
+        return out
+    out.insert(0, "Symbol", os.path.basename(path).split("_")[0])
+    out.insert(0, "Time", snapshot_time_from_filename(path))
+    return out
+
+
+def _summarise_star(job):
+    return summarise_file(*job)
+
+
+def pcr_history(folder, symbol=None, range_pts=500, expiry="front", workers=None):
+    """
+    PCR/OI time series for every snapshot in `folder`, computed in a process pool.
+    - workers: pool size (None = os.cpu_count(), 1 = run in-process)
+    Returns DataFrame sorted by Time, Expiry.
+    """
+    paths = list_snapshots(folder, symbol)
+    if not paths:
+        return pd.DataFrame()
+    jobs = [(p, range_pts, expiry) for p in paths]
+    if workers == 1 or len(paths) == 1:
+        parts = [_summarise_star(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 8))
+            parts = list(pool.map(_summarise_star, jobs, chunksize=chunk))
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    series = pd.concat(parts, ignore_index=True).sort_values(["Time", "Expiry"]).reset_index(drop=True)
+    # compact storage: category for symbol, float32 for OI/PCR columns
+    series["Symbol"] = series["Symbol"].astype("category")
+    num_cols = [c for c in series.columns if c.endswith(("_OI", "_PCR_OI", "_PCR_ChgOI"))]
+    series[num_cols] = series[num_cols].astype(np.float32)
+    return series
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Batch PCR/OI time series over a snapshot archive")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--symbol", default=None)
+    ap.add_argument("--expiry", default="front", help='"front", "all" or a date like 30-Sep-2025')
+    ap.add_argument("--range", type=float, default=500, help="+/- points around spot (0 = whole chain)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default=None, help="CSV path for the series (default: print only)")
+    args = ap.parse_args()
+
+    series = pcr_history(args.snapshots, args.symbol, args.range or None, args.expiry, args.workers)
+    if series.empty:
+        print("No snapshots summarised in:", args.snapshots)
+    else:
+        print(series[["Time", "Symbol", "Expiry", "Spot", "ATM_Strike", "MaxPain", "ATM_PCR_OI", "ALL_PCR_OI"]].tail(20))
+        if args.out:
+            series.to_csv(args.out, index=False)
+            print("Saved PCR series:", os.path.abspath(args.out))
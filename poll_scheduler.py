@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+poll_scheduler.py
+
+NSE-session-aware adaptive polling for the snapshot collector (engine3 paper mode).
+
+Features:
+- Knows the cash/F&O session (09:15-15:30 IST, Mon-Fri) and the exchange
+  holiday calendar; outside the session it sleeps until the next open.
+- Polls faster in the opening and closing windows and on expiry-day
+  afternoons (expiry dates come from the chain itself).
+- Backs off exponentially while consecutive payloads are unchanged (hash of
+  the fetched chain) and snaps back to the normal rate on the first change.
+
+Times are evaluated in Asia/Kolkata whatever the machine's timezone.
+NSE_HOLIDAYS covers the published 2025 and 2026 lists; pass a file with one
+YYYY-MM-DD per line (--holidays) for other years or late changes. A year with
+no holiday dates at all is reported once (its weekdays would otherwise all
+be polled as trading days).
+
+Usage:
+    python poll_scheduler.py                      # show session state and next poll delay
+    python poll_scheduler.py --holidays nse_holidays.txt --base 60
+"""
+
+import datetime
+import argparse
+from zoneinfo import ZoneInfo
+
+IST = ZoneInfo("Asia/Kolkata")
+SESSION_OPEN = datetime.time(9, 15)
+SESSION_CLOSE = datetime.time(15, 30)
+
+# NSE trading holidays (equity & F&O) falling on weekdays, 2025 and 2026
+NSE_HOLIDAYS = {
+    datetime.date(2025, 2, 26), datetime.date(2025, 3, 14), datetime.date(2025, 3, 31),
+    datetime.date(2025, 4, 10), datetime.date(2025, 4, 14), datetime.date(2025, 4, 18),
+    datetime.date(2025, 5, 1), datetime.date(2025, 8, 15), datetime.date(2025, 8, 27),
+    datetime.date(2025, 10, 2), datetime.date(2025, 10, 21), datetime.date(2025, 10, 22),
+    datetime.date(2025, 11, 5), datetime.date(2025, 12, 25),
+    datetime.date(2026, 1, 26), datetime.date(2026, 3, 3), datetime.date(2026, 3, 26),
+    datetime.date(2026, 3, 31), datetime.date(2026, 4, 3), datetime.date(2026, 4, 14),
+    datetime.date(2026, 5, 1), datetime.date(2026, 5, 28), datetime.date(2026, 6, 26),
+    datetime.date(2026, 9, 14), datetime.date(2026, 10, 2), datetime.date(2026, 10, 20),
+    datetime.date(2026, 11, 10), datetime.date(2026, 11, 24), datetime.date(2026, 12, 25),
+}
+
+
+def load_holidays(path):
+    """Holiday dates from a text file (YYYY-MM-DD per line, '#' comments allowed)"""
+    days = set()
+    with open(path) as fh:
+        for line in fh:
+            line = line.split("#")[0].strip()
+            if line:
+                days.add(datetime.date.fromisoformat(line))
+    return days
+
+
+def now_ist():
+    return datetime.datetime.now(IST)
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next fetch.
+    - base: normal in-session poll interval (seconds)
+    - fast: interval in the open/close windows and on expiry afternoons
+    - max_backoff: cap for the unchanged-payload backoff (seconds)
+    - open_window / close_window: minutes after open / before close polled at `fast`
+    - expiry_after: time from which an expiry day is polled at `fast`
+    - holidays: set of dates (default NSE_HOLIDAYS); years it has no date for
+      are warned about once, then treated as having no holidays
+    """
+
+    def __init__(self, base=60, fast=15, max_backoff=600, open_window=15, close_window=30,
+                 expiry_after=datetime.time(13, 0), holidays=None):
+        self.base = base
+        self.fast = fast
+        self.max_backoff = max_backoff
+        self.open_window = datetime.timedelta(minutes=open_window)
+        self.close_window = datetime.timedelta(minutes=close_window)
+        self.expiry_after = expiry_after
+        self.holidays = set(NSE_HOLIDAYS if holidays is None else holidays)
+        self.known_years = {d.year for d in self.holidays}
+        self.warned_years = set()
+        self.expiries = set()
+        self.unchanged = 0
+        self.last_hash = None
+
+    # --- calendar ---
+    def is_trading_day(self, day):
+        if day.year not in self.known_years and day.year not in self.warned_years:
+            self.warned_years.add(day.year)
+            print(f"Warning: no NSE holidays known for {day.year}; every weekday is treated as a "
+                  f"trading day (pass --holidays with that year's calendar)")
+        return day.weekday() < 5 and day not in self.holidays
+
+    def in_session(self, now=None):
+        now = now or now_ist()
+        return self.is_trading_day(now.date()) and SESSION_OPEN <= now.time() < SESSION_CLOSE
+
+    def next_open(self, now=None):
+        """Next session open (IST) strictly after `now` unless we are before today's open"""
+        now = now or now_ist()
+        day = now.date()
+        if now.time() >= SESSION_OPEN:
+            day += datetime.timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += datetime.timedelta(days=1)
+        return datetime.datetime.combine(day, SESSION_OPEN, tzinfo=IST)
+
+    # --- payload feedback ---
+    def set_expiries(self, expiries):
+        """Expiry dates seen in the latest chain (datetime.date iterable)"""
+        self.expiries = set(expiries)
+
+    def observe(self, payload_hash):
+        """Record the latest payload hash; returns True if it changed"""
+        changed = payload_hash != self.last_hash
+        self.unchanged = 0 if changed else self.unchanged + 1
+        self.last_hash = payload_hash
+        return changed
+
+    # --- decision ---
+    def interval(self, now=None):
+        """In-session interval before backoff: fast near open/close and on expiry afternoons"""
+        now = now or now_ist()
+        today = now.date()
+        open_dt = datetime.datetime.combine(today, SESSION_OPEN, tzinfo=IST)
+        close_dt = datetime.datetime.combine(today, SESSION_CLOSE, tzinfo=IST)
+        if now - open_dt < self.open_window or close_dt - now <= self.close_window:
+            return self.fast
+        if today in self.expiries and now.time() >= self.expiry_after:
+            return self.fast
+        return self.base
+
+    def next_delay(self, now=None):
+        """Seconds to wait before the next fetch; (delay, reason)"""
+        now = now or now_ist()
+        if not self.in_session(now):
+            wait = (self.next_open(now) - now).total_seconds()
+            return max(1.0, wait), "closed"
+        step = self.interval(now)
+        if self.unchanged:
+            step = min(self.max_backoff, step * 2 ** self.unchanged)
+        close_dt = datetime.datetime.combine(now.date(), SESSION_CLOSE, tzinfo=IST)
+        # never sleep past the close: take the final snapshot of the session
+        step = min(step, max(1.0, (close_dt - now).total_seconds()))
+        return float(step), "backoff" if self.unchanged else ("fast" if step <= self.fast else "normal")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Show the collector's polling decision for now")
+    ap.add_argument("--holidays", default=None, help="file of YYYY-MM-DD holiday dates")
+    ap.add_argument("--base", type=int, default=60)
+    ap.add_argument("--fast", type=int, default=15)
+    args = ap.parse_args()
+
+    sched = PollScheduler(args.base, args.fast, holidays=load_holidays(args.holidays) if args.holidays else None)
+    now = now_ist()
+    delay, reason = sched.next_delay(now)
+    print(f"Now {now:%Y-%m-%d %H:%M:%S} IST, in session: {sched.in_session(now)}")
+    print(f"Next poll in {delay:.0f}s ({reason}); next open {sched.next_open(now):%Y-%m-%d %H:%M}")
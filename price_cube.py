@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+price_cube.py
+
+Memory-mapped time x strike x field price cube for shared multi-process access.
+
+`build_cube()` converts a snapshot archive into a dense float32 array of shape
+(snapshots, strikes, 4) with fields CE_LTP, PE_LTP, CE_OI, PE_OI and NaN where
+a strike is missing. It is written as a plain .npy (C order, so one snapshot is
+one contiguous block) next to small times/strikes/expiry/names arrays and a
+meta.json sidecar. `open_cube()` maps it read-only: any number of backtests,
+sweeps or screeners in separate processes share the same page cache and only
+fault in the pages they touch.
+
+Each build goes to a new version directory inside the cube folder and is
+published by atomically replacing the CURRENT pointer file, so readers never
+see a half-replaced cube; processes still mapping the previous version keep
+reading it until they reopen.
+
+The strike axis is one expiry per snapshot: the front (nearest) expiry by
+default, or a fixed expiry date.
+
+Readers: `sweep_queue.py init --cube` (workers backtest on the cube's expiry
+without parsing CSVs) and `strategy_screener.py --cube --at`.
+
+Usage:
+    python price_cube.py build --snapshots ./snapshots --out ./cube_banknifty
+    python price_cube.py info --cube ./cube_banknifty
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+
+from chain_frame import ChainHistory, expiry_codes, expiry_date, _strike_array
+
+FIELDS = ("CE_LTP", "PE_LTP", "CE_OI", "PE_OI")
+POINTER = "CURRENT"      # names the published version directory inside the cube folder
+
+
+def cube_version_dir(path):
+    """Directory holding the published version of the cube at `path`"""
+    try:
+        with open(os.path.join(path, POINTER)) as fh:
+            return os.path.join(path, fh.read().strip())
+    except FileNotFoundError:
+        return path          # cube built before versioned layouts
+
+
+def _select_rows(hist, expiry):
+    """Row mask of the chosen expiry per snapshot + the expiry code per snapshot"""
+    n = len(hist)
+    seg = np.repeat(np.arange(n), hist.counts)
+    if expiry == "front":
+        # nearest expiry not yet past the snapshot date
+        snap_day = hist.times.astype("datetime64[D]").astype(np.int64)
+        live = hist.expiry >= snap_day[seg]
+        codes = np.where(live, hist.expiry, np.iinfo(np.int32).max)
+        front = np.full(n, np.iinfo(np.int32).max, dtype=np.int64)
+        np.minimum.at(front, seg, codes)
+        front[front == np.iinfo(np.int32).max] = -1     # empty snapshot / nothing live
+        return hist.expiry == front[seg], front
+    code = int(expiry_codes([expiry])[0])
+    return hist.expiry == code, np.full(n, code, dtype=np.int64)
+
+
+def build_cube(folder, out, symbol=None, expiry="front", chunk=5000):
+    """
+    Build the cube for `folder` into a new version under directory `out` and
+    publish it by replacing the CURRENT pointer (older versions are removed).
+    - expiry: "front" or an expiry date string ('30-Sep-2025')
+    - chunk: snapshots written per step (bounds temporary memory)
+    Returns the meta dict.
+    """
+    hist = ChainHistory.from_folder(folder, symbol, columns=list(FIELDS))
+    if not len(hist):
+        raise FileNotFoundError(f"No snapshots found in {folder}")
+    rows, front = _select_rows(hist, expiry)
+    strikes = np.unique(hist.strike[rows]).astype(np.float64)
+    T, K = len(hist), len(strikes)
+
+    version = f"v{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    tmp = os.path.join(out, version + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    cube = np.lib.format.open_memmap(os.path.join(tmp, "cube.npy"), mode="w+",
+                                     dtype=np.float32, shape=(T, K, len(FIELDS)))
+    for t0 in range(0, T, chunk):
+        t1 = min(T, t0 + chunk)
+        a, b = hist.offsets[t0], hist.offsets[t1]
+        block = np.full((t1 - t0, K, len(FIELDS)), np.nan, dtype=np.float32)
+        sel = rows[a:b]
+        t_idx = np.repeat(np.arange(t1 - t0), hist.counts[t0:t1])[sel]
+        k_idx = np.searchsorted(strikes, hist.strike[a:b][sel])
+        for f, name in enumerate(FIELDS):
+            block[t_idx, k_idx, f] = hist.columns[name][a:b][sel]
+        cube[t0:t1] = block
+    cube.flush()
+    del cube
+
+    np.save(os.path.join(tmp, "times.npy"), hist.times.astype("datetime64[s]").astype(np.int64))
+    np.save(os.path.join(tmp, "strikes.npy"), strikes)
+    np.save(os.path.join(tmp, "expiry.npy"), front.astype(np.int32))
+    np.save(os.path.join(tmp, "names.npy"), np.array(hist.names))
+    meta = {
+        "shape": [T, K, len(FIELDS)],
+        "dtype": "float32",
+        "fields": list(FIELDS),
+        "symbols": hist.symbols,
+        "expiry": expiry,
+        "first": str(hist.times[0]),
+        "last": str(hist.times[-1]),
+        "source": os.path.abspath(folder),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as fh:
+        json.dump(meta, fh, indent=1)
+
+    os.replace(tmp, os.path.join(out, version))
+    pointer = os.path.join(out, f"{POINTER}.tmp{os.getpid()}")
+    with open(pointer, "w") as fh:
+        fh.write(version)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(pointer, os.path.join(out, POINTER))      # the publish step
+    # drop older versions (and files of a pre-versioned cube); open maps keep
+    # their pages on POSIX, and a version still in use on Windows is left for the next build
+    for name in os.listdir(out):
+        if name in (version, POINTER) or ".tmp" in name:
+            continue
+        target = os.path.join(out, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+    return meta
+
+
+class PriceCube:
+    """Read-only memory-mapped view of a built cube"""
+
+    def __init__(self, path):
+        path = cube_version_dir(path)
+        with open(os.path.join(path, "meta.json")) as fh:
+            self.meta = json.load(fh)
+        self.data = np.load(os.path.join(path, "cube.npy"), mmap_mode="r")
+        self.times = np.load(os.path.join(path, "times.npy")).astype("datetime64[s]")
+        self.strikes = np.load(os.path.join(path, "strikes.npy"))
+        self.expiry = np.load(os.path.join(path, "expiry.npy"))
+        self.fields = list(self.meta["fields"])
+        names = os.path.join(path, "names.npy")
+        self.names = (list(np.load(names)) if os.path.exists(names) else
+                      [f"{self.meta['symbols'][0]}_{t.item():%Y%m%d_%H%M%S}.csv" for t in self.times])
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def field(self, name):
+        """time x strike view of one field (no copy)"""
+        return self.data[:, :, self.fields.index(name)]
+
+    def index_of(self, when):
+        """Index of the last snapshot at or before `when`"""
+        return int(np.searchsorted(self.times, np.datetime64(when, "s"), side="right")) - 1
+
+    def strike_index(self, strike):
+        i = int(np.searchsorted(self.strikes, strike))
+        if i >= len(self.strikes) or self.strikes[i] != strike:
+            raise KeyError(f"Strike {strike} not in cube")
+        return i
+
+    def series(self, strike, name, start=0, stop=None):
+        """Time series of one field at one strike"""
+        return self.data[start:stop, self.strike_index(strike), self.fields.index(name)]
+
+    def atm_index(self, ref):
+        """Per-snapshot strike index nearest `ref` (array or scalar) among listed strikes; -1 if none listed"""
+        listed = ~np.all(np.isnan(self.data[:, :, :2]), axis=2)
+        dist = np.abs(self.strikes[None, :] - np.asarray(ref, dtype=float).reshape(-1, 1))
+        idx = np.argmin(np.where(listed, dist, np.inf), axis=1)
+        return np.where(listed.any(axis=1), idx, -1)
+
+    def expiry_dates(self):
+        return [expiry_date(c) for c in np.unique(self.expiry) if c >= 0]
+
+    def chain(self, i):
+        """Listed strikes of snapshot i as a chain frame (Strike, Expiry day code, FIELDS)"""
+        block = self.data[i]
+        listed = ~np.all(np.isnan(block), axis=1)
+        out = pd.DataFrame({"Strike": self.strikes[listed],
+                            "Expiry": np.full(int(listed.sum()), self.expiry[i], dtype=np.int32)})
+        for f, name in enumerate(self.fields):
+            out[name] = block[listed, f]
+        return out
+
+    def history(self, start=0, stop=None):
+        """
+        Listed rows of snapshots [start:stop] as a ChainHistory (the cube's
+        expiry only, strikes ascending), e.g. for engine3.backtest(hist=...)
+        without reading any CSV.
+        """
+        block = self.data[start:stop]
+        listed = ~np.all(np.isnan(block), axis=2)
+        t_idx, k_idx = np.nonzero(listed)
+        counts = listed.sum(axis=1)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        names = self.names[start:stop]
+        symbols = list(dict.fromkeys(n.split("_")[0] for n in names))
+        symbol_code = [symbols.index(n.split("_")[0]) for n in names]
+        expiry = np.repeat(self.expiry[start:stop], counts).astype(np.int32)
+        columns = {name: block[t_idx, k_idx, f] for f, name in enumerate(self.fields)}
+        return ChainHistory(names, self.times[start:stop], offsets, symbols, symbol_code, expiry,
+                            _strike_array(self.strikes[k_idx]), columns)
+
+
+def open_cube(path):
+    return PriceCube(path)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build / inspect a memory-mapped price cube")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--snapshots", default="./snapshots")
+    b.add_argument("--symbol", default=None)
+    b.add_argument("--expiry", default="front", help='"front" or a date like 30-Sep-2025')
+    b.add_argument("--out", required=True)
+    i = sub.add_parser("info")
+    i.add_argument("--cube", required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        meta = build_cube(args.snapshots, args.out, args.symbol, args.expiry)
+        size = os.path.getsize(os.path.join(cube_version_dir(args.out), "cube.npy"))
+        print(f"Cube {meta['shape']} written to {args.out} ({size / 1e6:.1f} MB)")
+    else:
+        cube = open_cube(args.cube)
+        print(json.dumps(cube.meta, indent=1))
+        print("expiries:", cube.expiry_dates())
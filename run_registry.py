@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+run_registry.py
+
+Content-addressed registry of engine3 backtest runs.
+
+A run key is the SHA-1 of
+- the snapshot manifest: name, size and mtime of every loose snapshot CSV,
+  archive index and ingestion journal in the folder (plus the bar file, when one is joined),
+- every backtest parameter (sl, rr, riskpct, maxtrades, side, signal, ...),
+- the source of the modules that define the backtest semantics,
+so adding/compacting snapshots, changing a parameter or editing the engine
+all produce a new key, while an identical request is answered from disk
+without touching the snapshots.
+
+Each run is stored under run_registry/<key>/ as trades + daily frames
+(Parquet when available, else gzip CSV) and a metrics.json that also records
+the parameters and creation time. Directories are written to a temp name and
+renamed, so concurrent callers never see a half-written run.
+
+Usage:
+    python run_registry.py run --snapshots ./snapshots --sl 0.2 --rr 2 --maxtrades 3
+    python run_registry.py list
+    python run_registry.py show --key 3f2a9c...
+"""
+
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import pandas as pd
+
+from chain_greeks import list_snapshots
+from snapshot_retention import ARCHIVE_DIR
+from snapshot_journal import journal_files
+from chain_export import HAVE_PARQUET
+
+REGISTRY_DIR = "./run_registry"
+ENGINE_SOURCES = ("engine3.py", "signals.py", "chain_frame.py", "asof_join.py", "chain_greeks.py",
+                  "snapshot_retention.py", "snapshot_journal.py", "backtest_checkpoint.py")
+DEFAULTS = {"sl": 0.3, "rr": 2.0, "riskpct": 0.02, "maxtrades": 3, "side": "AUTO", "signal": None,
+            "signal_mode": "all", "bar_tolerance": "30min"}      # bar_tolerance: engine3.BAR_TOLERANCE
+
+
+# ---------- Keys ----------
+def _stat(path):
+    st = os.stat(path)
+    return [os.path.basename(path), st.st_size, st.st_mtime_ns]
+
+
+def snapshot_manifest(folder, symbol=None):
+    """[name, size, mtime_ns] for every loose snapshot, archive index and journal (sorted)"""
+    items = [_stat(p) for p in list_snapshots(folder, symbol)]
+    arch = os.path.join(folder, ARCHIVE_DIR)
+    if os.path.isdir(arch):
+        items += [_stat(os.path.join(arch, n)) for n in sorted(os.listdir(arch))
+                  if n.endswith(".idx.json") and (not symbol or n.startswith(symbol + "_"))]
+    items += [_stat(path) for _, _, path in journal_files(folder, symbol)]
+    return sorted(items)
+
+
+def engine_fingerprint():
+    h = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_SOURCES:
+        with open(os.path.join(here, name), "rb") as fh:
+            h.update(fh.read())
+    return h.hexdigest()
+
+
+def run_key(folder, params, bars=None):
+    """Registry key for backtesting `folder` with `params` (dict); bars = bar file path or None"""
+    params = {k: params.get(k, v) for k, v in DEFAULTS.items()}
+    if not bars:
+        params.pop("bar_tolerance")       # only matters when bars are joined
+    payload = {
+        "manifest": snapshot_manifest(folder),
+        "bars": _stat(bars) if bars else None,
+        "params": params,
+        "engine": engine_fingerprint(),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# ---------- Store ----------
+def run_dir(key, registry=REGISTRY_DIR):
+    return os.path.join(registry, key)
+
+
+def _write_frame(df, path_stem):
+    if HAVE_PARQUET:
+        df.to_parquet(path_stem + ".parquet", index=False)
+    else:
+        df.to_csv(path_stem + ".csv.gz", index=False, compression="gzip")
+
+
+def _read_frame(path_stem):
+    if os.path.exists(path_stem + ".parquet"):
+        return pd.read_parquet(path_stem + ".parquet")
+    if os.path.exists(path_stem + ".csv.gz"):
+        return pd.read_csv(path_stem + ".csv.gz")
+    return None
+
+
+def store_run(key, result, params, registry=REGISTRY_DIR, refresh=False):
+    """
+    Persist a backtest result (or None = no trades) under `key`.
+    - refresh: replace a run already stored under `key`. The old run is
+      renamed aside first; between the two renames `key` itself is missing,
+      and load_run then reads the aside copy.
+    """
+    final = run_dir(key, registry)
+    tmp = f"{final}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    if result is not None:
+        _write_frame(result["trades"], os.path.join(tmp, "trades"))
+        _write_frame(result["daily"], os.path.join(tmp, "daily"))
+    meta = {"key": key, "params": params, "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "metrics": result["metrics"] if result is not None else None}
+    with open(os.path.join(tmp, "metrics.json"), "w") as fh:
+        json.dump(meta, fh, indent=1)
+    old = None
+    if refresh and os.path.isdir(final):
+        old = f"{final}.tmp-old{os.getpid()}"      # ".tmp" so list_runs skips it
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(final, old)
+    try:
+        os.replace(tmp, final)
+    except OSError:     # another process stored the same key first; results are identical
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def load_run(key, registry=REGISTRY_DIR):
+    """
+    Stored run for `key`: (found, result) where result is the backtest return
+    value ({"trades", "daily", "metrics"} or None for a run without trades).
+    While a refresh (store_run) has the previous run renamed aside, that copy is read.
+    """
+    final = run_dir(key, registry)
+    for _ in range(2):      # the aside copy may be removed while we read it: retry the new run once
+        candidates = [final] + sorted(glob.glob(f"{glob.escape(final)}.tmp-old*"))
+        path = next((c for c in candidates if os.path.exists(os.path.join(c, "metrics.json"))), None)
+        if path is None:
+            return False, None
+        try:
+            with open(os.path.join(path, "metrics.json")) as fh:
+                meta = json.load(fh)
+            if meta["metrics"] is None:
+                return True, None
+            return True, {"trades": _read_frame(os.path.join(path, "trades")),
+                          "daily": _read_frame(os.path.join(path, "daily")),
+                          "metrics": meta["metrics"]}
+        except FileNotFoundError:
+            continue
+    return False, None
+
+
+def list_runs(registry=REGISTRY_DIR):
+    """All stored runs as a DataFrame: key, created, params, metrics"""
+    rows = []
+    if os.path.isdir(registry):
+        for key in sorted(os.listdir(registry)):
+            meta_path = os.path.join(registry, key, "metrics.json")
+            if ".tmp" in key or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+            rows.append({"key": key, "created": meta["created"], **meta["params"], **(meta["metrics"] or {})})
+    return pd.DataFrame(rows)
+
+
+# ---------- Cached backtest ----------
+def cached_backtest(folder, registry=REGISTRY_DIR, bars=None, refresh=False, verbose=True, **params):
+    """
+    engine3.backtest through the registry.
+    - bars: path of a bar file to join (part of the key)
+    - refresh: recompute and overwrite even if cached
+    - params: sl, rr, riskpct, maxtrades, side, signal, signal_mode, bar_tolerance
+    Returns (result, cached)
+    """
+    params = {k: params.get(k, v) for k, v in DEFAULTS.items()}
+    key = run_key(folder, params, bars)
+    if not refresh:
+        found, result = load_run(key, registry)
+        if found:
+            if verbose:
+                print(f"Cached run {key[:12]} ({registry})")
+            return result, True
+
+    from engine3 import backtest
+    from asof_join import read_bars
+    result = backtest(folder, params["sl"], params["rr"], params["riskpct"], params["maxtrades"], params["side"],
+                      export_csv=False, bars=read_bars(bars) if bars else None, signal=params["signal"],
+                      signal_mode=params["signal_mode"], bar_tolerance=params["bar_tolerance"], show_plots=False)
+    store_run(key, result, params, registry, refresh=refresh)
+    if verbose:
+        print(f"Stored run {key[:12]} ({registry})")
+    return result, False
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Content-addressed backtest run registry")
+    ap.add_argument("--registry", default=REGISTRY_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="backtest, or return the cached result")
+    r.add_argument("--snapshots", default="./snapshots")
+    r.add_argument("--bars", default=None)
+    r.add_argument("--sl", type=float, default=DEFAULTS["sl"])
+    r.add_argument("--rr", type=float, default=DEFAULTS["rr"])
+    r.add_argument("--riskpct", type=float, default=DEFAULTS["riskpct"])
+    r.add_argument("--maxtrades", type=int, default=DEFAULTS["maxtrades"])
+    r.add_argument("--side", choices=["AUTO", "CE", "PE"], default="AUTO")
+    r.add_argument("--signal", default=None)
+    r.add_argument("--signal-mode", choices=["all", "vote", "first"], default="all")
+    r.add_argument("--bar-tolerance", default=DEFAULTS["bar_tolerance"],
+                   help='with --bars: ignore bars closed longer ago than this before a snapshot, e.g. "30min"')
+    r.add_argument("--refresh", action="store_true")
+    sub.add_parser("list")
+    s = sub.add_parser("show")
+    s.add_argument("--key", required=True, help="full key or unique prefix")
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        res, _ = cached_backtest(args.snapshots, args.registry, bars=args.bars, refresh=args.refresh,
+                                 sl=args.sl, rr=args.rr, riskpct=args.riskpct, maxtrades=args.maxtrades,
+                                 side=args.side, signal=args.signal, signal_mode=args.signal_mode,
+                                 bar_tolerance=args.bar_tolerance)
+        print(json.dumps(res["metrics"], indent=1) if res else "No trades executed.")
+    elif args.cmd == "list":
+        df = list_runs(args.registry)
+        print(df.to_string(index=False) if not df.empty else "Registry is empty.")
+    else:
+        df = list_runs(args.registry)
+        keys = [k for k in df.get("key", []) if k.startswith(args.key)]
+        if len(keys) != 1:
+            raise SystemExit(f"{len(keys)} runs match '{args.key}'")
+        _, res = load_run(keys[0], args.registry)
+        if res is None:
+            print("No trades executed.")
+        else:
+            print(json.dumps(res["metrics"], indent=1))
+            print(res["trades"].tail())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+signals.py
+
+Pluggable, vectorised entry/direction signals for the backtest engines.
+
+A signal is a function `f(market, **params) -> np.int8 array` evaluated once
+over the whole preloaded history: +1 = buy CE, -1 = buy PE, 0 = no entry.
+`market` is the per-snapshot frame from `market_frame()` (ATM fields, chain
+OI totals and, when bars are joined, Spot/Ret/Volume).
+
+Built-in signals (SIGNALS registry):
+- oi_side           the historical AUTO rule: CE if ATM CE_OI > PE_OI else PE
+- ce / pe           always CE / always PE
+- pcr               chain PCR above `high` -> CE, below `low` -> PE
+- oi_momentum       ATM put OI building faster than call OI over `lookback` -> CE (and vice versa)
+- premium_breakout  ATM premium closing above its prior `lookback` high -> that side
+
+Signals compose with `combine()`; on the CLI a spec like
+    "pcr:low=0.8,high=1.2+oi_momentum:lookback=3"
+is parsed by `parse_signal()` and combined with --signal-mode all|vote|first.
+
+Register a new signal with the @signal("name", history=...) decorator;
+`history` is how many prior snapshots the signal reads at each row, so a
+resumed backtest (backtest_checkpoint.py) knows how much context to reload.
+"""
+
+import inspect
+import numpy as np
+import pandas as pd
+
+SIGNALS = {}
+HISTORY = {}
+
+
+def signal(name, history=None):
+    """
+    Decorator registering a signal function under `name`
+    - history: prior snapshots the signal reads at each row: an int, or the
+      name of the parameter holding it (e.g. "lookback"); None = unknown
+    """
+    def deco(fn):
+        SIGNALS[name] = fn
+        HISTORY[name] = history
+        return fn
+    return deco
+
+
+# ---------- Market frame ----------
+def market_frame(hist, atm=None, under=None):
+    """
+    Per-snapshot inputs for signals, built from a ChainHistory in one pass.
+    - atm: result of hist.atm() (computed if None)
+    - under: joined underlying frame from asof_join.join_underlying (optional)
+    Columns: Time, valid, ATM_Strike, CE_LTP, PE_LTP, CE_OI, PE_OI (ATM row),
+             Total_CE_OI, Total_PE_OI (whole chain) [+ Spot, Ret, Volume]
+    """
+    atm = atm if atm is not None else hist.atm()
+    n = len(hist)
+    seg = np.repeat(np.arange(n), hist.counts)
+    out = pd.DataFrame({
+        "Time": hist.times,
+        "valid": atm["valid"],
+        "ATM_Strike": atm["Strike"],
+        "CE_LTP": atm["CE_LTP"],
+        "PE_LTP": atm["PE_LTP"],
+        "CE_OI": atm["CE_OI"],
+        "PE_OI": atm["PE_OI"],
+        "Total_CE_OI": np.bincount(seg, weights=hist.columns["CE_OI"], minlength=n),
+        "Total_PE_OI": np.bincount(seg, weights=hist.columns["PE_OI"], minlength=n),
+    })
+    if under is not None:
+        for col in ("Spot", "Ret", "Volume"):
+            out[col] = under[col].to_numpy()
+    return out
+
+
+def _direction(cond_ce, cond_pe, valid):
+    d = np.zeros(len(valid), dtype=np.int8)
+    d[np.asarray(cond_ce, dtype=bool)] = 1
+    d[np.asarray(cond_pe, dtype=bool)] = -1
+    d[~np.asarray(valid, dtype=bool)] = 0
+    return d
+
+
+# ---------- Built-in signals ----------
+@signal("oi_side", history=0)
+def oi_side(market):
+    ce = market["CE_OI"].to_numpy() > market["PE_OI"].to_numpy()
+    return _direction(ce, ~ce, market["valid"])
+
+
+@signal("ce", history=0)
+def always_ce(market):
+    return _direction(np.ones(len(market), dtype=bool), np.zeros(len(market), dtype=bool), market["valid"])
+
+
+@signal("pe", history=0)
+def always_pe(market):
+    return _direction(np.zeros(len(market), dtype=bool), np.ones(len(market), dtype=bool), market["valid"])
+
+
+@signal("pcr", history=0)
+def pcr_threshold(market, low=0.8, high=1.2):
+    ce_oi = market["Total_CE_OI"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pcr = np.where(ce_oi > 0, market["Total_PE_OI"].to_numpy(dtype=float) / ce_oi, np.nan)
+    return _direction(pcr > float(high), pcr < float(low), market["valid"])
+
+
+@signal("oi_momentum", history="lookback")
+def oi_momentum(market, lookback=5, min_change=0.0):
+    lookback = int(lookback)
+    ce = market["CE_OI"].where(market["valid"]).ffill()
+    pe = market["PE_OI"].where(market["valid"]).ffill()
+    build = (pe.diff(lookback) - ce.diff(lookback)).to_numpy()
+    return _direction(build > float(min_change), build < -float(min_change), market["valid"])
+
+
+@signal("premium_breakout", history="lookback")
+def premium_breakout(market, lookback=5):
+    lookback = int(lookback)
+    ce = market["CE_LTP"].where(market["valid"])
+    pe = market["PE_LTP"].where(market["valid"])
+    ce_high = ce.shift(1).rolling(lookback, min_periods=lookback).max()
+    pe_high = pe.shift(1).rolling(lookback, min_periods=lookback).max()
+    up_ce = (ce > ce_high).to_numpy()
+    up_pe = (pe > pe_high).to_numpy()
+    # both premiums breaking out at once is a volatility pop, not a direction
+    return _direction(up_ce & ~up_pe, up_pe & ~up_ce, market["valid"])
+
+
+# ---------- Composition ----------
+def combine(directions, how="all"):
+    """
+    Combine several direction arrays.
+    - all:   enter only where every signal agrees on a side
+    - vote:  sign of the sum (ties -> no entry)
+    - first: first non-zero signal wins
+    """
+    stack = np.vstack([np.asarray(d, dtype=np.int8) for d in directions])
+    if how == "all":
+        agree = np.all(stack == stack[0], axis=0)
+        return np.where(agree, stack[0], 0).astype(np.int8)
+    if how == "vote":
+        return np.sign(stack.astype(np.int32).sum(axis=0)).astype(np.int8)
+    if how == "first":
+        out = np.zeros(stack.shape[1], dtype=np.int8)
+        for d in stack[::-1]:
+            out = np.where(d != 0, d, out)
+        return out.astype(np.int8)
+    raise ValueError(f"Unknown combine mode: {how}")
+
+
+def _value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            continue
+    return text
+
+
+def parse_signal(spec):
+    """'pcr:low=0.8,high=1.2+oi_momentum' -> [(name, {params}), ...]"""
+    terms = []
+    for term in spec.split("+"):
+        name, _, args = term.strip().partition(":")
+        if name not in SIGNALS:
+            raise ValueError(f"Unknown signal '{name}'. Available: {', '.join(sorted(SIGNALS))}")
+        params = {}
+        for kv in filter(None, args.split(",")):
+            k, _, v = kv.partition("=")
+            params[k.strip()] = _value(v.strip())
+        terms.append((name, params))
+    return terms
+
+
+def evaluate(spec, market, how="all"):
+    """Evaluate a signal spec (string or list of (name, params)) over the market frame"""
+    terms = parse_signal(spec) if isinstance(spec, str) else spec
+    dirs = [SIGNALS[name](market, **params) for name, params in terms]
+    return dirs[0] if len(dirs) == 1 else combine(dirs, how)
+
+
+def history(spec):
+    """Prior snapshots a signal spec needs at each row (max over its terms); None if any is unknown"""
+    terms = parse_signal(spec) if isinstance(spec, str) else spec
+    need = 0
+    for name, params in terms:
+        h = HISTORY.get(name)
+        if h is None:
+            return None
+        if isinstance(h, str):
+            h = int(params.get(h, inspect.signature(SIGNALS[name]).parameters[h].default))
+        need = max(need, h)
+    return need
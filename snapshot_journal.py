@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+snapshot_journal.py
+
+Crash-safe append-only ingestion journal for option-chain snapshots.
+
+Features:
+- One journal per symbol per day: journal/SYMBOL_YYYYMMDD.journal inside the
+  snapshot folder, instead of one CSV file per poll.
+- Each record is length-prefixed and CRC32-checked:
+      <u32 length> <u32 crc32> <u8 flags> <u8 name length> name  body
+  where body is the snapshot CSV (zlib-compressed when flags & 1) and the CRC
+  covers everything after the CRC field.
+- Every record is handed to the OS as it is appended (visible to readers at
+  once); fsync runs every `fsync_every` records or `fsync_secs` seconds, on
+  close and when the collector goes idle (market closed), so a power loss
+  costs at most the records since the last fsync and never corrupts earlier ones.
+- Recovery on open: the file is scanned and truncated to the last valid
+  record, so a torn tail from a crash or power loss is dropped automatically.
+- Readers stream records in order (one record in memory at a time; name-only
+  scans read just the headers) and stop at a torn tail without modifying the
+  file (safe while the collector is still appending).
+- ChainHistory.from_folder reads journaled snapshots next to loose CSVs and
+  archives; `export` writes them out as loose CSVs for other tools.
+
+Usage:
+    python engine3.py --mode paper --store journal --snapshots ./snapshots
+    python snapshot_journal.py list --snapshots ./snapshots
+    python snapshot_journal.py verify --snapshots ./snapshots     # truncate torn tails (collector stopped)
+    python snapshot_journal.py export --snapshots ./snapshots     # write records out as loose CSVs
+"""
+
+import io
+import os
+import time
+import zlib
+import struct
+import argparse
+import pandas as pd
+
+JOURNAL_DIR = "journal"
+MAGIC = b"SJOURNL1"
+RECORD_HEAD = struct.Struct("<IIBB")      # length (after crc), crc32, flags, name length
+FLAG_ZLIB = 1
+
+
+def journal_path(folder, symbol, day):
+    """journal/SYMBOL_YYYYMMDD.journal under `folder`"""
+    return os.path.join(folder, JOURNAL_DIR, f"{symbol}_{day}.journal")
+
+
+def journal_files(folder, symbol=None):
+    """[(symbol, day, path)] of the journals in `folder`, in day order"""
+    jdir = os.path.join(folder, JOURNAL_DIR)
+    if not os.path.isdir(jdir):
+        return []
+    out = []
+    for n in os.listdir(jdir):
+        if not n.endswith(".journal"):
+            continue
+        sym, day = n[:-len(".journal")].rsplit("_", 1)
+        if not symbol or sym == symbol:
+            out.append((sym, day, os.path.join(jdir, n)))
+    return sorted(out, key=lambda x: (x[1], x[0]))
+
+
+# ---------- Record codec ----------
+def encode_record(name, body, compress=True):
+    name_b = name.encode()
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    rest = bytes([flags, len(name_b)]) + name_b + body
+    return struct.pack("<II", len(rest), zlib.crc32(rest)) + rest
+
+
+def scan(path, payload=True, verify=True):
+    """
+    Yield (offset, name, body_or_None, end_offset, crc) for each record, in
+    order, stopping at the first torn or corrupt record. Records are read one
+    at a time (header, then body or a seek past it), never the whole file.
+    - payload: False skips body decoding
+    - verify: False also skips the CRC check, so only the record headers and
+      names are read (a torn tail is still detected from the lengths)
+    """
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size      # records appended meanwhile are left for the next scan
+        head = fh.read(len(MAGIC))
+        if head != MAGIC:
+            if len(head) < len(MAGIC) and MAGIC.startswith(head):
+                return        # torn while writing the magic
+            raise ValueError(f"{path} is not a snapshot journal")
+        pos = len(MAGIC)
+        while pos + RECORD_HEAD.size <= size:
+            length, crc, flags, nlen = RECORD_HEAD.unpack(fh.read(RECORD_HEAD.size))
+            end = pos + 8 + length
+            if length < 2 + nlen or end > size:
+                return
+            body = None
+            if payload or verify:
+                rest = fh.read(length - 2)
+                if zlib.crc32(rest, zlib.crc32(bytes([flags, nlen]))) != crc:
+                    return
+                name = rest[:nlen].decode()
+                if payload:
+                    body = rest[nlen:]
+                    if flags & FLAG_ZLIB:
+                        body = zlib.decompress(body)
+            else:
+                name = fh.read(nlen).decode(errors="replace")
+                fh.seek(end)
+            yield pos, name, body, end, crc
+            pos = end
+
+
+def recover(path):
+    """
+    Truncate `path` to its last valid record.
+    Returns (valid records, bytes dropped).
+    """
+    size = os.path.getsize(path)
+    good, count = len(MAGIC), 0
+    for _, _, _, end, _ in scan(path, payload=False):
+        good, count = end, count + 1
+    if size < len(MAGIC):
+        good = 0          # torn magic: start the file again
+    if good < size:
+        with open(path, "r+b") as fh:
+            fh.truncate(good)
+            fh.flush()
+            os.fsync(fh.fileno())
+    return count, size - good
+
+
+# ---------- Writer ----------
+class SnapshotJournal:
+    """
+    Append-only journal writer for one symbol (rolls to a new file per day).
+    - folder: snapshot folder (journals go to folder/journal/)
+    - fsync_every / fsync_secs: fsync after this many records or seconds
+    - compress: zlib-compress record bodies
+    - buffer: userspace write buffer (bytes); flushed after every record
+    """
+
+    def __init__(self, folder, symbol, fsync_every=10, fsync_secs=30.0, compress=True, buffer=1 << 20):
+        self.folder = folder
+        self.symbol = symbol
+        self.fsync_every = fsync_every
+        self.fsync_secs = fsync_secs
+        self.compress = compress
+        self.buffer = buffer
+        self.fh = None
+        self.day = None
+        self.path = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        os.makedirs(os.path.join(folder, JOURNAL_DIR), exist_ok=True)
+
+    def _open(self, day):
+        self.close()
+        self.day = day
+        self.path = journal_path(self.folder, self.symbol, day)
+        if os.path.exists(self.path):
+            count, dropped = recover(self.path)
+            if dropped:
+                print(f"Journal {self.path}: dropped {dropped} torn byte(s) after {count} record(s)")
+        fresh = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.fh = open(self.path, "ab", buffering=self.buffer)
+        if fresh:
+            self.fh.write(MAGIC)
+
+    def append(self, name, df):
+        """Append one snapshot (DataFrame or CSV bytes) named SYMBOL_YYYYMMDD_HHMMSS.csv"""
+        day = name.split("_")[1]
+        if day != self.day:
+            self._open(day)
+        body = df if isinstance(df, bytes) else df.to_csv(index=False).encode()
+        self.fh.write(encode_record(name, body, self.compress))
+        self.fh.flush()        # readers see the record now; durability waits for sync()
+        self.pending += 1
+        if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_secs:
+            self.sync()
+        return self.path
+
+    def sync(self):
+        """fsync records appended since the last sync (also call when going idle)"""
+        if self.fh is not None and self.pending:
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self.fh is not None:
+            self.sync()
+            self.fh.close()
+            self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- Readers ----------
+def iter_journal(path):
+    """Yield (snapshot_name, CSV bytes) of one journal in append order"""
+    for _, name, body, _, _ in scan(path):
+        yield name, body
+
+
+def iter_journaled(folder, symbol=None, since_day=None):
+    """Yield (snapshot_name, DataFrame) for every journaled snapshot, in time order
+    (since_day: 'YYYYMMDD', skip journals of earlier days without reading them)"""
+    for sym, day, path in journal_files(folder, symbol):
+        if since_day and day < since_day:
+            continue
+        for name, body in iter_journal(path):
+            yield name, pd.read_csv(io.BytesIO(body))
+
+
+def journaled_names(folder, symbol=None, since_day=None):
+    """Snapshot names (SYMBOL_YYYYMMDD_HHMMSS.csv) held in journals (headers only)"""
+    return [name for _, day, path in journal_files(folder, symbol) if not since_day or day >= since_day
+            for _, name, _, _, _ in scan(path, payload=False, verify=False)]
+
+
+def journal_manifest(folder, upto=None, symbol=None):
+    """
+    Fingerprint items of the journals up to time key `upto` ('YYYYMMDD_HHMMSS...'):
+    [file, size, mtime_ns] for journals of earlier (closed) days, and
+    [name, record crc] for the boundary day's records up to `upto`, read from
+    the record headers only - appends after the boundary do not change it.
+    """
+    items = []
+    for _, day, path in journal_files(folder, symbol):
+        if upto and day > upto[:8]:
+            continue
+        if upto and day < upto[:8]:
+            st = os.stat(path)
+            items.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+            continue
+        for _, name, _, _, crc in scan(path, payload=False, verify=False):
+            if upto and name[name.find("_") + 1:] > upto:
+                break
+            items.append([name, crc])
+    return items
+
+
+def export_csv(folder, symbol=None, overwrite=False):
+    """Write journaled snapshots out as loose CSVs (atomically); returns the count written"""
+    done = 0
+    for sym, day, path in journal_files(folder, symbol):
+        for name, body in iter_journal(path):
+            out = os.path.join(folder, name)
+            if os.path.exists(out) and not overwrite:
+                continue
+            tmp = f"{out}.tmp{os.getpid()}"
+            with open(tmp, "wb") as fh:
+                fh.write(body)
+            os.replace(tmp, out)
+            done += 1
+    return done
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Inspect, repair and export snapshot journals")
+    ap.add_argument("cmd", choices=["list", "verify", "export"])
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--symbol", default=None)
+    ap.add_argument("--overwrite", action="store_true", help="export: replace existing CSVs")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        print(f"Exported {export_csv(args.snapshots, args.symbol, args.overwrite)} snapshot(s)")
+    else:
+        for sym, day, path in journal_files(args.snapshots, args.symbol):
+            if args.cmd == "verify":
+                count, dropped = recover(path)
+                print(f"{path}: {count} record(s), {dropped} torn byte(s) dropped")
+            else:
+                names = [n for _, n, _, _, _ in scan(path, payload=False, verify=False)]
+                span = f"{names[0]} .. {names[-1]}" if names else "empty"
+                print(f"{path}: {len(names)} record(s), {os.path.getsize(path)} bytes, {span}")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+snapshot_retention.py
+
+Retention and compaction for snapshot folders.
+
+Features:
+- Rolls every closed trading day's minute snapshots (SYMBOL_YYYYMMDD_HHMMSS.csv)
+  into one archive per symbol/day: archive/SYMBOL_YYYYMMDD.<gen>.csv.gz plus
+  an index sidecar (SYMBOL_YYYYMMDD.idx.json) naming the current data file and
+  the byte offset of each snapshot. Every
+  snapshot is its own gzip member (CSV with header), so one snapshot is read
+  with a seek and a single decompress.
+- Downsamples aged data to coarser intervals per RETENTION_POLICY, including
+  re-compacting archives that have aged into a coarser tier.
+- Safe while collection is running: today's files are never touched, archives
+  are written to a temp file and renamed before any source is deleted, and a
+  re-run finishes an interrupted compaction (late files are merged in).
+- Incremental: one os.scandir pass, grouping by file name; no per-file stat.
+- `prune_run_outputs()` keeps the newest N timestamped run outputs
+  (option-chain-pcr.py Excel/PNG) by name order rather than mtime.
+
+Usage:
+    python snapshot_retention.py --snapshots ./snapshots
+"""
+
+import os
+import io
+import gzip
+import json
+import argparse
+import datetime
+import pandas as pd
+
+ARCHIVE_DIR = "archive"
+
+# (age in days, keep one snapshot per this many seconds); the last tier whose
+# age is reached applies. Interval 0 keeps every snapshot, so the recent tier
+# retains whatever the collector polled (poll_scheduler's 15 s fast windows too).
+RETENTION_POLICY = [
+    (0, 0),
+    (30, 300),
+    (180, 900),
+]
+
+
+def _parse_name(name):
+    """SYMBOL_YYYYMMDD_HHMMSS.csv -> (symbol, 'YYYYMMDD', 'HHMMSS') or None"""
+    if not name.endswith(".csv"):
+        return None
+    parts = name[:-4].split("_")
+    if len(parts) != 3 or len(parts[1]) != 8 or len(parts[2]) != 6:
+        return None
+    if not (parts[1].isdigit() and parts[2].isdigit()):
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+def policy_interval(age_days, policy=RETENTION_POLICY):
+    """Sampling interval (seconds) for data `age_days` old"""
+    interval = policy[0][1]
+    for min_age, secs in policy:
+        if age_days >= min_age:
+            interval = secs
+    return interval
+
+
+def _downsample(times, interval):
+    """Keep the first snapshot of each `interval`-second bucket ('HHMMSS' strings, sorted); 0 keeps all"""
+    if not interval:
+        return list(times)
+    kept, last_bucket = [], None
+    for t in times:
+        secs = int(t[:2]) * 3600 + int(t[2:4]) * 60 + int(t[4:6])
+        bucket = secs // interval
+        if bucket != last_bucket:
+            kept.append(t)
+            last_bucket = bucket
+    return kept
+
+
+def archive_paths(folder, symbol, day):
+    """(data path of the committed archive or None, index path)"""
+    idx_path = os.path.join(folder, ARCHIVE_DIR, f"{symbol}_{day}.idx.json")
+    if not os.path.exists(idx_path):
+        return None, idx_path
+    return os.path.join(folder, ARCHIVE_DIR, load_index(idx_path)["data"]), idx_path
+
+
+def load_index(idx_path):
+    with open(idx_path) as fh:
+        return json.load(fh)
+
+
+# ---------- Archive read/write ----------
+def write_archive(folder, symbol, day, snapshots, interval):
+    """
+    Write {HHMMSS: csv_bytes} as one archive (one gzip member per snapshot).
+    Each rewrite goes to a new generation file; the index rename is the commit
+    point, so readers always see a matching index/data pair. The previous
+    generation is removed afterwards.
+    """
+    old_path, idx_path = archive_paths(folder, symbol, day)
+    gen = load_index(idx_path).get("generation", 0) + 1 if old_path else 1
+    data_name = f"{symbol}_{day}.{gen}.csv.gz"
+    gz_path = os.path.join(folder, ARCHIVE_DIR, data_name)
+    os.makedirs(os.path.dirname(gz_path), exist_ok=True)
+    entries, offset = [], 0
+    tmp = gz_path + ".tmp"
+    with open(tmp, "wb") as fh:
+        for t in sorted(snapshots):
+            member = gzip.compress(snapshots[t], compresslevel=6)
+            fh.write(member)
+            entries.append({"time": t, "offset": offset, "length": len(member)})
+            offset += len(member)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, gz_path)
+
+    index = {"symbol": symbol, "date": day, "interval": interval, "generation": gen,
+             "data": data_name, "snapshots": entries}
+    tmp = idx_path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(index, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, idx_path)
+    if old_path and old_path != gz_path:
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return index
+
+
+def read_archive_raw(folder, symbol, day):
+    """{HHMMSS: csv_bytes} for every snapshot in an archive"""
+    gz_path, idx_path = archive_paths(folder, symbol, day)
+    index = load_index(idx_path)
+    out = {}
+    with open(gz_path, "rb") as fh:
+        for e in index["snapshots"]:
+            fh.seek(e["offset"])
+            out[e["time"]] = gzip.decompress(fh.read(e["length"]))
+    return out
+
+
+def read_snapshot(folder, symbol, day, hhmmss):
+    """One archived snapshot as a DataFrame (seek + one gzip member)"""
+    gz_path, idx_path = archive_paths(folder, symbol, day)
+    for e in load_index(idx_path)["snapshots"]:
+        if e["time"] == hhmmss:
+            with open(gz_path, "rb") as fh:
+                fh.seek(e["offset"])
+                return pd.read_csv(io.BytesIO(gzip.decompress(fh.read(e["length"]))))
+    raise KeyError(f"{symbol}_{day}_{hhmmss} not in archive")
+
+
+def iter_archived(folder, symbol=None, since_day=None):
+    """Yield (snapshot_name, DataFrame) for every archived snapshot, in time order
+    (since_day: 'YYYYMMDD', skip archives of earlier days without reading them)"""
+    arch = os.path.join(folder, ARCHIVE_DIR)
+    if not os.path.isdir(arch):
+        return
+    names = sorted(n for n in os.listdir(arch) if n.endswith(".idx.json"))
+    for n in names:
+        sym, day = n[:-len(".idx.json")].rsplit("_", 1)
+        if symbol and sym != symbol:
+            continue
+        if since_day and day < since_day:
+            continue
+        for t, raw in read_archive_raw(folder, sym, day).items():
+            yield f"{sym}_{day}_{t}.csv", pd.read_csv(io.BytesIO(raw))
+
+
+def archived_names(folder, symbol=None):
+    """Snapshot names (SYMBOL_YYYYMMDD_HHMMSS.csv) held in archives"""
+    arch = os.path.join(folder, ARCHIVE_DIR)
+    if not os.path.isdir(arch):
+        return []
+    names = []
+    for n in sorted(os.listdir(arch)):
+        if not n.endswith(".idx.json"):
+            continue
+        sym, day = n[:-len(".idx.json")].rsplit("_", 1)
+        if symbol and sym != symbol:
+            continue
+        names.extend(f"{sym}_{day}_{e['time']}.csv" for e in load_index(os.path.join(arch, n))["snapshots"])
+    return names
+
+
+# ---------- Compaction ----------
+def scan_loose(folder):
+    """{(symbol, day): [HHMMSS, ...]} for loose snapshot CSVs (single scandir pass)"""
+    groups = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            parsed = _parse_name(entry.name)
+            if parsed and entry.is_file():
+                groups.setdefault((parsed[0], parsed[1]), []).append(parsed[2])
+    return groups
+
+
+def compact(folder, today=None, policy=RETENTION_POLICY, dry_run=False, verbose=True):
+    """
+    Archive closed days and re-sample aged archives. Returns a stats dict.
+    - today: date treated as 'open' (never touched); defaults to date.today()
+    """
+    today = today or datetime.date.today()
+    stats = {"days_archived": 0, "files_removed": 0, "days_resampled": 0}
+
+    for (symbol, day), times in sorted(scan_loose(folder).items()):
+        d = datetime.datetime.strptime(day, "%Y%m%d").date()
+        if d >= today:
+            continue   # collection may still be writing this day
+        interval = policy_interval((today - d).days, policy)
+        gz_path, idx_path = archive_paths(folder, symbol, day)
+
+        snaps = {}
+        if gz_path:   # finish an interrupted run / merge late files
+            snaps.update(read_archive_raw(folder, symbol, day))
+            interval = max(interval, load_index(idx_path).get("interval", interval))
+        for t in times:
+            if t not in snaps:
+                with open(os.path.join(folder, f"{symbol}_{day}_{t}.csv"), "rb") as fh:
+                    snaps[t] = fh.read()
+        keep = set(_downsample(sorted(snaps), interval))
+        snaps = {t: b for t, b in snaps.items() if t in keep}
+
+        if verbose:
+            print(f"{symbol} {day}: {len(times)} loose file(s) -> archive of {len(snaps)} snapshot(s) "
+                  f"@ {f'{interval}s' if interval else 'full resolution'}")
+        if dry_run:
+            continue
+        write_archive(folder, symbol, day, snaps, interval)
+        # sources go only after the archive + index are durable
+        for t in times:
+            try:
+                os.remove(os.path.join(folder, f"{symbol}_{day}_{t}.csv"))
+                stats["files_removed"] += 1
+            except FileNotFoundError:
+                pass
+        stats["days_archived"] += 1
+
+    # archives that aged into a coarser tier
+    arch = os.path.join(folder, ARCHIVE_DIR)
+    if os.path.isdir(arch):
+        for n in sorted(os.listdir(arch)):
+            if not n.endswith(".idx.json"):
+                continue
+            symbol, day = n[:-len(".idx.json")].rsplit("_", 1)
+            index = load_index(os.path.join(arch, n))
+            age = (today - datetime.datetime.strptime(day, "%Y%m%d").date()).days
+            interval = policy_interval(age, policy)
+            if interval <= index.get("interval", 0):
+                continue
+            snaps = read_archive_raw(folder, symbol, day)
+            keep = set(_downsample(sorted(snaps), interval))
+            if verbose:
+                print(f"{symbol} {day}: resample {len(snaps)} -> {len(keep)} snapshot(s) @ {interval}s")
+            if not dry_run:
+                write_archive(folder, symbol, day, {t: b for t, b in snaps.items() if t in keep}, interval)
+                stats["days_resampled"] += 1
+    return stats
+
+
+# ---------- Run-output pruning ----------
+def prune_run_outputs(folder, patterns, keep_runs):
+    """
+    Keep the newest `keep_runs` files per (prefix, suffix) pattern, newest by the
+    timestamp embedded in the name (no stat per file). Files that vanish
+    concurrently are ignored. Returns the list of removed paths.
+    - patterns: list of (prefix, suffix), e.g. [("nifty_option_chain_", ".xlsx")]
+    """
+    removed = []
+    with os.scandir(folder) as it:
+        names = [e.name for e in it]
+    for prefix, suffix in patterns:
+        matched = sorted(n for n in names if n.startswith(prefix) and n.endswith(suffix))
+        for n in matched[:-keep_runs] if keep_runs > 0 else matched:
+            path = os.path.join(folder, n)
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compact closed days of snapshots into indexed archives")
+    ap.add_argument("--snapshots", default="./snapshots")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    print(compact(args.snapshots, dry_run=args.dry_run))
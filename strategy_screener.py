@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+strategy_screener.py
+
+Rank every straddle, strangle, vertical spread and iron condor available in
+one snapshot's chain, priced at market premiums.
+
+Features:
+- Candidates are index arrays into the expiry's strike ladder (one row per
+  combination, one column per leg), so pricing, Greeks and the exact expiry
+  payoff are computed for all of them at once with numpy.
+- Expiry analysis is the batched form of strategy_builder_greeks.expiry_payoff:
+  PnL is evaluated only at S=0 and at the leg strikes, tail slopes give
+  unlimited profit/loss, breakevens are solved per linear segment.
+- Scores: net cost (positive = debit), max profit / max loss, reward:risk
+  (NaN when profit or loss is unlimited or nothing is at risk; such
+  candidates rank last), breakeven range and width, net Delta/Gamma/Theta/Vega (from the
+  snapshot's Greek columns, or computed with chain_greeks.add_greeks; NaN
+  where no IV could be solved for a leg's premium).
+- Families: long/short straddle, long/short strangle, bull/bear call and put
+  verticals, short iron condor (symmetric wings up to --max-wing strikes).
+- Chains come from a snapshot CSV, or from a price_cube.py cube (--cube with
+  --at): the snapshot's strikes are read from the shared memory map.
+
+Usage:
+    python strategy_screener.py --chain snapshots/BANKNIFTY_20250905_101500.csv --sort reward_risk --top 20
+    python strategy_screener.py --chain snap.csv --family iron_condor --min-loss -20000 --out condors.csv
+    python strategy_screener.py --cube ./cube_banknifty --at "2025-09-05 10:15" --family short_strangle
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from chain_frame import load_chain, expiry_codes, expiry_date
+from chain_greeks import add_greeks, implied_spot, snapshot_time_from_filename
+
+GREEKS = ("Delta", "Gamma", "Theta", "Vega")
+
+# family -> (leg types, leg quantities: +1 BUY / -1 SELL), legs listed in strike order
+FAMILIES = {
+    "long_straddle": (("PUT", "CALL"), (1, 1)),
+    "short_straddle": (("PUT", "CALL"), (-1, -1)),
+    "long_strangle": (("PUT", "CALL"), (1, 1)),
+    "short_strangle": (("PUT", "CALL"), (-1, -1)),
+    "bull_call_spread": (("CALL", "CALL"), (1, -1)),
+    "bear_call_spread": (("CALL", "CALL"), (-1, 1)),
+    "bull_put_spread": (("PUT", "PUT"), (1, -1)),
+    "bear_put_spread": (("PUT", "PUT"), (-1, 1)),
+    "iron_condor": (("PUT", "PUT", "CALL", "CALL"), (1, -1, -1, 1)),
+}
+# (put leg, call leg) columns that must straddle spot
+OTM_LEGS = {"long_strangle": (0, 1), "short_strangle": (0, 1), "iron_condor": (1, 2)}
+
+
+# ---------- Chain ----------
+def expiry_ladder(df, expiry="front"):
+    """Rows of one expiry sorted by strike ("front" = nearest expiry in the snapshot)"""
+    codes = df["Expiry"].to_numpy() if np.issubdtype(df["Expiry"].dtype, np.integer) else expiry_codes(df["Expiry"])
+    code = codes.min() if expiry == "front" else int(expiry_codes([expiry])[0])
+    out = df[codes == code].sort_values("Strike").reset_index(drop=True)
+    return out, expiry_date(code)
+
+
+# ---------- Enumeration ----------
+def _pairs(n):
+    i, j = np.triu_indices(n, k=1)
+    return np.column_stack([i, j])
+
+
+def enumerate_candidates(n, families=None, max_wing=10):
+    """{family: (m, legs) int array of strike indices} for a ladder of n strikes"""
+    families = families or list(FAMILIES)
+    out = {}
+    pairs = _pairs(n)
+    for fam in families:
+        if fam.endswith("straddle"):
+            idx = np.repeat(np.arange(n)[:, None], 2, axis=1)
+        elif fam == "iron_condor":
+            blocks = []
+            for w in range(1, max_wing + 1):
+                ok = (pairs[:, 0] - w >= 0) & (pairs[:, 1] + w < n)
+                p = pairs[ok]
+                blocks.append(np.column_stack([p[:, 0] - w, p[:, 0], p[:, 1], p[:, 1] + w]))
+            idx = np.concatenate(blocks) if blocks else np.zeros((0, 4), dtype=int)
+        else:
+            idx = pairs
+        out[fam] = idx
+    return out
+
+
+# ---------- Batched expiry payoff ----------
+def batch_expiry_payoff(strikes, is_call, qty, cost):
+    """
+    Exact expiry analysis for many strategies at once.
+    - strikes, is_call, qty: (m, legs) arrays; cost: (m,) net premium paid
+    Returns dict of (m,) arrays: max_profit, max_loss (+/-inf when unbounded),
+    be_low, be_high (NaN if none), slope_left, slope_right.
+    """
+    order = np.argsort(strikes, axis=1, kind="stable")
+    ks = np.take_along_axis(strikes, order, axis=1)
+    qs = np.take_along_axis(qty, order, axis=1)
+    m = len(ks)
+    slope_left = -(qty * ~is_call).sum(axis=1)
+    slope_right = (qty * is_call).sum(axis=1)
+
+    xs = np.concatenate([np.zeros((m, 1)), ks], axis=1)                      # breakpoints (m, L+1)
+    S = xs[:, :, None]
+    K = strikes[:, None, :]
+    payoff = np.where(is_call[:, None, :], np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    vals = (qty[:, None, :] * payoff).sum(axis=2) - cost[:, None]
+
+    slopes = np.concatenate([slope_left[:, None], slope_left[:, None] + np.cumsum(qs, axis=1)], axis=1)
+    x1 = np.concatenate([ks, np.full((m, 1), np.inf)], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = xs - vals / slopes
+    ok = (slopes != 0) & (root >= xs) & (root < x1)
+    roots = np.where(ok, root, np.nan)
+    any_root = ok.any(axis=1)
+    with np.errstate(all="ignore"):
+        be_low = np.where(any_root, np.nanmin(np.where(ok, roots, np.inf), axis=1), np.nan)
+        be_high = np.where(any_root, np.nanmax(np.where(ok, roots, -np.inf), axis=1), np.nan)
+    return {
+        "max_profit": np.where(slope_right > 0, np.inf, vals.max(axis=1)),
+        "max_loss": np.where(slope_right < 0, -np.inf, vals.min(axis=1)),
+        "be_low": be_low,
+        "be_high": be_high,
+        "slope_left": slope_left,
+        "slope_right": slope_right,
+    }
+
+
+# ---------- Screening ----------
+def screen_chain(df, spot=None, asof=None, expiry="front", families=None, max_wing=10, rate_pct=6.0):
+    """
+    Score every candidate of `families` on one expiry of the chain.
+    - df: snapshot frame (raw or chain_frame.normalise_chain)
+    - spot: underlying (default: Spot column or put-call parity)
+    - asof: snapshot time, used only when Greeks must be computed
+    Returns DataFrame, one row per candidate: family, K1..K4, cost, max_profit,
+    max_loss, reward_risk, be_low, be_high, be_width, Delta, Gamma, Theta, Vega
+    (reward_risk is NaN unless max profit and max loss are both bounded and something is at risk)
+    """
+    ladder, exp = expiry_ladder(df, expiry)
+    if spot is None:
+        spot = float(ladder["Spot"].iloc[0]) if "Spot" in ladder.columns else implied_spot(ladder)
+    if "CE_Delta" not in ladder.columns:
+        ladder = add_greeks(ladder, spot=spot, asof=asof, rate_pct=rate_pct)
+
+    strike = ladder["Strike"].to_numpy(dtype=float)
+    side = {}
+    for typ, pre in (("CALL", "CE"), ("PUT", "PE")):
+        prem = ladder[f"{pre}_LTP"].to_numpy(dtype=float)
+        side[typ] = {"premium": np.where(prem > 0, np.round(prem, 2), np.nan)}
+        for g in GREEKS:
+            side[typ][g] = ladder[f"{pre}_{g}"].to_numpy(dtype=float)
+
+    frames = []
+    for fam, idx in enumerate_candidates(len(ladder), families, max_wing).items():
+        types, qtys = FAMILIES[fam]
+        if fam in OTM_LEGS:
+            # OTM structures: short/long put at or below spot, call at or above
+            p, c = OTM_LEGS[fam]
+            idx = idx[(strike[idx[:, p]] <= spot) & (strike[idx[:, c]] >= spot)]
+        if not len(idx):
+            continue
+        legs = len(types)
+        is_call = np.broadcast_to(np.array([t == "CALL" for t in types]), idx.shape)
+        qty = np.broadcast_to(np.array(qtys, dtype=float), idx.shape)
+        ks = strike[idx]
+        prem = np.where(is_call, side["CALL"]["premium"][idx], side["PUT"]["premium"][idx])
+        valid = np.isfinite(prem).all(axis=1)
+        idx, ks, prem, is_call, qty = idx[valid], ks[valid], prem[valid], is_call[valid], qty[valid]
+        if not len(idx):
+            continue
+        cost = (qty * prem).sum(axis=1)
+        pay = batch_expiry_payoff(ks, is_call, qty, cost)
+
+        res = {"family": fam}
+        for j in range(4):
+            res[f"K{j + 1}"] = ks[:, j] if j < legs else np.nan
+        res["cost"] = np.round(cost, 2)
+        res["max_profit"] = pay["max_profit"]
+        res["max_loss"] = pay["max_loss"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rr = pay["max_profit"] / -pay["max_loss"]
+        # unlimited profit or loss, or nothing at risk: no meaningful ratio; NaN ranks after bounded structures
+        bounded = np.isfinite(pay["max_loss"]) & (pay["max_loss"] < 0) & np.isfinite(pay["max_profit"])
+        res["reward_risk"] = np.where(bounded, rr, np.nan)
+        res["be_low"] = pay["be_low"]
+        res["be_high"] = pay["be_high"]
+        res["be_width"] = pay["be_high"] - pay["be_low"]
+        for g in GREEKS:
+            vals = np.where(is_call, side["CALL"][g][idx], side["PUT"][g][idx])
+            res[g] = (qty * vals).sum(axis=1)
+        frames.append(pd.DataFrame(res))
+
+    out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not out.empty:
+        out["family"] = out["family"].astype("category")
+    out.attrs.update({"spot": spot, "expiry": exp})
+    return out
+
+
+def rank(results, by="reward_risk", ascending=False, family=None, min_loss=None, top=None):
+    """
+    Filter and sort screener results (min_loss: worst acceptable max_loss, e.g. -20000).
+    NaN scores (e.g. reward_risk of unbounded structures) sort last either way.
+    """
+    out = results
+    if family:
+        out = out[out["family"].isin([family] if isinstance(family, str) else family)]
+    if min_loss is not None:
+        out = out[out["max_loss"] >= min_loss]
+    out = out.sort_values(by, ascending=ascending, kind="stable", na_position="last")
+    return out.head(top) if top else out
+
+
+def to_legs(row):
+    """Screener row -> leg dicts for strategy_builder_greeks (evaluate_strategy / expiry_payoff)"""
+    types, qtys = FAMILIES[row["family"]]
+    return [{"type": t, "strike": float(row[f"K{j + 1}"]), "qty": abs(q), "side": "BUY" if q > 0 else "SELL",
+             "premium": None} for j, (t, q) in enumerate(zip(types, qtys))]
+
+
+def describe(row):
+    types, qtys = FAMILIES[row["family"]]
+    return " / ".join(f"{'BUY' if q > 0 else 'SELL'} {'CE' if t == 'CALL' else 'PE'} {row[f'K{j + 1}']:g}"
+                      for j, (t, q) in enumerate(zip(types, qtys)))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rank strike combinations of a snapshot chain")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--chain", help="snapshot CSV")
+    src.add_argument("--cube", help="price_cube.py cube directory (with --at)")
+    ap.add_argument("--at", default=None, help="cube: screen the last snapshot at or before this time (default: latest)")
+    ap.add_argument("--spot", type=float, default=None)
+    ap.add_argument("--expiry", default="front")
+    ap.add_argument("--family", action="append", default=None, choices=list(FAMILIES))
+    ap.add_argument("--max-wing", type=int, default=10, help="iron condor wing width in strikes")
+    ap.add_argument("--rate", type=float, default=6.0)
+    ap.add_argument("--sort", default="reward_risk")
+    ap.add_argument("--ascending", action="store_true")
+    ap.add_argument("--min-loss", type=float, default=None, help="drop candidates whose max loss is below this")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default=None, help="write the full ranked table to CSV")
+    args = ap.parse_args()
+
+    if args.cube:
+        from price_cube import open_cube
+        cube = open_cube(args.cube)
+        i = cube.index_of(args.at) if args.at else len(cube) - 1
+        if i < 0:
+            raise SystemExit(f"No snapshot in {args.cube} at or before {args.at}")
+        df, label = cube.chain(i), cube.names[i]
+        asof = cube.times[i].item()
+    else:
+        df, label = load_chain(args.chain), os.path.basename(args.chain)
+        try:
+            asof = snapshot_time_from_filename(args.chain)
+        except (ValueError, IndexError):
+            asof = None
+    t0 = time.time()
+    res = screen_chain(df, spot=args.spot, asof=asof, expiry=args.expiry, families=args.family,
+                       max_wing=args.max_wing, rate_pct=args.rate)
+    elapsed = time.time() - t0
+    ranked = rank(res, args.sort, args.ascending, min_loss=args.min_loss)
+    print(f"{label}: expiry {res.attrs.get('expiry')}, spot {res.attrs.get('spot', 0):.2f}, "
+          f"{len(res)} candidates scored in {elapsed * 1000:.0f} ms")
+    top = ranked.head(args.top).copy()
+    if not top.empty:
+        top.insert(1, "legs", top.apply(describe, axis=1))
+        print(top.drop(columns=["K1", "K2", "K3", "K4"]).to_string(index=False))
+        print("reward_risk NaN: unlimited profit/loss or nothing at risk; Greek NaN: no IV could be solved "
+              "for a leg's premium")
+    if args.out:
+        ranked.to_csv(args.out, index=False)
+        print("Saved:", args.out)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+sweep_queue.py
+
+Durable, resumable parameter sweeps for engine3.backtest backed by SQLite.
+
+Features:
+- `init` enumerates the grid (sl x rr x riskpct x maxtrades x side/signal) into
+  a jobs table; re-running it only adds combinations that are not there yet
+  (and refuses a different snapshot folder / cube / bars / signal mode).
+- Any number of `work` processes (on one machine or several sharing the
+  filesystem) claim jobs atomically (BEGIN IMMEDIATE + lease). A heartbeat
+  thread renews the lease while the job runs, up to the job's wall-clock
+  budget (--max-runtime): a crashed worker's job is re-claimed once its lease
+  expires, a hung one once it has overrun its budget and the lease lapses.
+- Each finished job's metrics and daily PnL are committed as soon as it ends,
+  so a crash or reboot loses at most the jobs that were running.
+- `status` shows progress, throughput and ETA while workers run; `results`
+  prints/exports the finished grid ranked by a metric.
+- `init --cube` points the workers at a price_cube.py cube instead of the
+  snapshot CSVs: each worker maps the cube (shared page cache, no CSV parsing)
+  and backtests on the cube's expiry only.
+
+The database uses the rollback journal (not WAL) so it stays safe on network
+filesystems; workers wait on the busy timeout rather than fail.
+
+Usage:
+    python sweep_queue.py init --db sweep.db --snapshots ./snapshots --sl 0.1,0.2,0.3 --rr 1.5,2 --maxtrades 3,5
+    python sweep_queue.py init --db sweep.db --snapshots ./snapshots --cube ./cube_banknifty --sl 0.1,0.2
+    python sweep_queue.py work --db sweep.db --workers 4
+    python sweep_queue.py status --db sweep.db
+    python sweep_queue.py results --db sweep.db --sort sharpe --out sweep_results.csv
+"""
+
+import io
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import argparse
+import itertools
+import contextlib
+import multiprocessing as mp
+import pandas as pd
+
+PARAMS = ("sl", "rr", "riskpct", "maxtrades", "side", "signal")
+LOWER_IS_BETTER = {"losses", "holds", "elapsed"}      # ranked ascending (max_dd is a negative %, so higher is better)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    params TEXT UNIQUE NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',     -- pending / running / done / failed
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_until);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER PRIMARY KEY REFERENCES jobs(id),
+    metrics TEXT NOT NULL,
+    daily TEXT,
+    elapsed REAL
+);
+"""
+
+
+# ---------- Database ----------
+def connect(db):
+    conn = sqlite3.connect(db, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@contextlib.contextmanager
+def immediate(conn):
+    """Write transaction that takes the database write lock up front"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def param_key(params):
+    return json.dumps({k: params.get(k) for k in PARAMS}, sort_keys=True)
+
+
+def init_queue(db, folder, grid, bars=None, signal_mode="all", cube=None):
+    """
+    Add every combination of `grid` ({param: [values]}) as a pending job.
+    Existing combinations (done or not) are left untouched.
+    - cube: price cube directory the workers read instead of `folder`'s CSVs
+    Raises ValueError if `db` was initialised with other data settings (the
+    finished results would no longer describe one sweep).
+    Returns the number of new jobs.
+    """
+    names = [k for k in PARAMS if k in grid]
+    conn = connect(db)
+    settings = {"folder": os.path.abspath(folder), "bars": bars, "signal_mode": signal_mode,
+                "cube": os.path.abspath(cube) if cube else None}
+    try:
+        with immediate(conn):
+            current = _meta(conn)
+            changed = [f"{k}={current.get(k)!r} (not {v!r})" for k, v in settings.items()
+                       if current and current.get(k) != v]
+            if changed:
+                raise ValueError(f"{db} was initialised with " + ", ".join(changed) + "; use a new --db")
+            for key, value in settings.items():
+                conn.execute("INSERT INTO meta(key, value) VALUES(?, ?) "
+                             "ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, value))
+            before = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            conn.executemany("INSERT OR IGNORE INTO jobs(params) VALUES(?)",
+                             ((param_key(dict(zip(names, combo))),)
+                              for combo in itertools.product(*(grid[k] for k in names))))
+            after = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    finally:
+        conn.close()
+    return after - before
+
+
+def claim(conn, worker, lease=1800.0):
+    """Atomically take the next pending (or lease-expired) job; (id, params) or None"""
+    now = time.time()
+    with immediate(conn):
+        row = conn.execute(
+            "SELECT id, params FROM jobs WHERE status='pending' OR (status='running' AND lease_until < ?) "
+            "ORDER BY id LIMIT 1", (now,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE jobs SET status='running', worker=?, attempts=attempts+1, lease_until=?, started_at=? "
+                     "WHERE id=?", (worker, now + lease, now, row[0]))
+    return row[0], json.loads(row[1])
+
+
+def renew(conn, job_id, worker, lease=1800.0):
+    """Extend a running job's lease; False if the job is no longer ours"""
+    with immediate(conn):
+        cur = conn.execute("UPDATE jobs SET lease_until=? WHERE id=? AND worker=? AND status='running'",
+                           (time.time() + lease, job_id, worker))
+    return cur.rowcount > 0
+
+
+@contextlib.contextmanager
+def heartbeat(db, job_id, worker, lease=1800.0, every=None, max_runtime=None):
+    """
+    Renew the job's lease every `every` seconds (default lease / 3) from a
+    thread while the block runs, but not past `max_runtime` seconds from the
+    start: a hung job then keeps its last lease and is re-claimed after it.
+    """
+    stop = threading.Event()
+    every = every or lease / 3.0
+    deadline = time.monotonic() + max_runtime if max_runtime else None
+
+    def beat():
+        conn = connect(db)           # sqlite connections stay in their own thread
+        try:
+            while not stop.wait(every):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                try:
+                    if not renew(conn, job_id, worker, lease):
+                        break
+                except sqlite3.OperationalError:
+                    pass             # busy beyond the timeout: retry on the next beat
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def complete(conn, job_id, worker, metrics, daily=None, elapsed=None):
+    """Checkpoint one finished job (ignored if another worker re-claimed it meanwhile)"""
+    with immediate(conn):
+        cur = conn.execute("UPDATE jobs SET status='done', finished_at=?, lease_until=NULL, error=NULL "
+                           "WHERE id=? AND worker=? AND status='running'", (time.time(), job_id, worker))
+        if cur.rowcount:
+            conn.execute("INSERT OR REPLACE INTO results(job_id, metrics, daily, elapsed) VALUES(?, ?, ?, ?)",
+                         (job_id, json.dumps(metrics), daily, elapsed))
+
+
+def fail(conn, job_id, worker, error, max_attempts=3):
+    """Record an error; the job goes back to pending until it has failed max_attempts times"""
+    with immediate(conn):
+        conn.execute("UPDATE jobs SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                     "error=?, lease_until=NULL, finished_at=? WHERE id=? AND worker=?",
+                     (max_attempts, error, time.time(), job_id, worker))
+
+
+def _meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+# ---------- Workers ----------
+def work(db, worker=None, lease=1800.0, max_jobs=None, verbose=True, max_runtime=7200.0):
+    """
+    Claim and run jobs until the queue is empty (or max_jobs ran). Returns jobs completed.
+    - max_runtime: wall-clock budget per job; its lease is no longer renewed after it
+    """
+    from engine3 import backtest
+    from chain_frame import ChainHistory
+    from asof_join import read_bars
+
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    conn = connect(db)
+    meta = _meta(conn)
+    if meta.get("cube"):
+        from price_cube import open_cube
+        hist = open_cube(meta["cube"]).history()             # mapped cube, no CSV parsing
+    else:
+        hist = ChainHistory.from_folder(meta["folder"])      # loaded once per worker
+    bars = read_bars(meta["bars"]) if meta.get("bars") else None
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = claim(conn, worker, lease)
+        if job is None:
+            break
+        job_id, p = job
+        t0 = time.time()
+        try:
+            with heartbeat(db, job_id, worker, lease, max_runtime=max_runtime), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                res = backtest(meta["folder"], p["sl"], p["rr"], p["riskpct"], p["maxtrades"], p.get("side") or "AUTO",
+                               export_csv=False, bars=bars, signal=p.get("signal"),
+                               signal_mode=meta.get("signal_mode") or "all", show_plots=False, hist=hist)
+        except Exception as e:
+            fail(conn, job_id, worker, f"{type(e).__name__}: {e}")
+            if verbose:
+                print(f"[{worker}] job {job_id} failed: {e}")
+            continue
+        metrics = res["metrics"] if res else {"total_trades": 0}
+        daily = res["daily"][["date", "day_pnl", "close_balance"]].astype({"date": str}).to_json(orient="records") if res else None
+        complete(conn, job_id, worker, metrics, daily, time.time() - t0)
+        done += 1
+        if verbose:
+            print(f"[{worker}] job {job_id} {p} -> trades={metrics['total_trades']} "
+                  f"balance={metrics.get('final_balance', float('nan')):.2f} ({time.time() - t0:.1f}s)")
+    conn.close()
+    return done
+
+
+def _work_entry(db, lease, max_runtime, done):
+    done.put(work(db, lease=lease, max_runtime=max_runtime))
+
+
+def run_workers(db, workers=1, lease=1800.0, max_runtime=7200.0):
+    """Run `workers` local worker processes to completion; returns jobs completed by them"""
+    if workers <= 1:
+        return work(db, lease=lease, max_runtime=max_runtime)
+    done = mp.Queue()
+    procs = [mp.Process(target=_work_entry, args=(db, lease, max_runtime, done)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    total = 0
+    for p in procs:
+        if p.exitcode == 0:          # a crashed worker reported nothing
+            total += done.get()
+    return total
+
+
+# ---------- Progress / results ----------
+def status(db, window=600.0):
+    """Job counts by state, throughput over the last `window` seconds and ETA"""
+    conn = connect(db)
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    now = time.time()
+    recent = conn.execute("SELECT COUNT(*) FROM jobs WHERE status='done' AND finished_at >= ?",
+                          (now - window,)).fetchone()[0]
+    live = conn.execute("SELECT COUNT(DISTINCT worker) FROM jobs WHERE status='running' AND lease_until >= ?",
+                        (now,)).fetchone()[0]
+    conn.close()
+    total = sum(counts.values())
+    remaining = counts.get("pending", 0) + counts.get("running", 0)
+    rate = recent / window * 60.0
+    return {
+        "total": total,
+        "pending": counts.get("pending", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "workers": live,
+        "jobs_per_min": rate,
+        "eta_min": remaining / rate if rate > 0 else None,
+    }
+
+
+def results(db, sort="final_balance", ascending=None):
+    """
+    Finished jobs as a DataFrame: parameters + metrics, best `sort` first.
+    - ascending: sort order; default ascending for LOWER_IS_BETTER metrics
+      (losses, holds, elapsed), descending otherwise
+    """
+    conn = connect(db)
+    rows = conn.execute("SELECT j.id, j.params, r.metrics, r.elapsed FROM jobs j JOIN results r ON r.job_id = j.id").fetchall()
+    conn.close()
+    df = pd.DataFrame([{"job": i, **json.loads(p), **json.loads(m), "elapsed": e} for i, p, m, e in rows])
+    if not df.empty and sort in df.columns:
+        if ascending is None:
+            ascending = sort in LOWER_IS_BETTER
+        df = df.sort_values(sort, ascending=ascending).reset_index(drop=True)
+    return df
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="SQLite-backed resumable backtest sweeps")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    i = sub.add_parser("init", help="enumerate the grid into the queue")
+    i.add_argument("--db", default="sweep.db")
+    i.add_argument("--snapshots", default="./snapshots")
+    i.add_argument("--bars", default=None)
+    i.add_argument("--cube", default=None, help="price_cube.py cube the workers read instead of the CSVs")
+    i.add_argument("--sl", default="0.3")
+    i.add_argument("--rr", default="2.0")
+    i.add_argument("--riskpct", default="0.02")
+    i.add_argument("--maxtrades", default="3")
+    i.add_argument("--side", default="AUTO", help="comma list of AUTO/CE/PE")
+    i.add_argument("--signal", action="append", default=None, help="signal spec (repeatable)")
+    i.add_argument("--signal-mode", choices=["all", "vote", "first"], default="all")
+
+    w = sub.add_parser("work", help="claim and run jobs until the queue is empty")
+    w.add_argument("--db", default="sweep.db")
+    w.add_argument("--workers", type=int, default=1)
+    w.add_argument("--lease", type=float, default=1800.0,
+                   help="seconds without a heartbeat (renewed every lease/3) before a job is re-claimed")
+    w.add_argument("--max-runtime", type=float, default=7200.0,
+                   help="wall-clock budget per job; a job running longer stops renewing its lease")
+
+    s = sub.add_parser("status")
+    s.add_argument("--db", default="sweep.db")
+    s.add_argument("--watch", type=float, default=0, help="refresh every N seconds")
+
+    r = sub.add_parser("results")
+    r.add_argument("--db", default="sweep.db")
+    r.add_argument("--sort", default="final_balance")
+    order = r.add_mutually_exclusive_group()
+    order.add_argument("--ascending", dest="ascending", action="store_true", default=None)
+    order.add_argument("--descending", dest="ascending", action="store_false")
+    r.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "init":
+        grid = {
+            "sl": _floats(args.sl), "rr": _floats(args.rr), "riskpct": _floats(args.riskpct),
+            "maxtrades": [int(v) for v in _floats(args.maxtrades)],
+            "side": [v.strip().upper() for v in args.side.split(",")],
+            "signal": args.signal or [None],
+        }
+        try:
+            added = init_queue(args.db, args.snapshots, grid, bars=args.bars, signal_mode=args.signal_mode,
+                               cube=args.cube)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"{added} new jobs queued in {args.db}")
+    elif args.cmd == "work":
+        print(f"{run_workers(args.db, args.workers, args.lease, args.max_runtime)} job(s) completed")
+    elif args.cmd == "status":
+        while True:
+            st = status(args.db)
+            eta = f"{st['eta_min']:.1f} min" if st["eta_min"] is not None else "-"
+            print(f"{st['done']}/{st['total']} done, {st['running']} running on {st['workers']} workers, "
+                  f"{st['pending']} pending, {st['failed']} failed | {st['jobs_per_min']:.1f} jobs/min, ETA {eta}")
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    else:
+        df = results(args.db, args.sort, args.ascending)
+        print(df.head(20).to_string(index=False) if not df.empty else "No finished jobs yet.")
+        if args.out:
+            df.to_csv(args.out, index=False)
+            print("Saved:", args.out)
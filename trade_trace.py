@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+trade_trace.py
+
+Opt-in structured event trace for engine3.backtest, plus a replay tool.
+
+Events (one fixed-size binary record each):
+- DAY_START   first snapshot of a day                      price = opening balance
+- ENTRY       position opened                              price = buy, a = SL level, b = target
+- CHECK       one lookahead snapshot                       price = ATM LTP, a = SL, b = target
+- EXIT        WIN / LOSS / HOLD, or NONE when the window   price = exit, a = pnl, b = balance
+              held no valid snapshot (trade discarded)
+- DAY_LIMIT   daily loss / profit stop or max trades hit   price = balance, a = day PnL fraction
+
+File layout: magic, a length-prefixed JSON header (snapshot names, backtest
+parameters, first_row) and then packed records (TRACE_DTYPE, 39 bytes) appended in
+blocks by a buffered writer. Reading is a single np.frombuffer. When tracing
+is off the engine gets NULL_TRACE and skips the per-check calls entirely.
+
+Usage:
+    python engine3.py --mode backtest --snapshots ./snapshots --trace bt.trace
+    python trade_trace.py --trace bt.trace                  # per-day summary
+    python trade_trace.py --trace bt.trace --trade 4        # replay results row 4
+    python trade_trace.py --trace bt.trace --day 2025-09-02 # replay one day
+"""
+
+import json
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+
+MAGIC = b"TTRACE1\n"
+TRACE_DTYPE = np.dtype([("kind", "u1"), ("code", "u1"), ("contract", "i1"), ("snap", "i4"), ("trade", "i4"),
+                        ("day", "i4"), ("price", "f8"), ("a", "f8"), ("b", "f8")])
+
+DAY_START, ENTRY, CHECK, EXIT, DAY_LIMIT = 1, 2, 3, 4, 5
+KIND_NAMES = {DAY_START: "DAY_START", ENTRY: "ENTRY", CHECK: "CHECK", EXIT: "EXIT", DAY_LIMIT: "DAY_LIMIT"}
+OUTCOMES = {"NONE": 0, "WIN": 1, "LOSS": 2, "HOLD": 3}
+LIMITS = {"LOSS": 1, "PROFIT": 2, "MAXTRADES": 3}
+CONTRACTS = {"CE": 1, "PE": -1}
+
+
+# ---------- Writers ----------
+class NullTrace:
+    """Disabled trace: every call is a no-op"""
+    enabled = False
+
+    def emit(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class TraceWriter:
+    """
+    Buffered append-only writer.
+    - path: output file (truncated)
+    - header: JSON-serialisable dict stored once at the top
+    - buffer: records held in memory between writes
+    """
+    enabled = True
+
+    def __init__(self, path, header=None, buffer=65536):
+        self.fh = open(path, "wb")
+        meta = json.dumps(header or {}).encode()
+        self.fh.write(MAGIC + struct.pack("<I", len(meta)) + meta)
+        self.buf = np.zeros(buffer, dtype=TRACE_DTYPE)
+        self.n = 0
+
+    def emit(self, kind, snap, trade=-1, day=0, contract=0, code=0, price=np.nan, a=np.nan, b=np.nan):
+        if self.n == len(self.buf):
+            self.flush()
+        self.buf[self.n] = (kind, code, contract, snap, trade, day, price, a, b)
+        self.n += 1
+
+    def flush(self):
+        if self.n:
+            self.fh.write(self.buf[:self.n].tobytes())
+            self.n = 0
+
+    def close(self):
+        self.flush()
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_trace(path, header=None):
+    """TraceWriter for `path`, or NULL_TRACE when path is falsy"""
+    return TraceWriter(path, header) if path else NULL_TRACE
+
+
+# ---------- Reading / replay ----------
+def read_trace(path):
+    """(header dict, records structured array)"""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a trade trace")
+    (hlen,) = struct.unpack_from("<I", data, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(data[start:start + hlen])
+    body = data[start + hlen:]
+    usable = len(body) - len(body) % TRACE_DTYPE.itemsize      # tolerate a torn final record
+    return header, np.frombuffer(body[:usable], dtype=TRACE_DTYPE)
+
+
+def trace_frame(header, records):
+    """Records as a readable DataFrame (kind/outcome names, snapshot file names)"""
+    df = pd.DataFrame(records)
+    names = header.get("names", [])
+    df["event"] = df["kind"].map(KIND_NAMES)
+    df["file"] = [names[s] if 0 <= s < len(names) else "" for s in df["snap"]]
+    df["contract"] = df["contract"].map({1: "CE", -1: "PE", 0: ""})
+    out_names = {v: k for k, v in OUTCOMES.items()}
+    lim_names = {v: k for k, v in LIMITS.items()}
+    df["detail"] = np.where(df["kind"] == EXIT, df["code"].map(out_names),
+                            np.where(df["kind"] == DAY_LIMIT, df["code"].map(lim_names), ""))
+    return df[["event", "day", "snap", "file", "trade", "contract", "detail", "price", "a", "b"]]
+
+
+def trade_id_for_row(records, row, first_row=0):
+    """
+    Trace trade id of results row `row`
+    - first_row: results rows committed by earlier checkpointed runs (header
+      "first_row"); the trace holds trades from that row on
+    """
+    done = records[(records["kind"] == EXIT) & (records["code"] != OUTCOMES["NONE"])]
+    if not first_row <= row < first_row + len(done):
+        raise IndexError(f"results row {row} not in trace (rows {first_row}..{first_row + len(done) - 1})")
+    return int(done["trade"][row - first_row])
+
+
+def replay(header, records, trade_row=None, day=None):
+    """Events of one results row or one day (YYYY-MM-DD) as a DataFrame"""
+    df = trace_frame(header, records)
+    if trade_row is not None:
+        return df[df["trade"] == trade_id_for_row(records, trade_row, header.get("first_row", 0))]
+    if day is not None:
+        return df[df["day"] == int(str(day).replace("-", ""))]
+    return df
+
+
+def day_summary(header, records):
+    df = trace_frame(header, records)
+    df["entries"] = df["event"] == "ENTRY"
+    df["checks"] = df["event"] == "CHECK"
+    df["trades"] = (df["event"] == "EXIT") & (df["detail"] != "NONE")
+    df["limit"] = np.where(df["event"] == "DAY_LIMIT", df["detail"], "")
+    return df.groupby("day").agg(
+        entries=("entries", "sum"),
+        checks=("checks", "sum"),
+        trades=("trades", "sum"),
+        limit=("limit", lambda s: ",".join(v for v in s if v)),
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay a backtest event trace")
+    ap.add_argument("--trace", required=True)
+    ap.add_argument("--trade", type=int, default=None, help="results row (0-based, as in backtest_results.csv)")
+    ap.add_argument("--day", default=None, help="YYYY-MM-DD")
+    args = ap.parse_args()
+
+    header, records = read_trace(args.trace)
+    print(f"{len(records)} events; params: {header.get('params')}")
+    pd.set_option("display.width", 200)
+    if args.trade is None and args.day is None:
+        print(day_summary(header, records).to_string(index=False))
+    else:
+        print(replay(header, records, args.trade, args.day).to_string(index=False))
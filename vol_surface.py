@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+vol_surface.py
+
+Per-snapshot volatility smile fitting (raw SVI) with a compact parameter cache.
+
+Features:
+- For every snapshot and expiry, fits the raw SVI total-variance smile
+      w(k) = a + b * (rho * (k - m) + sqrt((k - m)^2 + sigma^2)),  k = ln(K / F)
+  to out-of-the-money IVs (puts below the forward, calls above). IVs come from
+  the CE_IV / PE_IV columns when the snapshot carries them (add_greeks, or
+  NSE's impliedVolatility fields) and are otherwise solved from LTPs.
+- The forward of each expiry comes from put-call parity, so no Spot column is needed.
+- Fits warm-start from the previous snapshot's parameters for the same expiry
+  (a few solver iterations instead of a cold search).
+- Parameters are cached as one row per (snapshot, expiry) - time, expiry code,
+  T, forward, five SVI parameters, fit RMSE - in a compressed .npz; refits
+  only touch snapshots newer than the cache.
+- `VolSurface.iv(strike, expiry, time)`: vectorised as-of lookup (latest fit at
+  or before `time`) for strategy evaluation and backtests.
+
+Usage:
+    python vol_surface.py fit --snapshots ./snapshots --cache vol_surface.npz --rate 6
+    python vol_surface.py show --cache vol_surface.npz --strikes 44000 45000 46000
+"""
+
+import os
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from chain_frame import ChainHistory, expiry_codes, expiry_date, prices64
+from chain_greeks import EXPIRY_TIME, implied_vol
+
+SVI_FIELDS = ("a", "b", "rho", "m", "sigma")
+SURFACE_DTYPE = np.dtype([("time", "datetime64[s]"), ("expiry", "i4"), ("t", "f8"), ("forward", "f8"),
+                          ("a", "f8"), ("b", "f8"), ("rho", "f8"), ("m", "f8"), ("sigma", "f8"),
+                          ("rmse", "f4"), ("points", "i2")])
+MIN_POINTS = 5          # five parameters
+MIN_PRICE = 0.5         # ignore quotes below this (stale ticks on far wings)
+MAX_ABS_K = 0.3         # ignore strikes more than ~30% from the forward
+
+
+# ---------- SVI ----------
+def svi_total_variance(k, a, b, rho, m, sigma):
+    """Raw SVI total implied variance at log-moneyness k"""
+    d = np.asarray(k, dtype=float) - m
+    return a + b * (rho * d + np.sqrt(d * d + sigma * sigma))
+
+
+def _bounds(w):
+    top = max(float(np.max(w)), 1e-4)
+    lo = np.array([-top, 0.0, -0.999, -1.0, 1e-4])
+    hi = np.array([top, 10.0, 0.999, 1.0, 2.0])
+    return lo, hi
+
+
+def fit_svi(k, w, x0=None):
+    """
+    Least-squares raw SVI fit of total variance `w` at log-moneyness `k`.
+    - x0: starting parameters (a, b, rho, m, sigma), e.g. the previous
+      snapshot's fit; default is a generic cold start
+    Returns (params array, rmse in total variance, solver evaluations)
+    """
+    k = np.asarray(k, dtype=float)
+    w = np.asarray(w, dtype=float)
+    lo, hi = _bounds(w)
+    if x0 is None:
+        x0 = np.array([0.5 * np.min(w), 0.1, -0.3, float(k[np.argmin(w)]), 0.1])
+    # least_squares needs a strictly feasible start
+    x0 = np.clip(np.asarray(x0, dtype=float), lo + 1e-9, hi - 1e-9)
+    res = least_squares(lambda p: svi_total_variance(k, *p) - w, x0, bounds=(lo, hi), method="trf",
+                        x_scale="jac")
+    rmse = float(np.sqrt(np.mean(res.fun ** 2)))
+    return res.x, rmse, res.nfev
+
+
+# ---------- Market smile of one expiry ----------
+def forward_price(strike, ce, pe, t, rate_pct):
+    """Put-call parity forward F = K + e^{rT} (C - P) at the strike where C and P are closest"""
+    quoted = (ce > 0) & (pe > 0)
+    if not quoted.any():
+        return np.nan
+    gap = np.where(quoted, ce - pe, np.inf)
+    j = int(np.argmin(np.abs(gap)))
+    return float(strike[j] + np.exp(rate_pct / 100.0 * t) * (ce[j] - pe[j]))
+
+
+def otm_smile(strike, ce, pe, t, rate_pct, ce_iv=None, pe_iv=None, forward=None,
+              min_price=MIN_PRICE, max_abs_k=MAX_ABS_K):
+    """
+    Out-of-the-money smile of one expiry.
+    - strike, ce, pe: per-row arrays (LTPs); ce_iv / pe_iv: IV percent if already known
+    - t: years to expiry; forward: override the parity forward
+    Returns (forward, k, total variance) with only usable points kept.
+    """
+    strike = np.asarray(strike, dtype=float)
+    F = forward_price(strike, ce, pe, t, rate_pct) if forward is None else float(forward)
+    if not np.isfinite(F) or F <= 0 or t <= 0:
+        return F, np.zeros(0), np.zeros(0)
+    use_call = strike >= F
+    price = np.where(use_call, ce, pe)
+    if ce_iv is not None and pe_iv is not None:
+        iv = np.where(use_call, ce_iv, pe_iv).astype(float)
+    else:
+        spot = F * np.exp(-rate_pct / 100.0 * t)     # spot consistent with the parity forward
+        iv = implied_vol(price, spot, strike, rate_pct, t * 365.0, use_call)
+    k = np.log(strike / F)
+    ok = np.isfinite(iv) & (iv > 0) & (price >= min_price) & (np.abs(k) <= max_abs_k)
+    return F, k[ok], (iv[ok] / 100.0) ** 2 * t
+
+
+# ---------- Fitting a history ----------
+def _years(expiry_code, asof):
+    settle = datetime.datetime.combine(expiry_date(expiry_code), EXPIRY_TIME)
+    return (settle - asof).total_seconds() / (365.0 * 86400.0)
+
+
+def fit_snapshot(frame, asof, rate_pct=6.0, prev=None):
+    """
+    SVI fit of every expiry in one snapshot.
+    - frame: dict of per-row arrays (Expiry day codes, Strike, CE_LTP, PE_LTP,
+      optionally CE_IV / PE_IV)
+    - asof: snapshot datetime
+    - prev: {expiry code: params} of the previous snapshot (warm start)
+    Returns list of SURFACE_DTYPE tuples and the updated {expiry: params}.
+    """
+    rows, params = [], dict(prev or {})
+    has_iv = "CE_IV" in frame and "PE_IV" in frame
+    for code in np.unique(frame["Expiry"]):
+        sel = frame["Expiry"] == code
+        t = _years(code, asof)
+        if t <= 0:
+            continue
+        F, k, w = otm_smile(frame["Strike"][sel], frame["CE_LTP"][sel], frame["PE_LTP"][sel], t, rate_pct,
+                            frame["CE_IV"][sel] if has_iv else None, frame["PE_IV"][sel] if has_iv else None)
+        if len(k) < MIN_POINTS:
+            continue
+        x, rmse, _ = fit_svi(k, w, params.get(int(code)))
+        params[int(code)] = x
+        rows.append((np.datetime64(asof, "s"), int(code), t, F, *x, rmse, len(k)))
+    return rows, params
+
+
+def fit_history(hist, rate_pct=6.0, cached=None, verbose=False):
+    """
+    Fit every snapshot of a ChainHistory newer than the cached parameters.
+    - cached: existing SURFACE_DTYPE array (kept; its last fit per expiry seeds the warm start)
+    Returns the combined parameter array sorted by (time, expiry).
+    """
+    cached = np.zeros(0, dtype=SURFACE_DTYPE) if cached is None else cached
+    last = cached["time"].max() if len(cached) else None
+    prev = {}
+    for r in cached[np.argsort(cached["time"], kind="stable")]:
+        prev[int(r["expiry"])] = np.array([r[f] for f in SVI_FIELDS])
+
+    has_iv = "CE_IV" in hist.columns and "PE_IV" in hist.columns
+    rows, fitted = [], 0
+    for i in range(len(hist)):
+        if last is not None and hist.times[i] <= last:
+            continue
+        a, b = hist.offsets[i], hist.offsets[i + 1]
+        if a == b:
+            continue
+        frame = {"Expiry": hist.expiry[a:b], "Strike": hist.strike[a:b],
+                 "CE_LTP": prices64(hist.columns["CE_LTP"][a:b]), "PE_LTP": prices64(hist.columns["PE_LTP"][a:b])}
+        if has_iv:
+            frame["CE_IV"] = hist.columns["CE_IV"][a:b].astype(np.float64)
+            frame["PE_IV"] = hist.columns["PE_IV"][a:b].astype(np.float64)
+        new, prev = fit_snapshot(frame, hist.times[i].astype(datetime.datetime), rate_pct, prev)
+        rows.extend(new)
+        fitted += 1
+        if verbose and fitted % 100 == 0:
+            print(f"  fitted {fitted} snapshots")
+    out = np.concatenate([cached, np.array(rows, dtype=SURFACE_DTYPE)])
+    return out[np.lexsort((out["expiry"], out["time"]))]
+
+
+def save_params(path, params, rate_pct):
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, params=params, rate=np.float64(rate_pct))
+    os.replace(tmp, path)
+
+
+def load_params(path):
+    """(params SURFACE_DTYPE array, rate_pct) from a cache file"""
+    with np.load(path) as z:
+        return z["params"].astype(SURFACE_DTYPE), float(z["rate"])
+
+
+def build_surface(folder, cache=None, rate_pct=6.0, symbol=None, verbose=True):
+    """
+    Fit (or extend) the surface of a snapshot folder.
+    - cache: .npz path; existing fits are reused and only newer snapshots are
+      fitted, then the file is rewritten
+    Returns a VolSurface.
+    """
+    cached = None
+    if cache and os.path.exists(cache):
+        cached, cached_rate = load_params(cache)
+        if cached_rate != rate_pct:
+            print(f"Cache {cache} was fitted at rate {cached_rate}%, refitting at {rate_pct}%")
+            cached = None
+    since = None
+    if cached is not None and len(cached):
+        # only load snapshots after the cached fits
+        since = pd.Timestamp(cached["time"].max()).strftime("X_%Y%m%d_%H%M%S.csv")
+    hist = ChainHistory.from_folder(folder, symbol, since=since)
+    params = fit_history(hist, rate_pct, cached, verbose=verbose)
+    if cache:
+        save_params(cache, params, rate_pct)
+    if verbose:
+        print(f"{len(params)} smile fits over {len(np.unique(params['time']))} snapshots")
+    return VolSurface(params, rate_pct)
+
+
+# ---------- Lookup ----------
+class VolSurface:
+    """
+    Fitted SVI parameters over time.
+    - params: SURFACE_DTYPE array (one row per snapshot and expiry)
+    The smile used for a query is the latest fit at or before the query time
+    for that expiry, applied sticky-strike (k against that fit's forward).
+    """
+
+    def __init__(self, params, rate_pct=6.0):
+        order = np.lexsort((params["time"], params["expiry"]))
+        self.params = params[order]
+        self.rate_pct = rate_pct
+        self.expiries, self._start = np.unique(self.params["expiry"], return_index=True)
+        self._end = np.append(self._start[1:], len(self.params))
+
+    @classmethod
+    def load(cls, path):
+        params, rate_pct = load_params(path)
+        return cls(params, rate_pct)
+
+    def __len__(self):
+        return len(self.params)
+
+    def expiry_dates(self):
+        return [expiry_date(c) for c in self.expiries]
+
+    def front_expiry(self, time=None):
+        """Nearest expiry (day code) still open at `time` (default: after the latest fit)"""
+        t = np.datetime64(time if time is not None else self.params["time"].max(), "s")
+        day = int(t.astype("datetime64[D]").astype(np.int64))
+        live = [c for c in self.expiries if c >= day]
+        return int(live[0]) if live else None
+
+    def lookup(self, expiry, time=None):
+        """Row index into self.params for each (expiry, time) pair; -1 where no fit exists"""
+        exp = np.atleast_1d(np.asarray(expiry))
+        if exp.dtype.kind not in "iu":
+            exp = expiry_codes(exp)
+        if time is None:
+            tq = np.full(exp.shape, np.datetime64("9999-12-31T00:00:00", "s"))
+        else:
+            tq = np.broadcast_to(np.asarray(time, dtype="datetime64[s]"), exp.shape)
+        rows = np.full(exp.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self.expiries, exp)
+        known = (pos < len(self.expiries)) & (self.expiries[np.minimum(pos, len(self.expiries) - 1)] == exp)
+        for p in np.unique(pos[known]):
+            q = known & (pos == p)
+            a, b = self._start[p], self._end[p]
+            j = np.searchsorted(self.params["time"][a:b], tq[q], side="right") - 1
+            rows[q] = np.where(j >= 0, a + j, -1)
+        return rows
+
+    def iv(self, strike, expiry, time=None):
+        """
+        Implied volatility in percent (NaN where the expiry was never fitted).
+        strike / expiry (day codes or NSE strings) / time (datetime64 or
+        datetime, default latest) broadcast together.
+        """
+        strike, expiry = np.broadcast_arrays(np.asarray(strike, dtype=float), np.asarray(expiry))
+        shape = strike.shape
+        if time is not None:
+            time = np.broadcast_to(np.asarray(time, dtype="datetime64[s]"), shape).ravel()
+        rows = self.lookup(expiry.ravel(), time)
+        p = self.params[np.maximum(rows, 0)]
+        k = np.log(strike.ravel() / p["forward"])
+        w = svi_total_variance(k, p["a"], p["b"], p["rho"], p["m"], p["sigma"])
+        with np.errstate(invalid="ignore"):
+            vol = 100.0 * np.sqrt(np.maximum(w, 1e-12) / p["t"])
+        return np.where(rows >= 0, vol, np.nan).reshape(shape)
+
+    def frame(self):
+        df = pd.DataFrame(self.params)
+        df["expiry"] = [expiry_date(c) for c in df["expiry"]]
+        return df
+
+
+def apply_surface(legs, surface, expiry=None, time=None):
+    """Set each strategy leg's "iv" (percent) from `surface` for one expiry (default front); returns legs"""
+    if expiry is None:
+        expiry = surface.front_expiry(time)
+    vols = surface.iv([leg["strike"] for leg in legs], expiry, time)
+    for leg, v in zip(legs, vols):
+        if np.isfinite(v):
+            leg["iv"] = float(v)
+    return legs
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fit / inspect per-snapshot SVI volatility smiles")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    f = sub.add_parser("fit", help="fit new snapshots and update the cache")
+    f.add_argument("--snapshots", default="./snapshots")
+    f.add_argument("--cache", default="vol_surface.npz")
+    f.add_argument("--symbol", default=None)
+    f.add_argument("--rate", type=float, default=6.0, help="risk-free rate %%")
+    s = sub.add_parser("show", help="print the latest smiles")
+    s.add_argument("--cache", default="vol_surface.npz")
+    s.add_argument("--strikes", type=float, nargs="*", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "fit":
+        build_surface(args.snapshots, args.cache, args.rate, args.symbol)
+    else:
+        surf = VolSurface.load(args.cache)
+        latest = surf.params[surf._end - 1]
+        pd.set_option("display.width", 200)
+        print(pd.DataFrame(latest).assign(expiry=[expiry_date(c) for c in latest["expiry"]]).to_string(index=False))
+        if args.strikes:
+            for code in surf.expiries:
+                vols = surf.iv(args.strikes, code)
+                print(expiry_date(code), " ".join(f"{k:g}:{v:.2f}%" for k, v in zip(args.strikes, vols)))